@@ -0,0 +1,54 @@
+import asyncio
+import sys
+import os
+
+# Add relevant paths to sys.path
+sys.path.append("/app")
+sys.path.append(os.getcwd())
+
+try:
+    from sqlalchemy import exists
+    from sqlalchemy.future import select
+    from shared.analytics import record_detections
+    from shared.database import AsyncSessionLocal, init_db
+    from shared.models import DetectedObject, DetectionResult
+except ImportError as e:
+    print(f"Error: Could not import database/models. Detail: {e}")
+    sys.exit(1)
+
+BATCH_SIZE = 1000
+
+async def run_backfill():
+    """
+    Fills detected_objects and class_rollups for detection results written
+    before they existed. Safe to re-run: results that already have objects are skipped.
+    """
+    await init_db()
+    print("Backfilling detection analytics...")
+    last_id = 0
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(DetectionResult)
+                .where(DetectionResult.id > last_id)
+                .where(~exists().where(DetectedObject.detection_id == DetectionResult.id))
+                .order_by(DetectionResult.id)
+                .limit(BATCH_SIZE)
+            )
+            detections = list(result.scalars().all())
+            if not detections:
+                break
+            rows = [
+                {"video_id": d.video_id, "frame_index": d.frame_index, "detections": d.detections, "timestamp": d.timestamp}
+                for d in detections
+            ]
+            await record_detections(session, rows, [d.id for d in detections])
+            await session.commit()
+        last_id = detections[-1].id
+        total += len(detections)
+        print(f"  {total} detection results processed")
+    print("Backfill complete.")
+
+if __name__ == "__main__":
+    asyncio.run(run_backfill())
@@ -0,0 +1,484 @@
+"""
+Offline throughput benchmark for frame extraction and the processing -> detection pipeline.
+
+Runs without Kafka, Postgres or a GPU: topics are in memory, results go to SQLite and the
+YOLO model is replaced by a stub with a fixed per-image latency. Everything else is the
+services' own code (frame extraction, storage, serialization, the detection loop, the
+result writer and analytics). The processing service's requirements plus aiosqlite are
+enough; torch and ultralytics are not needed.
+
+Scenarios, for sample-5s.mp4 and a synthetic video:
+- extract/<video>/<mode>: iter_frames (what extract_frames collects) for each sampling mode
+- pipeline/<video>/<mode>: process_video publishing FrameTasks while consume_frames detects
+  them and writes the results, until every frame is committed
+
+Reports frames/sec, per-stage latency percentiles and peak RSS, and writes them as JSON:
+
+    python scripts/benchmark.py --output benchmark.json
+    # Fail (exit 1) if any scenario got more than 20% slower than a previous run
+    python scripts/benchmark.py --output benchmark.json --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "services", "processing"), os.path.join(ROOT, "services", "detection")):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import cv2
+import numpy as np
+
+# --- Statistics ---
+
+class StageTimes:
+    """Latency samples (seconds) per stage."""
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def extend(self, timings: Dict[str, List[float]]) -> None:
+        for stage, values in timings.items():
+            self.samples.setdefault(stage, []).extend(values)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Percentiles in milliseconds."""
+        out: Dict[str, Dict[str, float]] = {}
+        for stage, values in sorted(self.samples.items()):
+            ms: Any = np.asarray(values) * 1000
+            out[stage] = {
+                "count": len(values),
+                "p50": round(float(np.percentile(ms, 50)), 3),
+                "p95": round(float(np.percentile(ms, 95)), 3),
+                "p99": round(float(np.percentile(ms, 99)), 3),
+                "max": round(float(ms.max()), 3),
+            }
+        return out
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# --- In-memory stand-ins ---
+
+class MemoryMessage(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+    value: bytes
+    key: Optional[str]
+    published_at: float # perf_counter()
+
+class MemoryBroker:
+    """Partitioned, append-only topics in memory. Keyed messages stick to one partition, like Kafka."""
+    def __init__(self, partitions: int = 6) -> None:
+        self.partitions: int = partitions
+        self.topics: Dict[str, List[List[MemoryMessage]]] = {}
+        self.arrived: asyncio.Event = asyncio.Event()
+        self._next: int = 0
+
+    def log(self, topic: str) -> List[List[MemoryMessage]]:
+        return self.topics.setdefault(topic, [[] for _ in range(self.partitions)])
+
+    def append(self, topic: str, key: Optional[str], value: bytes) -> MemoryMessage:
+        if key is not None:
+            partition: int = zlib.crc32(key.encode("utf-8")) % self.partitions
+        else:
+            partition = self._next % self.partitions
+            self._next += 1
+        log: List[MemoryMessage] = self.log(topic)[partition]
+        message = MemoryMessage(topic, partition, len(log), value, key, time.perf_counter())
+        log.append(message)
+        self.arrived.set()
+        return message
+
+def memory_clients(mq: Any) -> Tuple[type, type]:
+    """Builds the stand-in classes on top of shared.mq, so they keep its interface and encoding."""
+
+    class MemoryProducer(mq.KafkaProducer):
+        """KafkaProducer with the broker round trip replaced by an in-memory append."""
+        def __init__(self, broker: MemoryBroker, topic: str, key_field: Optional[str] = "video_id") -> None:
+            super().__init__(topic, key_field=key_field)
+            self.broker: MemoryBroker = broker
+
+        async def start(self) -> None:
+            pass
+
+        async def stop(self) -> None:
+            pass
+
+        async def publish(self, message: Any, topic: Optional[str] = None) -> None:
+            await self.publish_nowait(message, topic)
+
+        async def publish_nowait(self, message: Any, topic: Optional[str] = None) -> asyncio.Future:
+            data, key = self._prepare(message)
+            self.broker.append(topic or self.topic, key, mq.encode_message(data, self.serializer))
+            future: asyncio.Future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            # Let consumers run, as awaiting a real send would
+            await asyncio.sleep(0)
+            return future
+
+        async def flush(self, futures: Optional[Iterable[asyncio.Future]] = None) -> None:
+            pass
+
+    class MemoryConsumer(mq.KafkaConsumer):
+        """KafkaConsumer reading every partition of an in-memory topic. Records publish-to-acknowledgement latency."""
+        def __init__(self, broker: MemoryBroker, topic: str) -> None:
+            super().__init__(topic)
+            self.broker: MemoryBroker = broker
+            self.positions: List[int] = [0] * broker.partitions
+            self.committed_offsets: List[int] = [0] * broker.partitions
+            self.commit_latency: List[float] = []
+
+        @property
+        def committed(self) -> int:
+            return sum(self.committed_offsets)
+
+        async def start(self) -> None:
+            pass
+
+        async def stop(self) -> None:
+            pass
+
+        def _take(self, max_records: int) -> List[Tuple[Any, Dict[str, Any]]]:
+            batch: List[Tuple[Any, Dict[str, Any]]] = []
+            for partition, log in enumerate(self.broker.log(self.topic)):
+                tp = mq.TopicPartition(self.topic, partition)
+                while self.positions[partition] < len(log) and len(batch) < max_records and tp not in self._paused:
+                    message: MemoryMessage = log[self.positions[partition]]
+                    self.positions[partition] += 1
+                    self._track(message)
+                    batch.append((message, mq.decode_message(message.value)))
+            return batch
+
+        async def get_next_job(self) -> Optional[Tuple[Any, Dict[str, Any]]]:
+            batch = await self.get_batch(1, 100)
+            return batch[0] if batch else None
+
+        async def get_batch(self, max_records: int, timeout_ms: int,
+                            topics: Optional[Iterable[str]] = None) -> List[Tuple[Any, Dict[str, Any]]]:
+            if topics is not None and self.topic not in topics:
+                return []
+            loop = asyncio.get_running_loop()
+            deadline: float = loop.time() + timeout_ms / 1000
+            batch: List[Tuple[Any, Dict[str, Any]]] = []
+            while True:
+                self.broker.arrived.clear()
+                batch.extend(self._take(max_records - len(batch)))
+                remaining: float = deadline - loop.time()
+                if len(batch) >= max_records or remaining <= 0:
+                    return batch
+                try:
+                    await asyncio.wait_for(self.broker.arrived.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+        async def acknowledge_many(self, messages: Iterable[Any]) -> None:
+            messages = list(messages)
+            now: float = time.perf_counter()
+            for tp, offset in self._complete(messages).items():
+                self.committed_offsets[tp.partition] = offset
+            for message in messages:
+                self.commit_latency.append(now - message.published_at)
+
+    return MemoryProducer, MemoryConsumer
+
+def stub_backend(backends: Any, latency_ms: float) -> Any:
+    """Stands in for YOLO: one fixed box per image (its centre quarter), after `latency_ms` per image."""
+
+    class StubBackend(backends.InferenceBackend):
+        def __init__(self) -> None:
+            super().__init__()
+            self.names = {0: "object"}
+            self.latency: float = latency_ms / 1000
+
+        def predict(self, images: List[Any]) -> List[Any]:
+            if self.latency > 0:
+                time.sleep(self.latency * len(images))
+            results: List[Any] = []
+            for img in images:
+                height, width = img.shape[:2]
+                box: Any = np.array([[width / 4, height / 4, width * 3 / 4, height * 3 / 4]], dtype=np.float32)
+                results.append(backends.BackendResult(box, np.array([0.9], dtype=np.float32), np.array([0])))
+            return results
+
+    return StubBackend()
+
+class StubEngine:
+    """
+    InferenceEngine stand-in: one ObjectDetector with the stub backend, on a single thread (like each
+    of the engine's single-process workers). Frames are still read, verified and decoded for real.
+    """
+    def __init__(self, detector: Any, stages: StageTimes) -> None:
+        self.detector: Any = detector
+        self.stages: StageTimes = stages
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+
+    def _process_batch(self, frames: List[Any]) -> Tuple[List[Any], Dict[str, List[float]]]:
+        return self.detector.process_batch(frames), self.detector.timings
+
+    async def process_batch(self, frames: List[Any]) -> List[Any]:
+        results, timings = await asyncio.get_running_loop().run_in_executor(self.executor, self._process_batch, frames)
+        self.stages.extend(timings)
+        return results
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+# --- Videos ---
+
+def synthetic_video(path: str, width: int, height: int, seconds: float, fps: float = 30.0) -> str:
+    """
+    Writes a video of moving shapes over a textured background, with a scene cut every
+    5 seconds, so sampling modes and detection see motion as well as static stretches.
+    """
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write synthetic video to {path}")
+    try:
+        background: Any = None
+        for i in range(int(seconds * fps)):
+            if i % int(5 * fps) == 0:
+                noise: Any = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+                background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+            frame: Any = background.copy()
+            for k in range(4):
+                x: int = int((i * (3 + k) + k * width / 4) % width)
+                y: int = int(height / 2 + height / 3 * np.sin(i / fps + k))
+                cv2.rectangle(frame, (x, y), (x + width // 10, y + height // 8), (60 * k, 255 - 60 * k, 128), -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+# --- Scenarios ---
+
+class Services(NamedTuple):
+    """The project modules, imported once the environment points at the scratch directory."""
+    mq: Any
+    storage: Any
+    database: Any
+    processing: Any
+    worker: Any
+    detection: Any
+    detector: Any
+    backends: Any
+    writer: Any
+
+def load_services() -> Services:
+    from shared import database, mq, storage
+    import processing
+    import worker
+    import main as detection
+    import detector
+    import backends
+    import writer
+    return Services(mq, storage, database, processing, worker, detection, detector, backends, writer)
+
+def result(name: str, kind: str, video: str, mode: str, frames: int, seconds: float, stages: StageTimes) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "kind": kind,
+        "video": os.path.basename(video),
+        "mode": mode,
+        "frames": frames,
+        "seconds": round(seconds, 4),
+        "fps": round(frames / seconds, 2) if seconds > 0 else 0.0,
+        "latency_ms": stages.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def bench_extraction(services: Services, video: str, label: str, mode: str, args: argparse.Namespace,
+                     storage: Any, run: int) -> Dict[str, Any]:
+    """Extraction alone: decode, encode, hash and store, as extract_frames does."""
+    stages = StageTimes()
+    sampling = services.worker.job_sampling(None)._replace(mode=mode, sample_rate_sec=args.sample_rate)
+    frames: int = 0
+    started: float = time.perf_counter()
+    last: float = started
+    for _ in services.processing.iter_frames(
+        video, f"bench-extract-{label}-{mode}-{run}", storage, sample_rate_sec=args.sample_rate, mode=mode,
+        hash_algorithm=services.worker.FRAME_HASH_ALGORITHM, adaptive=sampling.adaptive,
+        encoding=services.worker.FRAME_ENCODING
+    ):
+        now: float = time.perf_counter()
+        stages.add("extract", now - last)
+        last = now
+        frames += 1
+    elapsed: float = time.perf_counter() - started
+    storage.finish_frames(f"bench-extract-{label}-{mode}-{run}")
+    return result(f"extract/{label}/{mode}", "extraction", video, mode, frames, elapsed, stages)
+
+def time_flushes(writer: Any, stages: StageTimes) -> Any:
+    """Wraps ResultWriter.flush to time the database writes."""
+    flush = writer.flush
+
+    async def timed_flush() -> None:
+        pending: int = len(writer)
+        started: float = time.perf_counter()
+        await flush()
+        if pending:
+            stages.add("db_write", time.perf_counter() - started)
+
+    writer.flush = timed_flush
+    return writer
+
+async def bench_pipeline(services: Services, video: str, label: str, mode: str, args: argparse.Namespace,
+                         storage: Any, run: int) -> Dict[str, Any]:
+    """Extraction publishing into the detection loop, until every frame task is committed."""
+    MemoryProducer, MemoryConsumer = memory_clients(services.mq)
+    broker = MemoryBroker()
+    producer = MemoryProducer(broker, "frame-tasks")
+    consumer = MemoryConsumer(broker, "frame-tasks")
+    stages = StageTimes()
+
+    detector = services.detector.ObjectDetector(storage=storage, backend=stub_backend(services.backends, args.model_latency_ms))
+    writer = time_flushes(
+        services.writer.ResultWriter(consumer, max_rows=services.detection.FLUSH_ROWS,
+                                     max_interval_ms=services.detection.FLUSH_INTERVAL_MS),
+        stages
+    )
+    stop = asyncio.Event()
+    sampling = services.worker.job_sampling(None)._replace(mode=mode, sample_rate_sec=args.sample_rate)
+    video_id: str = f"bench-pipeline-{label}-{mode}-{run}"
+    video_hash: str = await asyncio.to_thread(storage.compute_file_hash, video)
+
+    engine = StubEngine(detector, stages)
+    started: float = time.perf_counter()
+    detection = asyncio.create_task(services.detection.consume_frames(consumer, writer, engine, stop))
+    published: int = await services.worker.process_video(video_id, video, video_hash, storage, producer, sampling)
+    stages.add("extract_total", time.perf_counter() - started)
+
+    deadline: float = time.perf_counter() + args.timeout
+    while consumer.committed < published and not detection.done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"{video_id}: {consumer.committed} of {published} frames committed after {args.timeout}s")
+        await asyncio.sleep(0.01)
+    elapsed: float = time.perf_counter() - started
+    stop.set()
+    failed: bool = await detection
+    engine.shutdown()
+    if failed:
+        raise RuntimeError(f"{video_id}: the detection loop failed")
+
+    for seconds in consumer.commit_latency:
+        stages.add("publish_to_commit", seconds)
+    return result(f"pipeline/{label}/{mode}", "pipeline", video, mode, published, elapsed, stages)
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Scenarios whose fps fell more than `tolerance` (a fraction) below the baseline's."""
+    with open(baseline_path) as f:
+        baseline: Dict[str, float] = {r["name"]: r["fps"] for r in json.load(f)["results"]}
+    regressions: List[str] = []
+    for r in results:
+        before: Optional[float] = baseline.get(r["name"])
+        if before and r["fps"] < before * (1 - tolerance):
+            regressions.append(f"{r['name']}: {r['fps']} fps, baseline {before} fps")
+    return regressions
+
+async def run(args: argparse.Namespace, workdir: str) -> List[Dict[str, Any]]:
+    services: Services = load_services()
+    await services.database.init_db()
+    storage: Any = services.storage.create_storage(workdir)
+
+    videos: List[Tuple[str, str]] = []
+    if os.path.exists(args.video):
+        videos.append((os.path.splitext(os.path.basename(args.video))[0], args.video))
+    if args.synthetic_seconds > 0:
+        width, height = (int(v) for v in args.synthetic_size.split("x"))
+        path: str = synthetic_video(os.path.join(workdir, "synthetic.mp4"), width, height, args.synthetic_seconds)
+        videos.append((f"synthetic-{args.synthetic_size}", path))
+    if not videos:
+        raise SystemExit("No videos to benchmark")
+
+    results: List[Dict[str, Any]] = []
+    for label, video in videos:
+        for mode in args.modes:
+            for run_index in range(args.repeat):
+                r = bench_extraction(services, video, label, mode, args, storage, run_index)
+                print(f"{r['name']:<45} {r['frames']:>6} frames {r['fps']:>9.1f} fps")
+            results.append(r)
+        for mode in args.pipeline_modes:
+            for run_index in range(args.repeat):
+                r = await bench_pipeline(services, video, label, mode, args, storage, run_index)
+                print(f"{r['name']:<45} {r['frames']:>6} frames {r['fps']:>9.1f} fps")
+            results.append(r)
+    await services.database.engine.dispose()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--video", default=os.path.join(ROOT, "sample-5s.mp4"), help="Real video to include")
+    parser.add_argument("--synthetic-seconds", type=float, default=30, help="Length of the synthetic video; 0 skips it")
+    parser.add_argument("--synthetic-size", default="1280x720", help="WIDTHxHEIGHT of the synthetic video")
+    parser.add_argument("--modes", nargs="+", default=["grab", "seek", "adaptive"], help="Sampling modes for extraction")
+    parser.add_argument("--pipeline-modes", nargs="+", default=["grab"], help="Sampling modes for the pipeline")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="Seconds between sampled frames")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="Simulated inference time per image")
+    parser.add_argument("--frame-store", choices=["files", "packed"], default="packed")
+    parser.add_argument("--hash", default="sha256", help="Frame digest (FRAME_HASH_ALGORITHM)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; the last one is reported")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for a pipeline run")
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the results (JSON)")
+    parser.add_argument("--baseline", help="Previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fps drop vs the baseline, as a fraction")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    workdir: str = tempfile.mkdtemp(prefix="vp-bench-")
+    # Read by the service modules at import time
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["FRAME_STORE"] = args.frame_store
+    os.environ["FRAME_HASH_ALGORITHM"] = args.hash
+    os.environ.setdefault("MQ_WIRE_FORMAT", "msgpack")
+    os.environ["METRICS_PORT"] = "0"
+
+    try:
+        results: List[Dict[str, Any]] = asyncio.run(run(args, workdir))
+    finally:
+        if args.keep:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report: Dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "opencv": cv2.__version__,
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "keep")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions: List[str] = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
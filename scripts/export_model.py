@@ -0,0 +1,188 @@
+"""
+Exports a YOLO model for the ONNX Runtime or OpenVINO detection backends, optionally
+quantized to int8, and checks that it detects the same objects as the PyTorch model.
+
+Needs the full detection requirements (torch and ultralytics for the export and the
+reference outputs, onnx/onnxruntime for quantization; openvino for that format).
+
+    # fp32 ONNX, checked against PyTorch on frames of sample-5s.mp4
+    python scripts/export_model.py --model yolov8n.pt --format onnx --parity sample-5s.mp4
+    # int8 ONNX, calibrated on frames of the same video
+    python scripts/export_model.py --model yolov8n.pt --format onnx --int8 --calibration sample-5s.mp4 --parity sample-5s.mp4
+
+Then run the detection service with DETECTION_BACKEND=onnx and YOLO_MODEL=<printed path>.
+The parity check exits with 1 if too few of the PyTorch detections are found.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.append("/app")
+sys.path.append(os.getcwd())
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services", "detection"))
+
+try:
+    import cv2
+    import numpy as np
+    from backends import BackendResult, InferenceBackend, UltralyticsBackend, create_backend
+except ImportError as e:
+    print(f"Error: Could not import the detection backends. Detail: {e}")
+    sys.exit(1)
+
+def video_frames(path: str, count: int) -> List[Any]:
+    """Up to `count` frames spread evenly over a video."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    total: int = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    step: int = max(total // count, 1)
+    frames: List[Any] = []
+    index: int = 0
+    while len(frames) < count:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if index % step == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+def export(model: str, fmt: str, imgsz: int, int8: bool, data: Optional[str]) -> str:
+    from ultralytics import YOLO
+
+    kwargs: Dict[str, Any] = {"format": fmt, "imgsz": imgsz, "dynamic": True}
+    if fmt == "onnx":
+        kwargs["simplify"] = True
+    elif int8:
+        # OpenVINO int8 is calibrated by ultralytics (NNCF) on a dataset yaml
+        kwargs["int8"] = True
+        if data:
+            kwargs["data"] = data
+    return str(YOLO(model).export(**kwargs))
+
+class _CalibrationReader:
+    """Feeds preprocessed frames to onnxruntime's static quantization."""
+    def __init__(self, backend: Any, frames: List[Any]) -> None:
+        self.backend: Any = backend
+        self.frames: Iterator[Any] = iter(frames)
+
+    def get_next(self) -> Optional[Dict[str, Any]]:
+        frame: Optional[Any] = next(self.frames, None)
+        if frame is None:
+            return None
+        batch, _ = self.backend.preprocess([frame])
+        return {self.backend.input_name: batch}
+
+def quantize_onnx(path: str, imgsz: int, frames: List[Any]) -> str:
+    """
+    Static int8 quantization (QDQ, per-channel weights), calibrated on `frames`.
+    Without calibration frames, falls back to dynamic (weights-only) quantization.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    out: str = path.replace(".onnx", "-int8.onnx")
+    if not frames:
+        print("No calibration frames: using dynamic quantization, which speeds up convolutions less")
+        quantize_dynamic(path, out, weight_type=QuantType.QUInt8)
+        return out
+
+    reader = _CalibrationReader(create_backend("onnx", path, input_size=imgsz), frames)
+    quantize_static(
+        path, out, reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    # Copy the class names over; quantization drops custom metadata
+    import onnx
+    source, quantized = onnx.load(path), onnx.load(out)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, out)
+    return out
+
+def iou(a: Any, b: Any) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter: float = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union: float = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def parity(reference: InferenceBackend, candidate: InferenceBackend, frames: List[Any], min_iou: float = 0.5) -> Dict[str, Any]:
+    """
+    Matches the candidate's detections to the reference's (same class, IoU >= min_iou, greedy
+    by confidence). Recall is the share of reference boxes found, precision the share of
+    candidate boxes that match one.
+    """
+    matched: int = 0
+    reference_total: int = 0
+    candidate_total: int = 0
+    ious: List[float] = []
+    confidence_diffs: List[float] = []
+
+    for frame in frames:
+        expected: BackendResult = reference.predict([frame])[0]
+        actual: BackendResult = candidate.predict([frame])[0]
+        reference_total += len(expected.scores)
+        candidate_total += len(actual.scores)
+        used: set = set()
+        for i in np.argsort(-expected.scores):
+            best, best_iou = None, min_iou
+            for j in range(len(actual.scores)):
+                if j in used or actual.classes[j] != expected.classes[i]:
+                    continue
+                overlap: float = iou(expected.boxes[i], actual.boxes[j])
+                if overlap >= best_iou:
+                    best, best_iou = j, overlap
+            if best is not None:
+                used.add(best)
+                matched += 1
+                ious.append(best_iou)
+                confidence_diffs.append(abs(float(expected.scores[i]) - float(actual.scores[best])))
+
+    return {
+        "frames": len(frames),
+        "reference_detections": reference_total,
+        "candidate_detections": candidate_total,
+        "recall": round(matched / reference_total, 4) if reference_total else 1.0,
+        "precision": round(matched / candidate_total, 4) if candidate_total else 1.0,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+        "mean_confidence_diff": round(float(np.mean(confidence_diffs)), 4) if confidence_diffs else None,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export a YOLO model for the CPU detection backends")
+    parser.add_argument("--model", default="yolov8n.pt", help="PyTorch model to export")
+    parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--imgsz", type=int, default=640, help="Model input size (MODEL_INPUT_SIZE)")
+    parser.add_argument("--int8", action="store_true", help="Quantize to int8")
+    parser.add_argument("--calibration", help="Video whose frames calibrate ONNX int8 quantization")
+    parser.add_argument("--data", help="Dataset yaml for OpenVINO int8 calibration (ultralytics default if unset)")
+    parser.add_argument("--parity", help="Video to compare the exported model against PyTorch on")
+    parser.add_argument("--frames", type=int, default=64, help="Frames used for calibration and for the parity check")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Fail the parity check below this recall")
+    args = parser.parse_args()
+
+    path: str = export(args.model, args.format, args.imgsz, args.int8, args.data)
+    if args.format == "onnx" and args.int8:
+        frames: List[Any] = video_frames(args.calibration, args.frames) if args.calibration else []
+        path = quantize_onnx(path, args.imgsz, frames)
+    print(f"Exported {args.model} to {path}")
+
+    if args.parity:
+        reference = UltralyticsBackend(args.model, input_size=args.imgsz)
+        candidate = create_backend(args.format, path, input_size=args.imgsz)
+        report: Dict[str, Any] = parity(reference, candidate, video_frames(args.parity, args.frames))
+        print(json.dumps(report, indent=2))
+        if report["recall"] < args.min_recall:
+            print(f"Parity check failed: recall {report['recall']} < {args.min_recall}")
+            sys.exit(1)
+        print("Parity check passed")
+
+if __name__ == "__main__":
+    main()
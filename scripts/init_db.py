@@ -7,17 +7,15 @@ sys.path.append("/app")
 sys.path.append(os.path.join(os.getcwd(), "services", "detection"))
 
 try:
-    from shared.database import Base, engine
-    # Import models to register them with Base.metadata
-    from shared.models import DetectionResult
+    from shared.database import init_db
 except ImportError as e:
     print(f"Error: Could not import database/models. Detail: {e}")
     sys.exit(1)
 
 async def run_init():
     print("Initializing database...")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Creates missing tables and adds columns missing from existing ones
+    await init_db()
     print("Database initialized successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+import ast
+import logging
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from shared.letterbox import letterbox
+
+logger = logging.getLogger(__name__)
+
+# Inference backends, chosen with DETECTION_BACKEND
+BACKENDS: Tuple[str, ...] = ("ultralytics", "onnx", "openvino")
+
+class BackendResult(NamedTuple):
+    """Detections for one image: boxes as [x1, y1, x2, y2] in pixels of the image passed in."""
+    boxes: Any # (n, 4) float32
+    scores: Any # (n,) float32
+    classes: Any # (n,) int
+
+class InferenceBackend:
+    """
+    Runs a YOLO detector on BGR images.
+
+    `predict` takes a list of images (any sizes) and returns one BackendResult
+    per image, in order; `names` maps class ids to names.
+    """
+    def __init__(self, input_size: int = 640, conf_threshold: float = 0.25, iou_threshold: float = 0.7,
+                 max_detections: int = 300) -> None:
+        self.input_size: int = input_size
+        self.conf_threshold: float = conf_threshold
+        self.iou_threshold: float = iou_threshold
+        self.max_detections: int = max_detections
+        self.names: Dict[int, str] = {}
+
+    def predict(self, images: List[Any]) -> List[BackendResult]:
+        raise NotImplementedError
+
+class UltralyticsBackend(InferenceBackend):
+    """Eager PyTorch through ultralytics.YOLO; also loads any format ultralytics can export."""
+    def __init__(self, model_path: str, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        from ultralytics import YOLO # Only this backend needs torch
+
+        self.model: Any = YOLO(model_path)
+        self.names = dict(self.model.names)
+
+    def predict(self, images: List[Any]) -> List[BackendResult]:
+        results: Any = self.model(images, imgsz=self.input_size, conf=self.conf_threshold, iou=self.iou_threshold,
+                                  max_det=self.max_detections, verbose=False) # Disable printing to stdout
+        return [
+            BackendResult(
+                r.boxes.xyxy.cpu().numpy().astype(np.float32),
+                r.boxes.conf.cpu().numpy().astype(np.float32),
+                r.boxes.cls.cpu().numpy().astype(int)
+            )
+            for r in results
+        ]
+
+def parse_names(value: Optional[str]) -> Dict[int, str]:
+    """Class names as stored in the metadata of ultralytics exports ("{0: 'person', ...}")."""
+    if not value:
+        return {}
+    try:
+        return {int(k): str(v) for k, v in ast.literal_eval(value).items()}
+    except (ValueError, SyntaxError, AttributeError):
+        return {}
+
+class ExportedYoloBackend(InferenceBackend):
+    """
+    Shared pre- and post-processing for YOLOv8 models exported by ultralytics: letterboxed
+    RGB input in [0, 1], NCHW; output (batch, 4 + classes, anchors) with boxes as cx, cy, w, h.
+    Subclasses only run the network.
+    """
+    # Whether the network takes several images per call; fixed-batch exports take one
+    dynamic_batch: bool = False
+
+    def _run(self, batch: Any) -> Any:
+        raise NotImplementedError
+
+    def preprocess(self, images: List[Any]) -> Tuple[Any, List[Tuple[float, int, int]]]:
+        inputs: List[Any] = []
+        transforms: List[Tuple[float, int, int]] = []
+        for img in images:
+            # Bilinear, as ultralytics resizes model inputs
+            boxed, scale, pad_x, pad_y = letterbox(img, self.input_size, cv2.INTER_LINEAR)
+            inputs.append(boxed)
+            transforms.append((scale, pad_x, pad_y))
+        # BGR HWC uint8 -> RGB CHW float
+        batch: Any = np.stack(inputs)[..., ::-1].transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32) / 255.0, transforms
+
+    def postprocess(self, output: Any, shape: Tuple[int, ...], transform: Tuple[float, int, int]) -> BackendResult:
+        """Confidence filter and per-class NMS on one image's output, boxes mapped back to the image."""
+        predictions: Any = output.T # (anchors, 4 + classes)
+        class_scores: Any = predictions[:, 4:]
+        classes: Any = class_scores.argmax(axis=1)
+        scores: Any = class_scores[np.arange(len(classes)), classes]
+        keep: Any = scores >= self.conf_threshold
+        predictions, classes, scores = predictions[keep], classes[keep], scores[keep]
+        if not len(scores):
+            return BackendResult(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=int))
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        xywh: Any = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+        indices: Any = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), classes.tolist(),
+                                               self.conf_threshold, self.iou_threshold)
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+        indices = indices[np.argsort(-scores[indices])][:self.max_detections]
+
+        scale, pad_x, pad_y = transform
+        height, width = shape[:2]
+        boxes: Any = xywh[indices].copy()
+        boxes[:, 2:] += boxes[:, :2]
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / scale).clip(0, width)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / scale).clip(0, height)
+        return BackendResult(boxes.astype(np.float32), scores[indices].astype(np.float32), classes[indices].astype(int))
+
+    def predict(self, images: List[Any]) -> List[BackendResult]:
+        if not images:
+            return []
+        batch, transforms = self.preprocess(images)
+        if self.dynamic_batch:
+            outputs: Any = self._run(batch)
+        else:
+            outputs = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(images))])
+        return [self.postprocess(outputs[i], img.shape, t) for i, (img, t) in enumerate(zip(images, transforms))]
+
+class OnnxBackend(ExportedYoloBackend):
+    """ONNX Runtime on the CPU (fp32 or int8-quantized exports); no torch needed."""
+    def __init__(self, model_path: str, threads: int = 0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session: Any = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input: Any = self.session.get_inputs()[0]
+        self.input_name: str = model_input.name
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        if isinstance(model_input.shape[2], int) and model_input.shape[2] != self.input_size:
+            logger.warning(f"{model_path} was exported for {model_input.shape[2]}px inputs; using that instead of {self.input_size}")
+            self.input_size = model_input.shape[2]
+        self.names = parse_names(self.session.get_modelmeta().custom_metadata_map.get("names"))
+
+    def _run(self, batch: Any) -> Any:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class OpenVinoBackend(ExportedYoloBackend):
+    """OpenVINO on the CPU, from an ultralytics OpenVINO export (directory or .xml)."""
+    def __init__(self, model_path: str, threads: int = 0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        import openvino as ov
+
+        xml_path: str = model_path
+        if os.path.isdir(model_path):
+            xml_path = next(os.path.join(model_path, f) for f in sorted(os.listdir(model_path)) if f.endswith(".xml"))
+        core = ov.Core()
+        model: Any = core.read_model(xml_path)
+        config: Dict[str, Any] = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads > 0:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled: Any = core.compile_model(model, "CPU", config)
+        model_input: Any = model.inputs[0].get_partial_shape()
+        self.dynamic_batch = model_input[0].is_dynamic
+        if model_input[2].is_static and model_input[2].get_length() != self.input_size:
+            self.input_size = model_input[2].get_length()
+
+        # ultralytics writes the class names next to the model
+        metadata: str = os.path.join(os.path.dirname(xml_path), "metadata.yaml")
+        if os.path.exists(metadata):
+            self.names = _names_from_yaml(metadata)
+
+    def _run(self, batch: Any) -> Any:
+        return self.compiled(batch)[0]
+
+def _names_from_yaml(path: str) -> Dict[int, str]:
+    """Reads the `names:` block of an ultralytics metadata.yaml without needing a YAML parser."""
+    names: Dict[int, str] = {}
+    in_names: bool = False
+    with open(path) as f:
+        for line in f:
+            if line.startswith("names:"):
+                in_names = True
+                continue
+            if in_names:
+                if not line.startswith(" "):
+                    break
+                key, _, value = line.strip().partition(":")
+                if key.isdigit():
+                    names[int(key)] = value.strip().strip("'\"")
+    return names
+
+def create_backend(name: str, model_path: str, input_size: int = 640, threads: int = 0,
+                   conf_threshold: float = 0.25, iou_threshold: float = 0.7) -> InferenceBackend:
+    kwargs: Dict[str, Any] = dict(input_size=input_size, conf_threshold=conf_threshold, iou_threshold=iou_threshold)
+    if name == "ultralytics":
+        return UltralyticsBackend(model_path, **kwargs)
+    if name == "onnx":
+        return OnnxBackend(model_path, threads=threads, **kwargs)
+    if name == "openvino":
+        return OpenVinoBackend(model_path, threads=threads, **kwargs)
+    raise ValueError(f"Unknown detection backend '{name}', expected one of {BACKENDS}")
@@ -0,0 +1,86 @@
+import cv2
+import logging
+import numpy as np
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from shared.schemas import DetectionSchema
+
+logger = logging.getLogger(__name__)
+
+def perceptual_hash(img: Any) -> int:
+    """
+    64-bit difference hash (dHash): compares horizontally adjacent pixels of a
+    9x8 grayscale thumbnail. Near-identical frames differ in only a few bits.
+    """
+    gray: Any = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small: Any = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits: Any = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+class CacheEntry:
+    __slots__ = ("detections", "source", "stored_at")
+
+    def __init__(self, detections: List[DetectionSchema], source: str, stored_at: float) -> None:
+        self.detections: List[DetectionSchema] = detections
+        self.source: str = source # "<video_id>:<frame_index>" the detections came from
+        self.stored_at: float = stored_at
+
+class DetectionCache:
+    """
+    LRU + TTL cache of detections keyed by perceptual hash.
+
+    A lookup hits when a cached hash is within `max_distance` bits (Hamming
+    distance) of the query, so static scenes reuse the previous detections
+    instead of running the model again.
+    """
+    def __init__(self, max_entries: int = 512, ttl_sec: float = 300, max_distance: int = 3) -> None:
+        self.max_entries: int = max_entries
+        self.ttl_sec: float = ttl_sec
+        self.max_distance: int = max_distance
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, phash: int) -> Optional[CacheEntry]:
+        cutoff: float = time.monotonic() - self.ttl_sec
+        expired: List[int] = []
+        best: Optional[Tuple[int, int]] = None # (distance, key)
+
+        for key, entry in self._entries.items():
+            if entry.stored_at < cutoff:
+                expired.append(key)
+                continue
+            distance: int = (key ^ phash).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+
+        for key in expired:
+            del self._entries[key]
+
+        if best is None:
+            self.misses += 1
+            self._maybe_log()
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(best[1])
+        self._maybe_log()
+        return self._entries[best[1]]
+
+    def store(self, phash: int, detections: List[DetectionSchema], source: str) -> None:
+        self._entries[phash] = CacheEntry(detections, source, time.monotonic())
+        self._entries.move_to_end(phash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _maybe_log(self) -> None:
+        total: int = self.hits + self.misses
+        if total % 1000 == 0:
+            logger.info(f"Detection cache: {self.hits} hits, {self.misses} misses "
+                        f"({self.hits / total:.1%} hit rate, {len(self._entries)} entries)")
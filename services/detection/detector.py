@@ -1,40 +1,279 @@
-from ultralytics import YOLO
 import cv2
+import errno
 import logging
-from typing import List, Dict, Any
-from shared.schemas import DetectionSchema
+import numpy as np
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple, Union
+from shared.schemas import DetectionSchema, FrameDetections, FrameTask, Letterbox
+from shared.storage import FileSystemStorage, VideoStorage
+from cache import DetectionCache, perceptual_hash
+from tracker import FrameTracker
+from backends import BackendResult, InferenceBackend, UltralyticsBackend
 
 logger = logging.getLogger(__name__)
 
+# Reads failing with an I/O error other than a missing file (e.g. a network filesystem hiccup)
+# are tried this many times before the error is raised, failing the batch so it is redelivered
+READ_ATTEMPTS: int = 3
+READ_RETRY_SEC: float = 0.1
+
+def unletterbox(xyxy: List[float], letterbox: Letterbox) -> List[float]:
+    """
+    Maps a box in pixels of a letterboxed frame to [x1, y1, x2, y2] normalized to the original frame.
+    """
+    x1, y1, x2, y2 = xyxy
+    def norm(value: float, pad: int, extent: int) -> float:
+        return min(max((value - pad) / letterbox.scale / extent, 0.0), 1.0)
+    return [
+        norm(x1, letterbox.pad_x, letterbox.width),
+        norm(y1, letterbox.pad_y, letterbox.height),
+        norm(x2, letterbox.pad_x, letterbox.width),
+        norm(y2, letterbox.pad_y, letterbox.height),
+    ]
+
+def to_pixels(bbox: List[float], shape: Tuple[int, ...], letterbox: Optional[Letterbox] = None) -> List[float]:
+    """
+    Maps a normalized [x1, y1, x2, y2] box of the original frame to pixels of the image
+    the detector sees (the letterboxed one, if any). Inverse of from_pixels.
+    """
+    x1, y1, x2, y2 = bbox
+    if letterbox is None:
+        height, width = shape[:2]
+        return [x1 * width, y1 * height, x2 * width, y2 * height]
+    sx, sy = letterbox.width * letterbox.scale, letterbox.height * letterbox.scale
+    return [x1 * sx + letterbox.pad_x, y1 * sy + letterbox.pad_y, x2 * sx + letterbox.pad_x, y2 * sy + letterbox.pad_y]
+
+def from_pixels(xyxy: List[float], shape: Tuple[int, ...], letterbox: Optional[Letterbox] = None) -> List[float]:
+    """Maps a box in image pixels to [x1, y1, x2, y2] normalized to the original frame."""
+    if letterbox is not None:
+        return unletterbox(xyxy, letterbox)
+    height, width = shape[:2]
+    x1, y1, x2, y2 = xyxy
+    return [min(max(v, 0.0), 1.0) for v in (x1 / width, y1 / height, x2 / width, y2 / height)]
+
 class ObjectDetector:
-    def __init__(self, model_name: str = "yolov8n.pt") -> None:
-        # "n" is nano model (fastest, less accurate). Good for MVP.
-        logger.info(f"Loading YOLO model: {model_name}")
-        self.model: YOLO = YOLO(model_name)
+    def __init__(self, model_name: str = "yolov8n.pt", storage: Optional[VideoStorage] = None,
+                 cache: Optional[DetectionCache] = None, tracker: Optional[FrameTracker] = None,
+                 backend: Optional[InferenceBackend] = None) -> None:
+        if backend is None:
+            # "n" is nano model (fastest, less accurate). Good for MVP.
+            logger.info(f"Loading YOLO model: {model_name}")
+            backend = UltralyticsBackend(model_name)
+        # Runs the model; see backends.py for the PyTorch, ONNX Runtime and OpenVINO implementations
+        self.backend: InferenceBackend = backend
+        # Frames are read through storage when given, so packed frame references work
+        self.storage: Optional[VideoStorage] = storage
+        # Near-duplicate frames reuse cached detections instead of running the model
+        self.cache: Optional[DetectionCache] = cache if cache is not None and cache.enabled else None
+        # Only every Nth frame of a video is detected; boxes are tracked across the others
+        self.tracker: Optional[FrameTracker] = tracker if tracker is not None and tracker.enabled else None
+        # Seconds spent per stage ("read", "verify", "decode", "track" per frame; "inference" per
+        # model call) during the last process_batch, for the parent process to export as metrics
+        self.timings: Dict[str, List[float]] = {}
+
+    def _timed(self, stage: str, started: float) -> None:
+        self.timings.setdefault(stage, []).append(time.perf_counter() - started)
+
+    def _read_bytes(self, frame_path: str) -> Union[bytes, memoryview]:
+        if self.storage is not None:
+            return self.storage.read_frame(frame_path)
+        with open(frame_path, "rb") as f:
+            return f.read()
+
+    def load_image(self, frame_path: str) -> Any:
+        """
+        Decodes a frame into a BGR image, or returns None if it cannot be read.
+        """
+        try:
+            data = self._read_bytes(frame_path)
+        except (OSError, ValueError):
+            return None
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def load_frame(self, frame: FrameTask) -> Tuple[Any, Optional[str]]:
+        """
+        Reads the frame once, verifies its digest and decodes it from the same buffer.
+        Returns (image, None) on success or (None, error) for a frame that is gone or
+        corrupt, which retrying would not fix. Other read errors are retried, then raised.
+        """
+        started: float = time.perf_counter()
+        for attempt in range(1, READ_ATTEMPTS + 1):
+            try:
+                data = self._read_bytes(frame.frame_path)
+                break
+            except ValueError as e:
+                # A reference past the end of its pack: the frame was never fully written
+                logger.error(f"Failed to read frame {frame.frame_path} (trace {frame.trace_id}): {e}")
+                return None, "unreadable"
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    logger.error(f"Frame {frame.frame_path} no longer exists (trace {frame.trace_id})")
+                    return None, "missing"
+                if attempt == READ_ATTEMPTS:
+                    raise
+                logger.warning(f"Retrying read of frame {frame.frame_path} (attempt {attempt}/{READ_ATTEMPTS}): {e}")
+                time.sleep(READ_RETRY_SEC * attempt)
+        self._timed("read", started)
+
+        if frame.frame_hash:
+            started = time.perf_counter()
+            try:
+                actual_hash: str = FileSystemStorage.compute_hash(data, frame.hash_algorithm)
+            except ValueError as e:
+                logger.error(f"Cannot verify frame {frame.frame_index} of video {frame.video_id}: {e}")
+                return None, "unverifiable"
+            if actual_hash != frame.frame_hash:
+                logger.error(f"CORRUPTION DETECTED: Hash mismatch for frame {frame.frame_index} of video {frame.video_id}. "
+                             f"Expected: {frame.frame_hash}, Actual: {actual_hash} (trace {frame.trace_id})")
+                return None, "corrupt"
+            self._timed("verify", started)
+
+        started = time.perf_counter()
+        box: Optional[Letterbox] = frame.letterbox
+        if box is not None and box.raw:
+            # Preprocessed at extraction: already a size x size BGR image, no decoding needed
+            if len(data) != box.size * box.size * 3:
+                logger.warning(f"Raw frame at {frame.frame_path} has {len(data)} bytes, expected {box.size}x{box.size}x3")
+                return None, "undecodable"
+            img: Any = np.frombuffer(data, dtype=np.uint8).reshape(box.size, box.size, 3)
+        else:
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                logger.warning(f"Could not decode image at {frame.frame_path}")
+                return None, "undecodable"
+        self._timed("decode", started)
+        return img, None
 
     def process_frame(self, frame_path: str) -> List[DetectionSchema]:
         """
         Run inference on a single frame.
         Returns a list of detections.
         """
-        img: Any = cv2.imread(frame_path)
+        img: Any = self.load_image(frame_path)
         if img is None:
             logger.warning(f"Could not read image at {frame_path}")
             return []
-            
-        results: Any = self.model(img, verbose=False) # Disable printing to stdout
-        detections: List[DetectionSchema] = []
-        
-        for result in results:
-            for box in result.boxes:
-                cls_name: str = self.model.names[int(box.cls)]
-                conf: float = float(box.conf)
-                bbox: List[float] = box.xyxyn.cpu().numpy().tolist()[0] # [x1, y1, x2, y2]
-                
-                detections.append(DetectionSchema(
-                    class_name=cls_name,
-                    confidence=conf,
-                    bbox=bbox
-                ))
-                
-        return detections
+        return self._to_detections(self.backend.predict([img])[0], img.shape)
+
+    def process_batch(self, frames: List[FrameTask]) -> List[FrameDetections]:
+        """
+        Run a single batched forward pass over several frames.
+        Returns one result per input frame, in input order.
+        Frames that are missing, corrupt or fail verification get a result with `error` set;
+        a read that keeps failing for another reason raises instead, failing the whole batch.
+
+        With a cache, frames that look like a recently seen frame (or like an
+        earlier frame of the same batch) copy its detections and skip the model.
+        With a tracker, only keyframes are considered for detection; see _track.
+        """
+        self.timings = {}
+        outputs: List[FrameDetections] = [FrameDetections() for _ in frames]
+        images: List[Any] = []
+        positions: List[int] = []
+        hashes: Dict[int, int] = {}
+        # Frames waiting on the detections of a near-duplicate earlier in this batch
+        duplicates: Dict[int, int] = {}
+        # Every loaded image when tracking, and the frames to be tracked rather than detected
+        loaded: Dict[int, Any] = {}
+        tracked: Set[int] = set()
+
+        for i, frame in enumerate(frames):
+            img, error = self.load_frame(frame)
+            if img is None:
+                outputs[i].error = error
+                continue
+
+            if self.tracker is not None:
+                loaded[i] = img
+                if not self.tracker.due(frame.video_id, frame.segment_index, frame.frame_index):
+                    tracked.add(i)
+                    continue
+
+            if self.cache is not None:
+                phash: int = perceptual_hash(img)
+                hashes[i] = phash
+                outputs[i].phash = f"{phash:016x}"
+
+                entry = self.cache.lookup(phash)
+                if entry is not None:
+                    outputs[i].detections = [d.model_copy() for d in entry.detections]
+                    outputs[i].reused_from = entry.source
+                    continue
+
+                original: Optional[int] = next(
+                    (p for p in positions if (hashes[p] ^ phash).bit_count() <= self.cache.max_distance), None
+                )
+                if original is not None:
+                    duplicates[i] = original
+                    continue
+
+            images.append(img)
+            positions.append(i)
+
+        if images:
+            started: float = time.perf_counter()
+            results: List[BackendResult] = self.backend.predict(images)
+            self._timed("inference", started)
+
+            for position, img, result in zip(positions, images, results):
+                outputs[position].detections = self._to_detections(result, img.shape, frames[position].letterbox)
+                if self.cache is not None:
+                    frame = frames[position]
+                    self.cache.store(hashes[position], outputs[position].detections, f"{frame.video_id}:{frame.frame_index}")
+
+        for i, original in duplicates.items():
+            source = frames[original]
+            outputs[i].detections = [d.model_copy() for d in outputs[original].detections]
+            outputs[i].reused_from = f"{source.video_id}:{source.frame_index}"
+
+        if self.tracker is not None:
+            self._track(frames, loaded, tracked, outputs)
+        return outputs
+
+    def _track(self, frames: List[FrameTask], images: Dict[int, Any], tracked: Set[int],
+               outputs: List[FrameDetections]) -> None:
+        """
+        Walks the batch in order. Detected frames become the starting point for tracking;
+        the others get the boxes tracked from the previous frame of their segment, or are
+        detected after all when there is nothing to track from or the tracker loses confidence.
+        """
+        for i, img in images.items():
+            frame: FrameTask = frames[i]
+            if i in tracked:
+                started: float = time.perf_counter()
+                step = self.tracker.advance(frame.video_id, frame.segment_index, img)
+                self._timed("track", started)
+                if step is not None and step[2] >= self.tracker.min_confidence:
+                    boxes, labels, _, keyframe = step
+                    outputs[i].detections = [
+                        DetectionSchema(class_name=cls_name, confidence=conf, bbox=from_pixels(box, img.shape, frame.letterbox))
+                        for box, (cls_name, conf) in zip(boxes.tolist(), labels)
+                    ]
+                    outputs[i].tracked_from = keyframe
+                    continue
+                started = time.perf_counter()
+                outputs[i].detections = self._to_detections(self.backend.predict([img])[0], img.shape, frame.letterbox)
+                self._timed("inference", started)
+
+            detections: List[DetectionSchema] = outputs[i].detections
+            self.tracker.reset(
+                frame.video_id, frame.segment_index, img,
+                [to_pixels(d.bbox, img.shape, frame.letterbox) for d in detections],
+                [(d.class_name, d.confidence) for d in detections],
+                f"{frame.video_id}:{frame.frame_index}"
+            )
+
+    def _to_detections(self, result: BackendResult, shape: Tuple[int, ...],
+                       letterbox: Optional[Letterbox] = None) -> List[DetectionSchema]:
+        """
+        Converts model output to detections with boxes normalized to the original frame.
+        Letterboxed frames have the padding and scaling undone first.
+        """
+        return [
+            DetectionSchema(
+                class_name=self.backend.names.get(cls_id, str(cls_id)),
+                confidence=conf,
+                bbox=from_pixels(xyxy, shape, letterbox) # [x1, y1, x2, y2]
+            )
+            for xyxy, conf, cls_id in zip(result.boxes.tolist(), result.scores.tolist(), result.classes.tolist())
+        ]
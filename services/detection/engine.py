@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared.metrics import FRAME_STAGE_SECONDS, INFERENCE_SECONDS
+from shared.schemas import FrameTask
+
+logger = logging.getLogger(__name__)
+
+# The detector owned by this worker process (set by _init_worker)
+_detector: Optional[Any] = None
+
+def _init_worker(model_name: str, threads: int, cache_size: int, cache_ttl_sec: float, cache_max_distance: int,
+                 detect_every: int, track_min_confidence: float, backend_name: str, input_size: int) -> None:
+    """
+    Runs once in each worker process: pins the thread count, then loads the model.
+    """
+    # Must be set before torch (and its OpenMP runtime) is imported
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    if backend_name == "ultralytics":
+        import torch
+        torch.set_num_threads(threads)
+
+    from shared.storage import create_storage
+    from backends import create_backend
+    from cache import DetectionCache
+    from detector import ObjectDetector
+    from tracker import FrameTracker
+
+    global _detector
+    cache = DetectionCache(max_entries=cache_size, ttl_sec=cache_ttl_sec, max_distance=cache_max_distance)
+    tracker = FrameTracker(detect_every=detect_every, min_confidence=track_min_confidence)
+    backend = create_backend(backend_name, model_name, input_size=input_size, threads=threads)
+    _detector = ObjectDetector(model_name, storage=create_storage(), cache=cache, tracker=tracker, backend=backend)
+    logger.info(f"Inference worker {os.getpid()} ready ({backend_name} backend, {input_size}px, {threads} threads)")
+
+def _process_batch(frames: List[FrameTask]) -> Tuple[List[Any], Dict[str, List[float]]]:
+    return _detector.process_batch(frames), _detector.timings
+
+class InferenceError(Exception):
+    """An inference batch failed (e.g. a worker process died); its frames have no results."""
+
+class InferenceEngine:
+    """
+    Pool of inference processes, each with its own copy of the model.
+
+    Every worker is a single-process executor, and all frames of a video are
+    routed to the same worker. Frames of one video are therefore processed in
+    order by one detector, which keeps its near-duplicate cache effective
+    and lets it track boxes from frame to frame, while different videos run
+    in parallel.
+    """
+    def __init__(self, model_name: str, workers: int = 2, threads_per_worker: int = 2,
+                 cache_size: int = 512, cache_ttl_sec: float = 300, cache_max_distance: int = 3,
+                 detect_every: int = 1, track_min_confidence: float = 0.5,
+                 backend: str = "ultralytics", input_size: int = 640) -> None:
+        # spawn: never fork a parent that has an event loop and Kafka connections running
+        context = multiprocessing.get_context("spawn")
+        self.workers: List[ProcessPoolExecutor] = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(model_name, threads_per_worker, cache_size, cache_ttl_sec, cache_max_distance,
+                          detect_every, track_min_confidence, backend, input_size)
+            )
+            for _ in range(max(1, workers))
+        ]
+
+    def _worker_for(self, video_id: str) -> int:
+        # Stable across restarts, unlike hash()
+        return zlib.crc32(video_id.encode("utf-8")) % len(self.workers)
+
+    async def process_batch(self, frames: List[FrameTask]) -> List[Any]:
+        """
+        Splits the batch across workers by video and returns the FrameDetections in input order.
+        """
+        loop = asyncio.get_running_loop()
+        groups: Dict[int, List[int]] = {}
+        for i, frame in enumerate(frames):
+            groups.setdefault(self._worker_for(frame.video_id), []).append(i)
+
+        worker_ids: List[int] = list(groups)
+        try:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self.workers[w], _process_batch, [frames[i] for i in groups[w]])
+                for w in worker_ids
+            ))
+        except Exception as e:
+            raise InferenceError(f"Inference failed for a batch of {len(frames)} frames: {e}") from e
+
+        outputs: List[Any] = [None] * len(frames)
+        for w, (group_results, timings) in zip(worker_ids, results):
+            for i, result in zip(groups[w], group_results):
+                outputs[i] = result
+            # Timed inside the worker process; exported from this one
+            for stage, values in timings.items():
+                metric = INFERENCE_SECONDS if stage == "inference" else FRAME_STAGE_SECONDS.labels(stage)
+                for value in values:
+                    metric.observe(value)
+        return outputs
+
+    def shutdown(self) -> None:
+        for executor in self.workers:
+            executor.shutdown(wait=True)
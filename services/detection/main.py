@@ -1,21 +1,63 @@
 import asyncio
-import json
 import logging
+import os
 import signal
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
-from shared.database import init_db, AsyncSessionLocal
-from shared.models import DetectionResult
-from shared.storage import FileSystemStorage
-from shared.mq import KafkaConsumer
-from shared.schemas import FrameTask, DetectionSchema
-from detector import ObjectDetector
+from shared.database import init_db
+from shared.metrics import DETECTED_FRAMES, FRAMES_IN_FLIGHT, serve_metrics
+from shared.mq import PRIORITIES, KafkaConsumer, priority_settings, priority_topic
+from shared.serialization import parse_message
+from shared.schemas import FrameTask, FrameDetections
+from engine import InferenceEngine, InferenceError
+from scheduler import FairScheduler
+from writer import ResultWriter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger: logging.Logger = logging.getLogger("worker")
 
+# Must match the processing service's YOLO_MODEL, which keys the video registry
+YOLO_MODEL: str = os.getenv("YOLO_MODEL", "yolov8n.pt")
+# "ultralytics" (PyTorch), or "onnx"/"openvino" with a model exported by scripts/export_model.py
+DETECTION_BACKEND: str = os.getenv("DETECTION_BACKEND", "ultralytics")
+# Model input size (pixels, square); exported models use the size they were exported with
+MODEL_INPUT_SIZE: int = int(os.getenv("MODEL_INPUT_SIZE", "640"))
+
+# Micro-batching: gather up to BATCH_SIZE frame tasks, waiting at most BATCH_MAX_WAIT_MS
+BATCH_SIZE: int = int(os.getenv("DETECTION_BATCH_SIZE", "8"))
+BATCH_MAX_WAIT_MS: int = int(os.getenv("DETECTION_BATCH_MAX_WAIT_MS", "50"))
+
+# Fair scheduling: frame tasks are consumed from every priority class's topic and batched
+# across videos in turn, each class getting a share of the frames proportional to its weight
+# while it has work. SCHEDULER_BUFFER frames per class are fetched ahead to choose from.
+FRAME_TOPICS: Dict[str, str] = {priority: priority_topic("frame-tasks", priority) for priority in PRIORITIES}
+PRIORITY_WEIGHTS: Dict[str, float] = priority_settings(os.getenv("PRIORITY_WEIGHTS", "interactive:16,normal:4,bulk:1"), 1.0)
+SCHEDULER_BUFFER: int = int(os.getenv("SCHEDULER_BUFFER", "256"))
+
+# Write-behind: flush results once FLUSH_ROWS are pending or after FLUSH_INTERVAL_MS
+FLUSH_ROWS: int = int(os.getenv("RESULT_FLUSH_ROWS", "200"))
+FLUSH_INTERVAL_MS: int = int(os.getenv("RESULT_FLUSH_INTERVAL_MS", "1000"))
+
+# Near-duplicate cache: frames within CACHE_MAX_DISTANCE bits (perceptual hash) reuse detections.
+# DETECTION_CACHE_SIZE=0 disables it.
+CACHE_SIZE: int = int(os.getenv("DETECTION_CACHE_SIZE", "512"))
+CACHE_TTL_SEC: float = float(os.getenv("DETECTION_CACHE_TTL_SEC", "300"))
+CACHE_MAX_DISTANCE: int = int(os.getenv("DETECTION_CACHE_MAX_DISTANCE", "3"))
+
+# Detect-and-track: run the model on every TRACK_DETECT_EVERY-th frame of a video and track boxes
+# with optical flow in between; frames whose tracking confidence drops below TRACK_MIN_CONFIDENCE
+# are detected anyway. 1 detects every frame.
+TRACK_DETECT_EVERY: int = int(os.getenv("TRACK_DETECT_EVERY", "1"))
+TRACK_MIN_CONFIDENCE: float = float(os.getenv("TRACK_MIN_CONFIDENCE", "0.5"))
+
+# Inference pool: INFERENCE_WORKERS processes, each limited to INFERENCE_THREADS torch/OpenMP threads
+INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_THREADS: int = int(os.getenv("INFERENCE_THREADS", "2"))
+# Batches submitted to the pool but not yet handed to the writer
+MAX_INFLIGHT_BATCHES: int = int(os.getenv("MAX_INFLIGHT_BATCHES", str(2 * INFERENCE_WORKERS)))
+
 # graceful shutdown
 shutdown_event: asyncio.Event = asyncio.Event()
 
@@ -25,102 +67,145 @@ def signal_handler() -> None:
 
 async def main() -> None:
     logger.info("Starting Detection Worker...")
-    
+
     # Auto-initialize DB tables
     await init_db()
-    
+    serve_metrics()
+
     # Initialize components
-    storage: FileSystemStorage = FileSystemStorage()
-    consumer: KafkaConsumer = KafkaConsumer(topic="frame-tasks", group_id="detection-group")
+    consumer: KafkaConsumer = KafkaConsumer(topic=list(FRAME_TOPICS.values()), group_id="detection-group")
     await consumer.start()
-    detector: ObjectDetector = ObjectDetector()
-    
-    # Executor for running blocking inference
-    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1) # YOLO is often not thread-safe or uses internal parallelism
-    
+    writer: ResultWriter = ResultWriter(consumer, max_rows=FLUSH_ROWS, max_interval_ms=FLUSH_INTERVAL_MS)
+    engine: InferenceEngine = InferenceEngine(
+        YOLO_MODEL,
+        workers=INFERENCE_WORKERS,
+        threads_per_worker=INFERENCE_THREADS,
+        cache_size=CACHE_SIZE,
+        cache_ttl_sec=CACHE_TTL_SEC,
+        cache_max_distance=CACHE_MAX_DISTANCE,
+        detect_every=TRACK_DETECT_EVERY,
+        track_min_confidence=TRACK_MIN_CONFIDENCE,
+        backend=DETECTION_BACKEND,
+        input_size=MODEL_INPUT_SIZE
+    )
+
     loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
-    
+
     # Register signals
     for sig in (signal.SIGTERM, signal.SIGINT):
         loop.add_signal_handler(sig, signal_handler)
 
-    logger.info("Worker ready. Waiting for jobs...")
-    
-    while not shutdown_event.is_set():
-        try:
-            # 1. Get Job
-            job_info: Optional[Tuple[Any, Dict[str, Any]]] = await consumer.get_next_job()
-            
-            if not job_info:
+    logger.info(f"Worker ready ({INFERENCE_WORKERS} inference processes, batch size {BATCH_SIZE}, "
+                f"max wait {BATCH_MAX_WAIT_MS}ms). Waiting for jobs...")
+
+    failed: bool = await consume_frames(consumer, writer, engine, shutdown_event)
+
+    await consumer.stop()
+    engine.shutdown()
+    if failed:
+        raise SystemExit(1)
+
+async def consume_frames(consumer: KafkaConsumer, writer: ResultWriter, engine: InferenceEngine, stop: asyncio.Event) -> bool:
+    """
+    The detection loop: consumes frame tasks in micro-batches, picked across videos and
+    priority classes by a FairScheduler, runs them through `engine` and hands the results
+    to `writer`, until `stop` is set. Then finishes the batches in
+    flight and flushes the writer. Returns True if it stopped on an inference failure.
+    """
+    # Batches in flight. Their results are handed to the writer as soon as they are ready;
+    # the consumer only commits past a message once everything before it is written too.
+    inflight: Deque[Tuple[List[Tuple[Any, Optional[FrameTask]]], "asyncio.Task[List[FrameDetections]]"]] = deque()
+
+    async def drain(entry: Tuple[List[Tuple[Any, Optional[FrameTask]]], "asyncio.Task[List[FrameDetections]]"]) -> None:
+        inflight.remove(entry)
+        entries, inference = entry
+        batch_results: List[FrameDetections] = await inference
+        results = iter(batch_results)
+
+        # 3. Buffer results; the writer saves them to the DB and commits offsets in bulk
+        for kafka_msg, frame_task in entries:
+            if frame_task is None:
+                # Dropped task: only its offset needs committing
+                await writer.add(kafka_msg)
                 continue
-                
-            kafka_msg, job_data = job_info
-            
-            # Use Pydantic to validate incoming task
-            try:
-                frame_task = FrameTask(**job_data)
-            except Exception as e:
-                logger.error(f"Invalid FrameTask received: {e}")
-                await consumer.acknowledge(kafka_msg)
+            frame_result: FrameDetections = next(results)
+            if frame_result.error:
+                # Missing or corrupt frames are dropped so they are not retried indefinitely;
+                # transient read errors fail the batch instead, leaving its frames uncommitted
+                await writer.add(kafka_msg)
                 continue
-                
-            video_id: str = frame_task.video_id
-            frame_path: str = frame_task.frame_path
-            frame_idx: int = frame_task.frame_index
-            expected_hash: str = frame_task.frame_hash
-            
-            logger.info(f"Processing frame {frame_idx} for video {video_id}")
-            
-            # --- Hash Verification ---
-            if expected_hash:
-                try:
-                    with open(frame_path, "rb") as f:
-                        actual_hash: str = storage.compute_hash(f.read())
-                    if actual_hash != expected_hash:
-                        logger.error(f"CORRUPTION DETECTED: Hash mismatch for frame {frame_idx} of video {video_id}. "
-                                     f"Expected: {expected_hash}, Actual: {actual_hash}")
-                        # Acknowledge to drop it so it's not retried indefinitely in PEL
-                        await consumer.acknowledge(kafka_msg)
-                        continue
-                except Exception as e:
-                    logger.error(f"Failed to read/verify hash for frame {frame_path}: {e}")
-                    await asyncio.sleep(1)
-                    continue
-            # --------------------------
-            
-            # 2. Run Inference (Blocking CPU bound)
-            detections: List[DetectionSchema] = await loop.run_in_executor(
-                executor, 
-                detector.process_frame, 
-                frame_path
-            )
-            
-            # 3. Save to DB
-            async with AsyncSessionLocal() as session:
+            source: str = "tracked" if frame_result.tracked_from else "reused" if frame_result.reused_from else "detected"
+            DETECTED_FRAMES.labels(source).inc()
+            await writer.add(kafka_msg, {
+                "video_id": frame_task.video_id,
+                "frame_path": frame_task.frame_path,
+                "frame_index": frame_task.frame_index,
                 # Convert Pydantic models to dicts for JSON storage
-                detections_data: List[Dict[str, Any]] = [d.model_dump(by_alias=True) for d in detections]
-                
-                result = DetectionResult(
-                    video_id=video_id,
-                    frame_path=frame_path,
-                    frame_index=frame_idx,
-                    detections=detections_data
-                )
-                session.add(result)
-                await session.commit()
-                
-            logger.info(f"Saved {len(detections)} detections for frame {frame_idx}")
-            
-            # 4. Acknowledge (Commit Offset)
-            await consumer.acknowledge(kafka_msg)
-            
+                "detections": [d.model_dump(by_alias=True) for d in frame_result.detections],
+                "phash": frame_result.phash,
+                "reused_from": frame_result.reused_from,
+                "tracked_from": frame_result.tracked_from,
+                "letterbox": frame_task.letterbox.model_dump() if frame_task.letterbox is not None else None,
+            }, uploaded_at=frame_task.uploaded_at, priority=frame_task.priority)
+
+    failed: bool = False
+    scheduler: FairScheduler = FairScheduler(consumer, FRAME_TOPICS, PRIORITY_WEIGHTS, SCHEDULER_BUFFER)
+
+    while not stop.is_set():
+        try:
+            # 1. Gather a batch of jobs
+            batch: List[Tuple[Any, Dict[str, Any]]] = await scheduler.get_batch(BATCH_SIZE, BATCH_MAX_WAIT_MS)
+
+            if batch:
+                entries: List[Tuple[Any, Optional[FrameTask]]] = []
+                for kafka_msg, job_data in batch:
+                    # Use Pydantic to validate incoming task
+                    try:
+                        frame_task = parse_message(FrameTask, job_data)
+                    except Exception as e:
+                        logger.error(f"Invalid FrameTask received: {e}")
+                        entries.append((kafka_msg, None))
+                        continue
+
+                    # Frame bytes are read, hash-verified and decoded once, inside the inference worker
+                    entries.append((kafka_msg, frame_task))
+
+                # 2. Run batched Inference on the process pool, without waiting for it
+                frame_tasks: List[FrameTask] = [t for _, t in entries if t is not None]
+                logger.info(f"Submitting batch of {len(frame_tasks)} frames")
+                inflight.append((entries, asyncio.ensure_future(engine.process_batch(frame_tasks))))
+
+            # Hand finished batches to the writer; wait for one to finish
+            # when the pipeline is full or there is nothing new to submit
+            if inflight and (len(inflight) >= MAX_INFLIGHT_BATCHES or not batch):
+                await asyncio.wait([inference for _, inference in inflight], return_when=asyncio.FIRST_COMPLETED)
+            for entry in [e for e in inflight if e[1].done()]:
+                await drain(entry)
+
+            await writer.flush_if_due()
+            FRAMES_IN_FLIGHT.set(sum(len(entries) for entries, _ in inflight) + len(writer))
+
+        except InferenceError as e:
+            # The failed batch's messages stay unacknowledged, holding back their partitions'
+            # commits: stop and let them be redelivered after a restart
+            logger.error(f"{e}. Stopping worker.")
+            failed = True
+            break
         except Exception as e:
             logger.error(f"Error in worker loop: {e}")
             await asyncio.sleep(1)
 
     logger.info("Inference worker shutting down.")
-    await consumer.stop()
-    executor.shutdown(wait=True)
+    # Save what the other batches in flight detected; only failed batches are left uncommitted
+    while inflight:
+        try:
+            await drain(inflight[0])
+        except InferenceError as e:
+            logger.error(f"{e}. Leaving its frames uncommitted.")
+            failed = True
+    await writer.flush()
+    FRAMES_IN_FLIGHT.set(0)
+    return failed
 
 if __name__ == "__main__":
     asyncio.run(main())
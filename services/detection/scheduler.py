@@ -0,0 +1,122 @@
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Set, Tuple
+
+from shared.metrics import SCHEDULED_FRAMES
+from shared.mq import KafkaConsumer, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+class FairScheduler:
+    """
+    Decides which fetched frame tasks go into the next inference batch.
+
+    Frame tasks of each priority class come from their own topics (`topics` maps a class to
+    its topic) and are buffered per video. Batches are filled one frame at a time: the class
+    is picked by weighted fair queueing, so while several classes have work each gets frames
+    in proportion to its weight (a class that was idle earns no credit for it), and within
+    a class the videos take turns. Frames of one video keep their order, as tracking needs.
+
+    Each class is topped up from its own topics to at most `max_buffered` frames, so a bulk
+    backlog never keeps interactive frames from being fetched, and it can look that far past
+    a long video in a shared partition. Buffered frames are fetched but not acknowledged, so
+    the consumer never commits past them; those of revoked partitions are released at once
+    instead of holding up the rebalance.
+    """
+    def __init__(self, consumer: KafkaConsumer, topics: Mapping[str, str], weights: Mapping[str, float],
+                 max_buffered: int = 256) -> None:
+        self.consumer: KafkaConsumer = consumer
+        self.topics: Dict[str, str] = dict(topics)
+        self.classes: Dict[str, str] = {topic: priority for priority, topic in self.topics.items()}
+        self.weights: Dict[str, float] = {priority: max(weights.get(priority, 1.0), 1e-3) for priority in self.topics}
+        self.max_buffered: int = max_buffered
+        # Per class: videos in turn order, and each video's frames in fetch order
+        self._turns: Dict[str, Deque[str]] = {priority: deque() for priority in self.topics}
+        self._frames: Dict[str, Dict[str, Deque[Tuple[Any, Dict[str, Any]]]]] = {priority: {} for priority in self.topics}
+        self._buffered: Dict[str, int] = {priority: 0 for priority in self.topics}
+        # Virtual time: each class's next turn, and the turn last served
+        self._pass: Dict[str, float] = {priority: 0.0 for priority in self.topics}
+        self._clock: float = 0.0
+        consumer.revoke_listeners.append(self.drop)
+
+    def __len__(self) -> int:
+        return sum(self._buffered.values())
+
+    def add(self, message: Any, data: Dict[str, Any]) -> None:
+        priority: str = self.classes.get(message.topic) or next(iter(self.topics))
+        video_id: str = str(data.get("video_id", "")) if isinstance(data, dict) else ""
+        if not self._buffered[priority]:
+            # A class that was idle rejoins at the current virtual time instead of catching up
+            self._pass[priority] = max(self._pass[priority], self._clock)
+        frames: Optional[Deque[Tuple[Any, Dict[str, Any]]]] = self._frames[priority].get(video_id)
+        if frames is None:
+            frames = self._frames[priority][video_id] = deque()
+            self._turns[priority].append(video_id)
+        frames.append((message, data))
+        self._buffered[priority] += 1
+
+    def take(self, max_records: int) -> List[Tuple[Any, Dict[str, Any]]]:
+        """Removes and returns up to `max_records` buffered frames, in scheduling order."""
+        batch: List[Tuple[Any, Dict[str, Any]]] = []
+        while len(batch) < max_records:
+            active: List[str] = [p for p in self.topics if self._buffered[p]]
+            if not active:
+                break
+            # Ties go to the class listed first (the most urgent)
+            priority: str = min(active, key=lambda p: self._pass[p])
+            self._clock = self._pass[priority]
+            self._pass[priority] += 1 / self.weights[priority]
+
+            turns: Deque[str] = self._turns[priority]
+            video_id: str = turns.popleft()
+            frames: Deque[Tuple[Any, Dict[str, Any]]] = self._frames[priority][video_id]
+            batch.append(frames.popleft())
+            self._buffered[priority] -= 1
+            if frames:
+                turns.append(video_id)
+            else:
+                del self._frames[priority][video_id]
+        return batch
+
+    def drop(self, partitions: Set[TopicPartition]) -> None:
+        """Releases the buffered frames of `partitions` back to the consumer (e.g. when they are revoked)."""
+        dropped: List[Any] = []
+        for priority, videos in self._frames.items():
+            for video_id, frames in list(videos.items()):
+                kept: Deque[Tuple[Any, Dict[str, Any]]] = deque()
+                for message, data in frames:
+                    if TopicPartition(message.topic, message.partition) in partitions:
+                        dropped.append(message)
+                    else:
+                        kept.append((message, data))
+                self._buffered[priority] -= len(frames) - len(kept)
+                if kept:
+                    videos[video_id] = kept
+                else:
+                    del videos[video_id]
+                    self._turns[priority].remove(video_id)
+        if dropped:
+            self.consumer.release(dropped)
+            logger.info(f"Released {len(dropped)} buffered frame tasks of revoked partitions")
+
+    async def fill(self, wanted: int, timeout_ms: int) -> None:
+        """
+        Fetches new frame tasks. Waits up to `timeout_ms` for `wanted` frames to be buffered,
+        then tops every class up from its own topics without waiting.
+        """
+        if len(self) < wanted:
+            for message, data in await self.consumer.get_batch(wanted - len(self), timeout_ms):
+                self.add(message, data)
+        for priority, topic in self.topics.items():
+            room: int = self.max_buffered - self._buffered[priority]
+            if room > 0:
+                for message, data in await self.consumer.get_batch(room, 0, topics=(topic,)):
+                    self.add(message, data)
+
+    async def get_batch(self, max_records: int, timeout_ms: int) -> List[Tuple[Any, Dict[str, Any]]]:
+        """Like KafkaConsumer.get_batch, but across videos and priority classes in scheduling order."""
+        await self.fill(max_records, timeout_ms)
+        batch: List[Tuple[Any, Dict[str, Any]]] = self.take(max_records)
+        for priority, count in self._buffered.items():
+            SCHEDULED_FRAMES.labels(priority).set(count)
+        return batch
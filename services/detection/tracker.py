@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+# Pyramidal Lucas-Kanade optical flow
+LK_PARAMS: dict = dict(winSize=(15, 15), maxLevel=3,
+                       criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+# Points tracked per box (GRID x GRID)
+GRID: int = 6
+# Points whose forward-backward flow error exceeds this (in pixels) are unreliable
+MAX_FB_ERROR: float = 1.0
+# A box with fewer reliable points is lost
+MIN_POINTS: int = 4
+# Flow is computed on frames downscaled to at most this width
+MAX_WIDTH: int = 640
+
+def tracking_image(img: Any) -> Tuple[Any, float]:
+    """Grayscale, downscaled copy of a frame for optical flow, and the scale factor applied."""
+    gray: Any = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    factor: float = min(1.0, MAX_WIDTH / gray.shape[1])
+    if factor < 1.0:
+        gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return gray, factor
+
+def track_boxes(prev: Any, curr: Any, boxes: Any) -> Tuple[Any, Any]:
+    """
+    Median-flow tracking: moves each [x1, y1, x2, y2] box (pixels of `prev`) by the median
+    displacement of a grid of points inside it, and scales it by the median change of their
+    pairwise distances. Points are checked by tracking them back to `prev`.
+    Returns (boxes, quality), quality being the fraction of reliable points per box (0 when lost).
+    """
+    n: int = len(boxes)
+    if n == 0:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+    steps: Any = (np.arange(GRID, dtype=np.float32) + 0.5) / GRID
+    fx, fy = (a.ravel() for a in np.meshgrid(steps, steps))
+    px: Any = boxes[:, 0:1] + (boxes[:, 2:3] - boxes[:, 0:1]) * fx
+    py: Any = boxes[:, 1:2] + (boxes[:, 3:4] - boxes[:, 1:2]) * fy
+    points: Any = np.stack([px, py], axis=-1).reshape(-1, 1, 2).astype(np.float32)
+
+    moved, status, _ = cv2.calcOpticalFlowPyrLK(prev, curr, points, None, **LK_PARAMS)
+    back, back_status, _ = cv2.calcOpticalFlowPyrLK(curr, prev, moved, None, **LK_PARAMS)
+    error: Any = np.linalg.norm((back - points).reshape(-1, 2), axis=1)
+    good: Any = ((status.ravel() == 1) & (back_status.ravel() == 1) & (error < MAX_FB_ERROR)).reshape(n, -1)
+    points, moved = points.reshape(n, -1, 2), moved.reshape(n, -1, 2)
+
+    out: Any = boxes.astype(np.float32).copy()
+    quality: Any = np.zeros(n, dtype=np.float32)
+    for i in range(n):
+        p0, p1 = points[i][good[i]], moved[i][good[i]]
+        if len(p0) < MIN_POINTS:
+            continue
+        shift: Any = np.median(p1 - p0, axis=0)
+        a, b = np.triu_indices(len(p0), 1)
+        d0: Any = np.linalg.norm(p0[a] - p0[b], axis=1)
+        d1: Any = np.linalg.norm(p1[a] - p1[b], axis=1)
+        valid: Any = d0 > 1e-3
+        scale: float = float(np.median(d1[valid] / d0[valid])) if valid.any() else 1.0
+
+        x1, y1, x2, y2 = boxes[i]
+        cx, cy = (x1 + x2) / 2 + shift[0], (y1 + y2) / 2 + shift[1]
+        half_w, half_h = (x2 - x1) * scale / 2, (y2 - y1) * scale / 2
+        out[i] = (cx - half_w, cy - half_h, cx + half_w, cy + half_h)
+        quality[i] = good[i].mean()
+    return out, quality
+
+class Track:
+    """Tracking state of one video segment: the last frame seen and the boxes on it."""
+    __slots__ = ("frames", "last_index", "gray", "factor", "boxes", "labels", "keyframe")
+
+    def __init__(self) -> None:
+        self.frames: int = 0 # Frames scheduled since the chain started
+        self.last_index: int = -1 # Last frame index scheduled
+        self.gray: Any = None # Tracking image of the last frame processed
+        self.factor: float = 1.0
+        self.boxes: Any = np.zeros((0, 4), dtype=np.float32) # In pixels of the full frame
+        self.labels: List[Any] = [] # Opaque per-box data (class and confidence), carried along
+        self.keyframe: Optional[str] = None # "<video_id>:<frame_index>" the boxes were detected on
+
+class FrameTracker:
+    """
+    Detect-and-track scheduling for the frames of each video.
+
+    Every `detect_every`-th frame of a video segment is a keyframe that goes
+    through the model; on the frames in between the keyframe's boxes are
+    followed with optical flow. Frames are tracked per (video, segment)
+    because the segments of a split video are published concurrently, each
+    in order. A frame that does not follow the previous one of its segment
+    (e.g. a redelivery) starts over with a keyframe.
+    """
+    def __init__(self, detect_every: int = 1, min_confidence: float = 0.5, max_tracks: int = 64) -> None:
+        self.detect_every: int = detect_every
+        # Below this mean box quality, a tracked frame is detected instead
+        self.min_confidence: float = min_confidence
+        self.max_tracks: int = max_tracks
+        self._tracks: "OrderedDict[Tuple[str, int], Track]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.detect_every > 1
+
+    def _track(self, key: Tuple[str, int]) -> Track:
+        track = self._tracks.get(key)
+        if track is None:
+            track = self._tracks[key] = Track()
+            while len(self._tracks) > self.max_tracks:
+                self._tracks.popitem(last=False)
+        self._tracks.move_to_end(key)
+        return track
+
+    def due(self, video_id: str, segment_index: int, frame_index: int) -> bool:
+        """Whether this frame is a keyframe. Call once per frame, in arrival order."""
+        track: Track = self._track((video_id, segment_index))
+        if frame_index <= track.last_index:
+            track.frames = 0
+            track.gray = None
+        track.last_index = frame_index
+        track.frames += 1
+        return (track.frames - 1) % self.detect_every == 0
+
+    def reset(self, video_id: str, segment_index: int, img: Any, boxes: Any, labels: List[Any], keyframe: str) -> None:
+        """Records a detected frame and its boxes (pixels) as the starting point for tracking."""
+        track: Track = self._track((video_id, segment_index))
+        track.gray, track.factor = tracking_image(img)
+        track.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        track.labels = list(labels)
+        track.keyframe = keyframe
+
+    def advance(self, video_id: str, segment_index: int, img: Any) -> Optional[Tuple[Any, List[Any], float, str]]:
+        """
+        Tracks the boxes of the previous frame onto `img`.
+        Returns (boxes, labels, confidence, keyframe) for the boxes still in view, or None
+        if there is nothing to track from. Confidence is the mean box quality (1 without boxes).
+        """
+        track = self._tracks.get((video_id, segment_index))
+        if track is None or track.gray is None:
+            return None
+
+        gray, factor = tracking_image(img)
+        if gray.shape != track.gray.shape:
+            return None
+        moved, quality = track_boxes(track.gray, gray, track.boxes * track.factor)
+        moved /= factor
+        confidence: float = float(quality.mean()) if len(quality) else 1.0
+
+        height, width = img.shape[:2]
+        clipped: Any = moved.copy()
+        clipped[:, [0, 2]] = clipped[:, [0, 2]].clip(0, width)
+        clipped[:, [1, 3]] = clipped[:, [1, 3]].clip(0, height)
+        area: Any = (moved[:, 2] - moved[:, 0]) * (moved[:, 3] - moved[:, 1])
+        visible: Any = (clipped[:, 2] - clipped[:, 0]) * (clipped[:, 3] - clipped[:, 1])
+        # Lost boxes and boxes mostly out of the frame are dropped
+        keep: Any = (quality > 0) & (visible > 0.5 * np.maximum(area, 1e-6))
+
+        track.gray, track.factor = gray, factor
+        track.boxes = clipped[keep]
+        track.labels = [label for label, k in zip(track.labels, keep) if k]
+        return track.boxes, track.labels, confidence, track.keyframe
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from shared.analytics import record_detections
+from shared.database import RESULTS_CHANNEL, AsyncSessionLocal, notify_inserted
+from shared.metrics import DB_WRITE_SECONDS, END_TO_END_SECONDS, now
+from shared.models import DetectionResult
+from shared.mq import KafkaConsumer
+
+logger = logging.getLogger(__name__)
+
+class ResultWriter:
+    """
+    Write-behind buffer for detection results.
+
+    Rows are accumulated in memory and flushed as a single multi-row INSERT once
+    `max_rows` are pending or `max_interval_ms` has passed since the oldest one.
+    The Kafka offsets of the buffered messages are committed only after the
+    covering flush succeeds, so a crash can cause redelivery but never loss.
+    """
+    def __init__(self, consumer: KafkaConsumer, max_rows: int = 200, max_interval_ms: int = 1000) -> None:
+        self.consumer: KafkaConsumer = consumer
+        self.max_rows: int = max_rows
+        self.max_interval: float = max_interval_ms / 1000
+        self._rows: List[Dict[str, Any]] = []
+        self._messages: List[Any] = []
+        # Upload times (and priority classes) of the buffered rows' videos, for end-to-end latency once they are committed
+        self._uploaded_at: List[Tuple[float, str]] = []
+        self._oldest: Optional[float] = None
+        self._retry_at: float = 0.0
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    async def add(self, message: Any, row: Optional[Dict[str, Any]] = None, uploaded_at: Optional[float] = None,
+                  priority: str = "normal") -> None:
+        """
+        Buffers a result row together with the message it came from.
+        Messages without a row (invalid or corrupt tasks) are only acknowledged.
+        """
+        if row is not None:
+            self._rows.append(row)
+            if uploaded_at is not None:
+                self._uploaded_at.append((uploaded_at, priority))
+        self._messages.append(message)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+        if len(self._rows) >= self.max_rows and time.monotonic() >= self._retry_at:
+            await self.flush()
+
+    async def flush_if_due(self) -> None:
+        now: float = time.monotonic()
+        if self._oldest is not None and now - self._oldest >= self.max_interval and now >= self._retry_at:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes all buffered rows in one transaction, then commits their offsets.
+        On a database error the buffer is kept and the flush is retried later.
+        """
+        async with self._lock:
+            if not self._messages:
+                return
+
+            # Swap the buffers out so rows added while we are writing are kept for the next flush
+            rows: List[Dict[str, Any]] = self._rows
+            messages: List[Any] = self._messages
+            uploaded_at: List[Tuple[float, str]] = self._uploaded_at
+            oldest: Optional[float] = self._oldest
+            self._rows = []
+            self._messages = []
+            self._uploaded_at = []
+            self._oldest = None
+
+            if rows:
+                started: float = time.monotonic()
+                try:
+                    async with AsyncSessionLocal() as session:
+                        # Ids come back in row order, so objects and rollups are attributed to the right row
+                        result = await session.execute(
+                            insert(DetectionResult).returning(DetectionResult.id, sort_by_parameter_order=True), rows
+                        )
+                        ids: List[int] = list(result.scalars().all())
+                        # Per-object rows and class rollups, committed with the results
+                        await record_detections(session, rows, ids)
+                        # Wakes the dashboard feed (services/ingestion/feed.py) once the rows are committed
+                        await notify_inserted(session, RESULTS_CHANNEL, ids)
+                        await session.commit()
+                except Exception as e:
+                    logger.error(f"Failed to flush {len(rows)} detection results, will retry: {e}")
+                    self._rows = rows + self._rows
+                    self._messages = messages + self._messages
+                    self._uploaded_at = uploaded_at + self._uploaded_at
+                    self._oldest = oldest
+                    # Back off for a full interval before the next attempt
+                    self._retry_at = time.monotonic() + self.max_interval
+                    return
+                DB_WRITE_SECONDS.observe(time.monotonic() - started)
+                committed_at: float = now()
+                for upload_time, priority in uploaded_at:
+                    END_TO_END_SECONDS.labels(priority).observe(committed_at - upload_time)
+
+            await self.consumer.acknowledge_many(messages)
+            logger.info(f"Flushed {len(rows)} detection results ({len(messages)} messages acknowledged)")
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.future import select
+
+from shared.database import RESULTS_CHANNEL, AsyncSessionLocal, engine, parse_id_ranges
+from shared.models import DetectionResult
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    """One connected dashboard. Receives batches of serialized rows; None means reconnect."""
+    __slots__ = ("queue",)
+
+    def __init__(self, max_pending: int) -> None:
+        self.queue: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue(maxsize=max_pending)
+
+class ResultFeed:
+    """
+    Fans new detection rows out to every connected dashboard.
+
+    A single background task waits for NOTIFYs from the detection writer (see
+    shared.database.notify_inserted), loads the announced rows once and
+    pushes them to all subscribers, so the database cost does not grow with
+    the number of open dashboards. Without LISTEN support (or if notifications
+    are missed) it falls back to polling for rows with a higher id than it
+    has seen, every `poll_interval_sec`.
+    """
+    # Ids already pushed, so a catch-up poll does not resend rows that arrived by NOTIFY
+    RECENT_IDS: int = 10000
+    # Rows loaded per pass
+    MAX_FETCH: int = 1000
+
+    def __init__(self, serialize: Callable[[DetectionResult], Dict[str, Any]],
+                 poll_interval_sec: float = 30, max_pending: int = 64) -> None:
+        self.serialize: Callable[[DetectionResult], Dict[str, Any]] = serialize
+        self.poll_interval_sec: float = poll_interval_sec
+        self.max_pending: int = max_pending
+        self._subscribers: Set[Subscriber] = set()
+        self._pending: List[Tuple[int, int]] = []
+        self._catch_up: bool = False
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._last_id: int = 0
+        self._recent: Deque[int] = deque()
+        self._recent_set: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._listener: Any = None # SQLAlchemy connection held for LISTEN
+        self._driver: Any = None # Its asyncpg connection
+
+    async def start(self) -> None:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(func.max(DetectionResult.id)))
+            self._last_id = result.scalar() or 0
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._unlisten()
+        for subscriber in self._subscribers:
+            self._close(subscriber)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.max_pending)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    async def backfill(self, after_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Rows newer than `after_id` (at most the latest `limit`), oldest first, for a reconnecting client."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(DetectionResult)
+                .where(DetectionResult.id > after_id)
+                .order_by(DetectionResult.id.desc())
+                .limit(limit)
+            )
+            rows: List[DetectionResult] = list(result.scalars().all())
+        return [self.serialize(d) for d in reversed(rows)]
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        ranges: List[Tuple[int, int]] = parse_id_ranges(payload)
+        if ranges:
+            self._pending.extend(ranges)
+        else:
+            self._catch_up = True
+        self._wakeup.set()
+
+    async def _listen(self) -> bool:
+        """Starts LISTENing on a dedicated asyncpg connection. Returns False when not on Postgres."""
+        if engine.dialect.name != "postgresql":
+            return False
+        if self._driver is not None and not self._driver.is_closed():
+            return True
+        await self._unlisten()
+        self._listener = await engine.connect()
+        raw: Any = await self._listener.get_raw_connection()
+        self._driver = raw.driver_connection
+        await self._driver.add_listener(RESULTS_CHANNEL, self._on_notify)
+        # Rows committed while we were not listening
+        self._catch_up = True
+        logger.info(f"Listening for new detections on '{RESULTS_CHANNEL}'")
+        return True
+
+    async def _unlisten(self) -> None:
+        if self._listener is not None:
+            try:
+                await self._listener.invalidate()
+                await self._listener.close()
+            except Exception:
+                pass
+            self._listener = None
+            self._driver = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                listening: bool = await self._listen()
+            except Exception as e:
+                logger.warning(f"Cannot LISTEN for new detections, polling instead: {e}")
+                await self._unlisten()
+                listening = False
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_sec if listening else min(self.poll_interval_sec, 2))
+            except asyncio.TimeoutError:
+                # Periodic catch-up covers notifications lost with a dropped connection
+                self._catch_up = True
+            self._wakeup.clear()
+
+            try:
+                if self._subscribers:
+                    self._publish(await self._fetch())
+                else:
+                    await self._skip()
+            except Exception as e:
+                logger.error(f"Failed to load new detections for the live feed: {e}")
+                self._catch_up = True
+                await asyncio.sleep(1)
+
+    async def _skip(self) -> None:
+        """Nobody to push to: only advance past new rows, without loading them."""
+        ranges: List[Tuple[int, int]] = self._pending
+        catch_up: bool = self._catch_up
+        self._pending = []
+        self._catch_up = False
+
+        if ranges:
+            self._last_id = max(self._last_id, max(last for _, last in ranges))
+        if catch_up:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(func.max(DetectionResult.id)))
+                self._last_id = max(self._last_id, result.scalar() or 0)
+
+    async def _fetch(self) -> List[DetectionResult]:
+        ranges: List[Tuple[int, int]] = self._pending
+        catch_up: bool = self._catch_up
+        self._pending = []
+        self._catch_up = False
+
+        conditions: List[Any] = [DetectionResult.id.between(first, last) for first, last in ranges]
+        if catch_up:
+            conditions.append(DetectionResult.id > self._last_id)
+        if not conditions:
+            return []
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(DetectionResult).where(or_(*conditions)).order_by(DetectionResult.id).limit(self.MAX_FETCH)
+            )
+            rows: List[DetectionResult] = list(result.scalars().all())
+        if len(rows) == self.MAX_FETCH:
+            # More left; pick them up on the next pass
+            self._pending.extend(ranges)
+            self._catch_up = True
+            self._wakeup.set()
+        return rows
+
+    def _publish(self, rows: List[DetectionResult]) -> None:
+        fresh: List[DetectionResult] = [d for d in rows if d.id not in self._recent_set]
+        if not fresh:
+            return
+        for d in fresh:
+            self._recent.append(d.id)
+            self._recent_set.add(d.id)
+            if len(self._recent) > self.RECENT_IDS:
+                self._recent_set.discard(self._recent.popleft())
+        self._last_id = max(self._last_id, fresh[-1].id)
+
+        batch: List[Dict[str, Any]] = [self.serialize(d) for d in fresh]
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                # Too slow to keep up: disconnect it; it resumes from its last event id
+                logger.warning("Dropping a live feed subscriber that fell behind")
+                self._subscribers.discard(subscriber)
+                self._close(subscriber)
+
+    def _close(self, subscriber: Subscriber) -> None:
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
@@ -1,18 +1,32 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, List, Any, Optional
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
 import uuid
 import logging
 import os
+import time
+import cv2
+import numpy as np
+from pydantic import ValidationError
 from sqlalchemy.future import select
 
-from shared.storage import FileSystemStorage
-from shared.mq import KafkaProducer
+from shared.storage import UPLOAD_CHUNK_SIZE, FileSystemStorage, PackedFrameStorage, SavedVideo, create_storage
+from shared.mq import KafkaProducer, priority_topic
 from shared.database import init_db, AsyncSessionLocal
 from shared.models import DetectionResult
-from shared.schemas import VideoTask
+from shared.analytics import class_counts, class_timeline, find_objects
+from shared.registry import resolve_video_id
+from shared import metrics
+from shared.metrics import new_trace_id
+from shared.retention import AccessLog
+from shared.schemas import Priority, SamplingOptions, VideoTask
+from feed import ResultFeed, Subscriber
+from thumbnails import ThumbnailCache, pick_width, render_etag, render_frame
+from uploads import ResumableUploads, UploadOffsetError, UploadSession
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,17 +35,32 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="Video Ingestion & Analytics Service")
 
 # Initialize Singletons
-storage: FileSystemStorage = FileSystemStorage()
+storage: FileSystemStorage = create_storage()
+# Frames are also served from archive packs written by the frame lifecycle (shared.retention), whatever FRAME_STORE is
+packs: PackedFrameStorage = storage if isinstance(storage, PackedFrameStorage) else PackedFrameStorage(storage.base_path)
+# Archives the dashboard reads from, so the least recently viewed ones are evicted first
+frame_accesses: AccessLog = AccessLog()
+frame_access_task: Optional[asyncio.Task] = None
 # Topic for initial video uploads
 producer: KafkaProducer = KafkaProducer(topic="video-uploads")
+# Chunked uploads; partial files idle for longer than this are deleted
+UPLOAD_SESSION_TTL_SEC: float = float(os.getenv("UPLOAD_SESSION_TTL_SEC", "86400"))
+uploads: ResumableUploads = ResumableUploads(storage, ttl_sec=UPLOAD_SESSION_TTL_SEC)
 
 # Dashboard Setup
 FRAME_STORAGE_PATH: str = os.getenv("FRAME_STORAGE_PATH", "/data/frames")
-if os.path.exists(FRAME_STORAGE_PATH):
-    app.mount("/frames", StaticFiles(directory=FRAME_STORAGE_PATH), name="frames")
-else:
+if not os.path.exists(FRAME_STORAGE_PATH):
     logger.warning(f"Frame storage path {FRAME_STORAGE_PATH} does not exist.")
 
+# Downscaled (and optionally annotated) frames for the dashboard, rendered on demand and cached on disk
+THUMBNAIL_WIDTHS: List[int] = [int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "160,320,640").split(",")]
+# Width of the result card images
+THUMBNAIL_CARD_WIDTH: int = int(os.getenv("THUMBNAIL_CARD_WIDTH", "320"))
+THUMBNAIL_JPEG_QUALITY: int = int(os.getenv("THUMBNAIL_JPEG_QUALITY", "80"))
+THUMBNAIL_CACHE_MB: int = int(os.getenv("THUMBNAIL_CACHE_MB", "512"))
+THUMBNAIL_MAX_AGE_SEC: int = int(os.getenv("THUMBNAIL_MAX_AGE_SEC", "86400"))
+thumbnails: ThumbnailCache = ThumbnailCache(os.path.join(storage.base_path, "thumbnails"), THUMBNAIL_CACHE_MB * 1024 * 1024)
+
 current_dir: str = os.path.dirname(os.path.abspath(__file__))
 templates: Jinja2Templates = Jinja2Templates(directory=os.path.join(current_dir, "templates"))
 
@@ -42,19 +71,76 @@ async def startup_event() -> None:
     # 2. Initialize Database
     logger.info("Initializing database...")
     await init_db()
+    # 3. Start the live results feed
+    await feed.start()
+    # 4. Periodically record which frame archives were viewed
+    global frame_access_task
+    frame_access_task = asyncio.create_task(frame_accesses.run())
 
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
+    if frame_access_task is not None:
+        frame_access_task.cancel()
+    await frame_accesses.flush()
+    await feed.stop()
     await producer.stop()
 
 # --- Upload Endpoints ---
 
+def sampling_options(
+    sampling_mode: Optional[str] = None,
+    sample_rate_sec: Optional[float] = None,
+    min_interval_sec: Optional[float] = None,
+    max_interval_sec: Optional[float] = None,
+    scene_threshold: Optional[float] = None
+) -> Optional[SamplingOptions]:
+    """
+    Per-job sampling overrides from query parameters, e.g. ?sampling_mode=adaptive&max_interval_sec=10.
+    """
+    values: Dict[str, Any] = {
+        "mode": sampling_mode,
+        "sample_rate_sec": sample_rate_sec,
+        "min_interval_sec": min_interval_sec,
+        "max_interval_sec": max_interval_sec,
+        "scene_threshold": scene_threshold
+    }
+    values = {k: v for k, v in values.items() if v is not None}
+    if not values:
+        return None
+    try:
+        return SamplingOptions(**values)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+
+async def publish_video(video_id: str, saved: SavedVideo, sampling: Optional[SamplingOptions] = None,
+                        priority: Priority = "normal") -> Dict[str, str]:
+    trace_id: str = new_trace_id()
+    task = VideoTask(video_id=video_id, video_path=saved.path, video_hash=saved.sha256, video_size=saved.size,
+                     sampling=sampling, trace_id=trace_id, uploaded_at=metrics.now(), priority=priority)
+    # Each priority class has its own topics, consumed with their own capacity downstream
+    topic: str = priority_topic(producer.topic, priority)
+    await producer.publish(task, topic)
+
+    logger.info(f"Video {video_id} saved ({saved.size} bytes) and published to '{topic}' (trace {trace_id})")
+
+    return {
+        "video_id": video_id,
+        "trace_id": trace_id,
+        "priority": priority,
+        "status": "published",
+        "message": "Video received and queued for processing"
+    }
+
 @app.post("/upload")
 async def upload_video(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    sampling: Optional[SamplingOptions] = Depends(sampling_options),
+    priority: Priority = "normal"
 ) -> Dict[str, str]:
     """
-    Upload a video file for processing.
+    Upload a video file for processing. `priority` (interactive, normal or bulk) sets how its
+    frames are scheduled against other uploads', e.g. ?priority=interactive for short clips
+    someone is waiting on.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
@@ -63,30 +149,243 @@ async def upload_video(
     logger.info(f"Receiving upload: {file.filename} (ID: {video_id})")
     
     try:
-        # 1. Save video first
-        video_path: str = await storage.save_video(file, video_id)
+        # 1. Save video first (streamed off the event loop, hashed while writing)
+        started: float = time.monotonic()
+        saved: SavedVideo = await storage.save_video(file, video_id)
+        metrics.UPLOAD_SECONDS.observe(time.monotonic() - started)
+        metrics.UPLOAD_BYTES.inc(saved.size)
         
         # 2. Publish Task to Kafka
-        task = VideoTask(video_id=video_id, video_path=video_path)
-        await producer.publish(task)
-        
-        logger.info(f"Video {video_id} saved and published to 'video-uploads'")
-        
-        return {
-            "video_id": video_id, 
-            "status": "published",
-            "message": "Video received and queued for processing"
-        }
+        return await publish_video(video_id, saved, sampling, priority)
     except Exception as e:
         logger.error(f"Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Resumable uploads: POST /uploads, then PUT chunks at ?offset=<bytes received>,
+# GET the current offset after a dropped connection, and POST .../complete.
+
+async def get_upload_session(upload_id: str) -> UploadSession:
+    session: Optional[UploadSession] = await uploads.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+def upload_status(session: UploadSession) -> Dict[str, Any]:
+    return {"upload_id": session.upload_id, "offset": session.offset}
+
+@app.post("/uploads")
+def create_upload() -> Dict[str, Any]:
+    """
+    Start a chunked upload. The returned upload_id becomes the video_id.
+    """
+    session: UploadSession = uploads.create()
+    logger.info(f"Started chunked upload {session.upload_id}")
+    return {**upload_status(session), "chunk_size": UPLOAD_CHUNK_SIZE}
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str) -> Dict[str, Any]:
+    """
+    Bytes received so far; the next chunk must start at this offset.
+    """
+    return upload_status(await get_upload_session(upload_id))
+
+@app.put("/uploads/{upload_id}")
+async def append_upload(upload_id: str, offset: int, request: Request) -> Dict[str, Any]:
+    """
+    Append the raw request body to the upload at `offset`.
+    """
+    session: UploadSession = await get_upload_session(upload_id)
+    started: float = time.monotonic()
+    try:
+        await uploads.append(session, offset, request.stream())
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    finally:
+        # Partially received chunks are kept, so they count too
+        metrics.UPLOAD_BYTES.inc(max(session.offset - offset, 0))
+    metrics.UPLOAD_SECONDS.observe(time.monotonic() - started)
+    return upload_status(session)
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, size: Optional[int] = None, sha256: Optional[str] = None,
+                          sampling: Optional[SamplingOptions] = Depends(sampling_options),
+                          priority: Priority = "normal") -> Dict[str, str]:
+    """
+    Finish a chunked upload and queue it for processing.
+    Optional `size` and `sha256` are checked against what was received.
+    """
+    session: UploadSession = await get_upload_session(upload_id)
+    if size is not None and size != session.offset:
+        raise HTTPException(status_code=409, detail={"message": f"Received {session.offset} of {size} bytes", "offset": session.offset})
+    if sha256 is not None and sha256.lower() != session.hasher.hexdigest():
+        raise HTTPException(status_code=422, detail="SHA256 mismatch")
+
+    try:
+        saved: SavedVideo = await uploads.complete(session)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        return await publish_video(session.upload_id, saved, sampling, priority)
+    except Exception as e:
+        logger.error(f"Upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str) -> Dict[str, str]:
+    session: UploadSession = await get_upload_session(upload_id)
+    await uploads.abort(session)
+    return {"upload_id": session.upload_id, "status": "aborted"}
+
 # --- Dashboard Endpoints ---
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard_root(request: Request) -> HTMLResponse:
     return templates.TemplateResponse("index.html", {"request": request})
 
+def frame_url(frame_path: Optional[str], letterbox: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Converts a frame reference to a URL path for the frontend: /frames/<video_id>/<frame_idx>.jpg
+    Letterboxed frames get the area to crop out of the padded frame (and the size of raw frames).
+    None for frames deleted by the frame lifecycle.
+    """
+    if frame_path is None:
+        return None
+    location = PackedFrameStorage.parse_reference(frame_path)
+    if location is not None:
+        video_id, frame_id, _, _ = location
+        url: str = f"/frames/{video_id}/{frame_id}.jpg"
+    else:
+        # Expecting path like /data/frames/video_id/frame_idx.jpg
+        url = f"/frames/{os.path.basename(os.path.dirname(frame_path))}/{os.path.basename(frame_path)}"
+
+    if letterbox:
+        width: int = round(letterbox["width"] * letterbox["scale"])
+        height: int = round(letterbox["height"] * letterbox["scale"])
+        url += f"?crop={letterbox['pad_x']},{letterbox['pad_y']},{width},{height}"
+        if letterbox.get("raw"):
+            url += f"&raw={letterbox['size']}"
+    return url
+
+def read_stored_frame(video_id: str, filename: str) -> Optional[Any]:
+    file_path: str = os.path.join(FRAME_STORAGE_PATH, video_id, filename)
+    if os.path.isfile(file_path):
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    stem, _ = os.path.splitext(filename)
+    if stem.isdigit():
+        reference = packs.lookup(video_id, int(stem))
+        if reference is not None:
+            frame_accesses.record(video_id)
+            return packs.read_frame(reference)
+    return None
+
+@app.get("/frames/{video_id}/{filename}")
+def get_frame(video_id: str, filename: str, crop: Optional[str] = None, raw: Optional[int] = None) -> Response:
+    """
+    Serves a frame, either as a standalone file or sliced out of the video's frame pack.
+    Frames letterboxed at extraction are cropped back to the picture (`crop=x,y,w,h`);
+    `raw=<size>` marks frames stored as raw size x size pixels, which are encoded to JPEG here.
+    """
+    if video_id != os.path.basename(video_id) or filename != os.path.basename(filename) or ".." in (video_id, filename):
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    if crop is None and raw is None:
+        file_path: str = os.path.join(FRAME_STORAGE_PATH, video_id, filename)
+        if os.path.isfile(file_path):
+            return FileResponse(file_path, media_type="image/jpeg")
+
+    data = read_stored_frame(video_id, filename)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Frame not found")
+    if crop is None and raw is None:
+        return Response(content=bytes(data), media_type="image/jpeg")
+
+    if raw is not None:
+        if raw <= 0 or len(data) != raw * raw * 3:
+            raise HTTPException(status_code=422, detail="Frame size does not match raw")
+        img: Any = np.frombuffer(data, dtype=np.uint8).reshape(raw, raw, 3)
+    else:
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise HTTPException(status_code=422, detail="Frame cannot be decoded")
+
+    if crop is not None:
+        try:
+            x, y, w, h = (int(v) for v in crop.split(","))
+        except ValueError:
+            raise HTTPException(status_code=422, detail="crop must be x,y,w,h")
+        img = img[max(y, 0):y + h, max(x, 0):x + w]
+
+    success, buffer = cv2.imencode(".jpg", img)
+    if not success:
+        raise HTTPException(status_code=500, detail="Could not encode frame")
+    return Response(content=buffer.tobytes(), media_type="image/jpeg")
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already covers `etag` (weak or strong, or *)."""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags: List[str] = [t.strip().removeprefix("W/").strip('"') for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+def render_result_image(frame_path: str, letterbox: Optional[Dict[str, Any]], width: int,
+                        detections: Optional[List[Dict[str, Any]]]) -> Optional[bytes]:
+    location = PackedFrameStorage.parse_reference(frame_path)
+    if location is not None:
+        frame_accesses.record(location[0])
+    try:
+        data = packs.read_frame(frame_path)
+    except (OSError, ValueError):
+        return None # Evicted or never written
+    return render_frame(data, letterbox, width, THUMBNAIL_JPEG_QUALITY, detections)
+
+@app.get("/api/results/{result_id}/image")
+async def get_result_image(result_id: int, request: Request, width: Optional[int] = None, annotate: bool = False) -> Response:
+    """
+    The frame of a detection result, downscaled to the nearest of THUMBNAIL_WIDTHS and,
+    with `annotate=true`, with its boxes drawn in. Rendered images are cached on disk under
+    a strong ETag derived from the stored row, so revalidation needs no rendering at all.
+    """
+    async with AsyncSessionLocal() as session:
+        row: Optional[DetectionResult] = await session.get(DetectionResult, result_id)
+    if row is None or row.frame_path is None:
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    size: int = pick_width(width, THUMBNAIL_WIDTHS)
+    detections: Optional[List[Dict[str, Any]]] = (row.detections or []) if annotate else None
+    etag: str = render_etag(row.frame_path, row.letterbox, size, THUMBNAIL_JPEG_QUALITY, detections)
+    headers: Dict[str, str] = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={THUMBNAIL_MAX_AGE_SEC}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    data: Optional[bytes] = await asyncio.to_thread(thumbnails.get, etag)
+    if data is None:
+        data = await asyncio.to_thread(render_result_image, row.frame_path, row.letterbox, size, detections)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Frame not found")
+        await asyncio.to_thread(thumbnails.put, etag, data)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+def serialize_result(d: DetectionResult) -> Dict[str, Any]:
+    return {
+        "id": d.id,
+        "video_id": d.video_id,
+        "frame_index": d.frame_index,
+        "timestamp": d.timestamp.isoformat() if d.timestamp else None,
+        "detections": d.detections,
+        # Boxes propagated from an earlier detected frame rather than detected on this one
+        "tracked": d.tracked_from is not None,
+        # Convert the frame reference to a URL path for the frontend
+        "image_url": frame_url(d.frame_path, d.letterbox),
+        # Small annotated rendering for the result cards
+        "thumbnail_url": f"/api/results/{d.id}/image?width={THUMBNAIL_CARD_WIDTH}&annotate=true"
+        if d.frame_path is not None else None
+    }
+
 @app.get("/api/results")
 async def get_results() -> List[Dict[str, Any]]:
     async with AsyncSessionLocal() as session:
@@ -95,19 +394,135 @@ async def get_results() -> List[Dict[str, Any]]:
         )
         detections: List[DetectionResult] = list(result.scalars().all())
         
-        return [
-            {
-                "id": d.id,
-                "video_id": d.video_id,
-                "frame_index": d.frame_index,
-                "timestamp": d.timestamp.isoformat() if d.timestamp else None,
-                "detections": d.detections,
-                # Convert absolute path to a URL path for the frontend
-                # Expecting path like /data/frames/video_id/frame_idx.jpg
-                "image_url": f"/frames/{os.path.basename(os.path.dirname(d.frame_path))}/{os.path.basename(d.frame_path)}"
-            }
-            for d in detections
-        ]
+        return [serialize_result(d) for d in detections]
+
+# Live feed: new rows are pushed to every open dashboard from one shared query per database NOTIFY
+FEED_POLL_INTERVAL_SEC: float = float(os.getenv("FEED_POLL_INTERVAL_SEC", "30"))
+FEED_KEEPALIVE_SEC: float = 15
+feed: ResultFeed = ResultFeed(serialize_result, poll_interval_sec=FEED_POLL_INTERVAL_SEC)
+
+def sse_event(rows: List[Dict[str, Any]]) -> str:
+    # The last row id lets the browser resume with Last-Event-ID after a reconnect
+    return f"id: {rows[-1]['id']}\nevent: results\ndata: {json.dumps(rows)}\n\n"
+
+@app.get("/api/results/stream")
+async def stream_results(request: Request, after: Optional[int] = None) -> StreamingResponse:
+    """
+    Server-Sent Events stream of new detection rows.
+    Rows newer than `after` (or the Last-Event-ID header on reconnect) are sent first.
+    """
+    last_event_id: Optional[str] = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+
+    async def events() -> AsyncIterator[str]:
+        subscriber: Subscriber = feed.subscribe()
+        try:
+            # Subscribed before backfilling, so nothing falls in between; the client drops repeats by id
+            if after is not None:
+                rows: List[Dict[str, Any]] = await feed.backfill(after)
+                if rows:
+                    yield sse_event(rows)
+            while True:
+                try:
+                    batch: Optional[List[Dict[str, Any]]] = await asyncio.wait_for(subscriber.queue.get(), FEED_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if batch is None:
+                    return
+                yield sse_event(batch)
+        finally:
+            feed.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/videos/{video_id}/results")
+async def get_video_results(video_id: str) -> Dict[str, Any]:
+    """
+    All detections for one upload. Duplicate uploads resolve to the video that was actually processed.
+    """
+    canonical_id: str = await resolve_video_id(video_id)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(DetectionResult)
+            .where(DetectionResult.video_id == canonical_id)
+            .order_by(DetectionResult.frame_index)
+        )
+        detections: List[DetectionResult] = list(result.scalars().all())
+
+    return {
+        "video_id": video_id,
+        "source_video_id": canonical_id,
+        "results": [serialize_result(d) for d in detections]
+    }
+
+# --- Analytics Endpoints (read from detected_objects and class_rollups) ---
+
+@app.get("/api/videos/{video_id}/classes")
+async def get_video_classes(video_id: str) -> Dict[str, Any]:
+    """
+    Object and frame counts per class for one upload.
+    """
+    canonical_id: str = await resolve_video_id(video_id)
+    return {
+        "video_id": video_id,
+        "source_video_id": canonical_id,
+        "classes": await class_counts(canonical_id)
+    }
+
+@app.get("/api/analytics/classes")
+async def get_class_timeline(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    video_id: Optional[str] = None,
+    class_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Counts per time bucket and class between `start` and `end` (default: the last hour).
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    if video_id is not None:
+        video_id = await resolve_video_id(video_id)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "buckets": await class_timeline(start, end, video_id=video_id, class_name=class_name)
+    }
+
+@app.get("/api/objects")
+async def get_objects(
+    class_name: str,
+    min_confidence: float = 0.0,
+    video_id: Optional[str] = None,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """
+    Newest detected objects of a class, e.g. every person with confidence >= 0.8.
+    """
+    if video_id is not None:
+        video_id = await resolve_video_id(video_id)
+    objects = await find_objects(class_name, min_confidence, video_id=video_id, limit=min(max(limit, 1), 1000))
+    return [
+        {
+            "detection_id": obj.detection_id,
+            "video_id": obj.video_id,
+            "frame_index": obj.frame_index,
+            "class": obj.class_name,
+            "confidence": obj.confidence,
+            "bbox": [obj.x1, obj.y1, obj.x2, obj.y2],
+            "timestamp": obj.timestamp.isoformat() if obj.timestamp else None,
+            "image_url": frame_url(frame_path, letterbox)
+        }
+        for obj, frame_path, letterbox in objects
+    ]
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    """Prometheus metrics of this service."""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/health")
 def health_check() -> Dict[str, str]:
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever rendering changes, so cached images and browser ETags are invalidated
+RENDER_VERSION: int = 1
+
+# Box colors per class, as in the dashboard (templates/index.html), in BGR
+CLASS_COLORS: Tuple[Tuple[int, int, int], ...] = tuple(
+    (int(c[4:6], 16), int(c[2:4], 16), int(c[0:2], 16))
+    for c in ("38bdf8", "f72585", "7209b7", "06d6a0", "ffd166", "ef476f", "118ab2", "8338ec", "fb5607", "2ecc71")
+)
+
+def class_color(class_name: Optional[str]) -> Tuple[int, int, int]:
+    """Same hash as the dashboard's getColor, so boxes match the detection badges."""
+    if not class_name:
+        return CLASS_COLORS[0]
+    h: int = 0
+    for ch in class_name:
+        h = (ord(ch) + ((h << 5) - h)) & 0xFFFFFFFF
+    if h >= 1 << 31:
+        h -= 1 << 32 # JavaScript's 32-bit signed integers
+    return CLASS_COLORS[abs(h) % len(CLASS_COLORS)]
+
+def pick_width(requested: Optional[int], widths: Sequence[int]) -> int:
+    """The smallest allowed width at least as large as requested (the largest one if none is)."""
+    if requested is None:
+        return widths[0]
+    for width in sorted(widths):
+        if width >= requested:
+            return width
+    return max(widths)
+
+def render_etag(frame_path: str, letterbox: Optional[Dict[str, Any]], width: int, quality: int,
+                detections: Optional[List[Dict[str, Any]]]) -> str:
+    """
+    Strong ETag of a rendered frame, derived from everything the image depends on, so it
+    can be checked without reading the frame. Pack references include the frame's offset
+    and length, so a rewritten frame gets a new tag.
+    """
+    key: str = json.dumps([RENDER_VERSION, frame_path, letterbox, width, quality, detections], sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def decode_frame(data: Any, letterbox: Optional[Dict[str, Any]]) -> Optional[Any]:
+    """Decodes stored frame bytes (JPEG, or raw pixels when letterboxed to raw) and crops off the letterbox padding."""
+    if letterbox and letterbox.get("raw"):
+        size: int = letterbox["size"]
+        if len(data) != size * size * 3:
+            return None
+        img: Any = np.frombuffer(data, dtype=np.uint8).reshape(size, size, 3)
+    else:
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+
+    if letterbox:
+        width: int = round(letterbox["width"] * letterbox["scale"])
+        height: int = round(letterbox["height"] * letterbox["scale"])
+        x, y = letterbox["pad_x"], letterbox["pad_y"]
+        img = img[max(y, 0):y + height, max(x, 0):x + width]
+    return img
+
+def render_frame(data: Any, letterbox: Optional[Dict[str, Any]], width: int, quality: int,
+                 detections: Optional[List[Dict[str, Any]]] = None) -> Optional[bytes]:
+    """
+    Downscales a stored frame to `width` pixels (never upscaling) and, if `detections`
+    are given, draws their boxes and labels. Returns JPEG bytes, or None if the frame
+    cannot be decoded.
+    """
+    img: Optional[Any] = decode_frame(data, letterbox)
+    if img is None or img.size == 0:
+        return None
+
+    height, full_width = img.shape[:2]
+    if full_width > width:
+        img = cv2.resize(img, (width, max(round(height * width / full_width), 1)), interpolation=cv2.INTER_AREA)
+    else:
+        img = np.ascontiguousarray(img)
+    height, width = img.shape[:2]
+
+    for d in detections or []:
+        x1, y1, x2, y2 = d.get("bbox") or (0, 0, 0, 0)
+        color: Tuple[int, int, int] = class_color(d.get("class"))
+        p1 = (int(x1 * width), int(y1 * height))
+        p2 = (int(x2 * width), int(y2 * height))
+        cv2.rectangle(img, p1, p2, color, 1 if width <= 320 else 2, cv2.LINE_AA)
+        label: str = f"{d.get('class', '')} {round((d.get('conf') or d.get('confidence') or 0) * 100)}%"
+        scale: float = max(width / 1000, 0.35)
+        (text_w, text_h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)
+        top: int = max(p1[1] - text_h - baseline, 0)
+        cv2.rectangle(img, (p1[0], top), (p1[0] + text_w, top + text_h + baseline), color, cv2.FILLED)
+        cv2.putText(img, label, (p1[0], top + text_h), cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), 1, cv2.LINE_AA)
+
+    success, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if success else None
+
+class ThumbnailCache:
+    """
+    Bounded on-disk cache of rendered images, keyed by their ETag.
+
+    Files live in `<directory>/<key[:2]>/<key>.jpg`. Once the cache holds more than
+    `max_bytes`, the least recently used entries are deleted. Recency is kept in memory
+    and rebuilt from file modification times (refreshed on hits) after a restart.
+    Safe to use from several threads; several processes can share the directory,
+    each enforcing the bound on the entries it knows about.
+    """
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict() # key -> size, least recent first
+        self._size: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.jpg")
+
+    def _load(self) -> None:
+        found: List[Tuple[float, str, int]] = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path: str = os.path.join(root, name)
+                if not name.endswith(".jpg"):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, name[:-len(".jpg")], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path: str = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data: bytes = f.read()
+        except OSError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path: str = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name, so readers never see a partial image
+        tmp: str = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from shared.storage import UPLOAD_CHUNK_SIZE, FileSystemStorage, SavedVideo
+
+logger = logging.getLogger(__name__)
+
+class UploadOffsetError(ValueError):
+    """A chunk did not start where the upload currently ends."""
+    def __init__(self, expected: int, received: int) -> None:
+        super().__init__(f"Upload is at offset {expected}, chunk starts at {received}")
+        self.expected: int = expected
+        self.received: int = received
+
+class UploadSession:
+    __slots__ = ("upload_id", "path", "offset", "hasher", "lock", "updated_at")
+
+    def __init__(self, upload_id: str, path: str, offset: int, hasher: Any) -> None:
+        self.upload_id: str = upload_id
+        self.path: str = path # Partial file, renamed to the video path on completion
+        self.offset: int = offset # Bytes received and hashed so far
+        self.hasher: Any = hasher
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.updated_at: float = time.monotonic()
+
+def _rehash(path: str) -> Tuple[Any, int]:
+    hasher = hashlib.sha256()
+    size: int = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(block)
+            size += len(block)
+    return hasher, size
+
+class ResumableUploads:
+    """
+    Chunked uploads for large videos, written to `<videos>/<upload_id>.part`.
+
+    Clients append chunks at the current offset; after a dropped connection
+    they ask for the offset and continue from there. The SHA256 is updated as
+    chunks arrive, so completing an upload does not re-read it. Sessions lost
+    in a restart are rebuilt from the partial file (re-hashed once).
+    Partial files idle for longer than `ttl_sec` are deleted.
+    """
+    SUFFIX: str = ".part"
+
+    def __init__(self, storage: FileSystemStorage, ttl_sec: float = 86400) -> None:
+        self.storage: FileSystemStorage = storage
+        self.ttl_sec: float = ttl_sec
+        self._sessions: Dict[str, UploadSession] = {}
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.storage.videos_path, f"{upload_id}{self.SUFFIX}")
+
+    def create(self) -> UploadSession:
+        self._purge_stale()
+        upload_id: str = str(uuid.uuid4())
+        path: str = self._part_path(upload_id)
+        open(path, "wb").close()
+        session = UploadSession(upload_id, path, 0, hashlib.sha256())
+        self._sessions[upload_id] = session
+        return session
+
+    async def get(self, upload_id: str) -> Optional[UploadSession]:
+        try:
+            upload_id = str(uuid.UUID(upload_id))
+        except ValueError:
+            return None
+
+        session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+
+        path: str = self._part_path(upload_id)
+        if not os.path.exists(path):
+            return None
+        hasher, size = await asyncio.to_thread(_rehash, path)
+        # Another request may have rebuilt it while we were hashing
+        session = self._sessions.setdefault(upload_id, UploadSession(upload_id, path, size, hasher))
+        logger.info(f"Resumed upload {upload_id} at offset {session.offset}")
+        return session
+
+    async def append(self, session: UploadSession, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Appends a request body at `offset`, which must be the current end of the upload.
+        Returns the new offset. If the body is cut off, the bytes already written are kept.
+        """
+        async with session.lock:
+            self._check_active(session)
+            if offset != session.offset:
+                raise UploadOffsetError(session.offset, offset)
+            with open(session.path, "ab") as out:
+                try:
+                    await FileSystemStorage.write_chunks(out, chunks, session.hasher)
+                finally:
+                    session.offset = out.tell()
+                    session.updated_at = time.monotonic()
+            return session.offset
+
+    async def complete(self, session: UploadSession) -> SavedVideo:
+        """Moves the finished upload into place as the video `session.upload_id`."""
+        async with session.lock:
+            self._check_active(session)
+            video_path: str = self.storage.video_path(session.upload_id)
+            os.replace(session.path, video_path)
+            self._sessions.pop(session.upload_id, None)
+            return SavedVideo(video_path, session.hasher.hexdigest(), session.offset)
+
+    async def abort(self, session: UploadSession) -> None:
+        async with session.lock:
+            self._sessions.pop(session.upload_id, None)
+            if os.path.exists(session.path):
+                os.remove(session.path)
+
+    def _check_active(self, session: UploadSession) -> None:
+        # The session may have been completed or aborted while waiting for its lock
+        if self._sessions.get(session.upload_id) is not session:
+            raise LookupError(f"Upload {session.upload_id} is no longer active")
+
+    def _purge_stale(self) -> None:
+        now: float = time.monotonic()
+        for upload_id, session in list(self._sessions.items()):
+            if now - session.updated_at > self.ttl_sec and not session.lock.locked():
+                del self._sessions[upload_id]
+
+        cutoff: float = time.time() - self.ttl_sec
+        with os.scandir(self.storage.videos_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.SUFFIX):
+                    continue
+                if entry.name[:-len(self.SUFFIX)] in self._sessions:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        logger.info(f"Removed abandoned upload {entry.name}")
+                except OSError:
+                    pass
@@ -1,60 +1,204 @@
+import asyncio
+import concurrent.futures
 import cv2
 import logging
-import os
-from typing import List, Tuple
+import threading
+import numpy as np
+from typing import Any, AsyncIterator, Iterator, List, NamedTuple, Optional, Tuple
+from shared.letterbox import letterbox as letterbox_image
+from shared.schemas import Letterbox
 from shared.storage import VideoStorage
+from sampling import AdaptiveSampling, iter_sampled_frames
 
 logger = logging.getLogger(__name__)
 
-def extract_frames(video_path: str, video_id: str, storage: VideoStorage, sample_rate_sec: int = 1) -> List[Tuple[str, str]]:
+# Marks the end of the frame stream on the hand-off queue
+_END_OF_STREAM = object()
+
+class FrameEncoding(NamedTuple):
+    """How extracted frames are stored."""
+    letterbox_size: int = 0 # Resize and pad to this square model input size; 0 keeps full resolution
+    raw: bool = False # With letterboxing: store raw BGR pixels instead of JPEG (no decode in detection)
+    jpeg_quality: int = 95
+
+def letterbox(frame: Any, size: int) -> Tuple[Any, Letterbox]:
+    """
+    Letterboxes a frame to the model input (see shared.letterbox) and describes the transform,
+    so detection can map boxes back to the original frame.
+    """
+    height, width = frame.shape[:2]
+    boxed, scale, pad_x, pad_y = letterbox_image(frame, size)
+    return boxed, Letterbox(size=size, scale=scale, pad_x=pad_x, pad_y=pad_y, width=width, height=height)
+
+def encode_frame(frame: Any, encoding: FrameEncoding) -> Tuple[Optional[bytes], Optional[Letterbox]]:
+    """
+    Encodes a frame for storage. Returns (None, None) if encoding fails.
+    """
+    box: Optional[Letterbox] = None
+    if encoding.letterbox_size > 0:
+        frame, box = letterbox(frame, encoding.letterbox_size)
+        if encoding.raw:
+            box.raw = True
+            return np.ascontiguousarray(frame).tobytes(), box
+
+    success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, encoding.jpeg_quality])
+    if not success:
+        return None, None
+    return buffer.tobytes(), box
+
+def video_fps(cap: cv2.VideoCapture) -> float:
+    fps: float = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0:
+        fps = 30.0 # Fallback
+    return fps
+
+def sampling_intervals(fps: float, mode: str, sample_rate_sec: float, adaptive: AdaptiveSampling) -> Tuple[int, int]:
+    """
+    Returns (frame_interval, max_interval) in frames. For adaptive sampling the
+    frame interval is the probe interval; max_interval is 0 for the other modes.
+    """
+    if mode == "adaptive":
+        return max(1, int(fps * adaptive.min_interval_sec)), max(1, int(fps * adaptive.max_interval_sec))
+    return max(1, int(fps * sample_rate_sec)), 0
+
+def probe_video(video_path: str) -> Tuple[float, int]:
+    """
+    Returns (fps, frame_count) from the container metadata; frame_count is 0 if unknown.
+    """
+    cap: cv2.VideoCapture = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {video_path}")
+    try:
+        return video_fps(cap), max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+def plan_segments(frame_count: int, fps: float, segment_length_sec: float, align: int) -> List[Tuple[int, Optional[int]]]:
+    """
+    Splits a video into [start_frame, end_frame) ranges of about `segment_length_sec`.
+    Boundaries are multiples of `align`, so each segment samples exactly the frames
+    the whole video would have. The last segment is open-ended (end_frame None),
+    since container frame counts can be approximate.
+    """
+    length: int = max(align, round(fps * segment_length_sec / align) * align)
+    starts: List[int] = list(range(0, max(frame_count, 1), length))
+    return [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+def iter_frames(video_path: str, video_id: str, storage: VideoStorage, sample_rate_sec: float = 1,
+                mode: str = "grab", keyframe_interval: int = 0, hash_algorithm: str = "sha256",
+                adaptive: AdaptiveSampling = AdaptiveSampling(), start_frame: int = 0,
+                end_frame: Optional[int] = None, encoding: FrameEncoding = FrameEncoding()) -> Iterator[Tuple[int, str, str, Optional[Letterbox]]]:
     """
-    Extracts frames from a video file and saves them to storage.
-    
+    Extracts frames from a video file, saving each one to storage as soon as it is encoded.
+
     Args:
         video_path: Local path to the video file.
-        video_id: Unique identifier for the video.
+        video_id: Unique identifier for the video (the storage key its frames are saved under).
         storage: Storage interface implementation.
         sample_rate_sec: Extract 1 frame every X seconds. Default 1.
-        
-    Returns:
-        List of (path, hash) tuples for the saved frames.
+        mode: "grab" decodes only sampled frames while walking the stream,
+            "seek" jumps directly to each sampled frame,
+            "adaptive" samples on scene changes and motion, ignoring sample_rate_sec.
+        keyframe_interval: GOP length used to snap seek targets to keyframes (seek mode only).
+        hash_algorithm: Digest used for the frame hash (see shared.storage.HASH_ALGORITHMS).
+        adaptive: Rate bounds and threshold for adaptive mode.
+        start_frame, end_frame: Only extract this range (end exclusive, None for the end of the video).
+        encoding: Storage format; optionally letterboxed to the model input size.
+
+    Yields:
+        (frame_index, path, hash, letterbox) for every saved frame; letterbox is None at full resolution.
     """
     cap: cv2.VideoCapture = cv2.VideoCapture(video_path)
-    
+
     if not cap.isOpened():
         raise ValueError(f"Could not open video file: {video_path}")
-        
-    fps: float = cap.get(cv2.CAP_PROP_FPS)
-    if fps <= 0:
-        fps = 30.0 # Fallback
-        
-    frame_interval: int = int(fps * sample_rate_sec)
-    frame_count: int = 0
-    saved_data: List[Tuple[str, str]] = [] # List of (path, hash)
-    
-    while True:
-        success: bool
+
+    fps: float = video_fps(cap)
+    frame_interval, max_interval = sampling_intervals(fps, mode, sample_rate_sec, adaptive)
+    saved_count: int = 0
+
+    try:
+        frame_idx: int
         frame: Any
-        success, frame = cap.read()
-        if not success:
-            break
-            
-        if frame_count % frame_interval == 0:
-            # Encode frame to JPEG bytes
-            success, buffer = cv2.imencode(".jpg", frame)
-            if success:
-                frame_idx: int = frame_count
-                frame_bytes: bytes = buffer.tobytes()
-                
+        for frame_idx, frame in iter_sampled_frames(cap, frame_interval, mode, keyframe_interval,
+                                                    max_interval, adaptive.scene_threshold, start_frame, end_frame):
+            # Encode frame to JPEG (or raw) bytes
+            frame_bytes, box = encode_frame(frame, encoding)
+            if frame_bytes is not None:
+
                 # Calculate Hash
-                frame_hash: str = storage.compute_hash(frame_bytes)
-                
+                frame_hash: str = storage.compute_hash(frame_bytes, hash_algorithm)
+
                 # Save
                 frame_path: str = storage.save_frame(video_id, frame_idx, frame_bytes)
-                saved_data.append((frame_path, frame_hash))
-                
-        frame_count += 1
-        
-    cap.release()
-    logger.info(f"Extracted {len(saved_data)} frames from video {video_id}")
-    return saved_data
+                saved_count += 1
+                yield frame_idx, frame_path, frame_hash, box
+    finally:
+        cap.release()
+
+    logger.info(f"Extracted {saved_count} frames from video {video_id} ({mode} sampling)")
+
+def extract_frames(video_path: str, video_id: str, storage: VideoStorage, sample_rate_sec: float = 1,
+                   mode: str = "grab", keyframe_interval: int = 0, hash_algorithm: str = "sha256",
+                   adaptive: AdaptiveSampling = AdaptiveSampling(), encoding: FrameEncoding = FrameEncoding()) -> List[Tuple[str, str]]:
+    """
+    Extracts all frames up front. See `iter_frames` for the arguments.
+
+    Returns:
+        List of (path, hash) tuples for the saved frames.
+    """
+    return [
+        (frame_path, frame_hash)
+        for _, frame_path, frame_hash, _ in iter_frames(video_path, video_id, storage, sample_rate_sec, mode, keyframe_interval,
+                                                        hash_algorithm, adaptive, encoding=encoding)
+    ]
+
+async def stream_frames(video_path: str, video_id: str, storage: VideoStorage, queue_size: int = 64,
+                        sample_rate_sec: float = 1, mode: str = "grab", keyframe_interval: int = 0,
+                        hash_algorithm: str = "sha256", adaptive: AdaptiveSampling = AdaptiveSampling(),
+                        start_frame: int = 0, end_frame: Optional[int] = None,
+                        encoding: FrameEncoding = FrameEncoding()) -> AsyncIterator[Tuple[int, str, str, Optional[Letterbox]]]:
+    """
+    Runs `iter_frames` on a background thread and yields its frames to the event loop as they are saved.
+    At most `queue_size` frames wait to be consumed; beyond that decoding pauses until the consumer catches up.
+    Close the generator (e.g. with `contextlib.aclosing`) to stop extraction early.
+    """
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    cancelled: threading.Event = threading.Event()
+
+    def put(item: Any) -> bool:
+        # Blocks the extraction thread while the queue is full, giving up if the consumer went away
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if cancelled.is_set():
+                    future.cancel()
+                    return False
+
+    def produce() -> None:
+        try:
+            for item in iter_frames(video_path, video_id, storage, sample_rate_sec, mode, keyframe_interval, hash_algorithm,
+                                    adaptive, start_frame, end_frame, encoding):
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_END_OF_STREAM)
+
+    producer: asyncio.Future = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item: Any = await queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        await producer
@@ -0,0 +1,143 @@
+import cv2
+import logging
+from typing import Any, Iterator, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MODES: Tuple[str, ...] = ("grab", "seek", "adaptive")
+
+# Size of the grayscale thumbnails compared by the adaptive sampler
+SCENE_THUMBNAIL_SIZE: Tuple[int, int] = (64, 36)
+
+class AdaptiveSampling(NamedTuple):
+    """Bounds and sensitivity of the adaptive sampler."""
+    min_interval_sec: float = 0.25 # Never sample more often than this
+    max_interval_sec: float = 5.0 # Always sample at least this often
+    scene_threshold: float = 0.12 # Mean absolute pixel change (0-1) that counts as a scene change
+
+def iter_grab(cap: cv2.VideoCapture, frame_interval: int, start_frame: int = 0,
+              end_frame: Optional[int] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Walks the stream sequentially, decoding only every `frame_interval`-th frame.
+    Skipped frames are only demuxed with grab(), never converted to images.
+    With `start_frame`/`end_frame`, only that range is walked (after a seek to its start);
+    sampled indices stay multiples of `frame_interval`, as when walking the whole video.
+    Yields (frame_index, frame).
+    """
+    frame_count: int = 0
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_count = start_frame
+
+    while end_frame is None or frame_count < end_frame:
+        if frame_count % frame_interval == 0:
+            if not cap.grab():
+                break
+            success: bool
+            frame: Any
+            success, frame = cap.retrieve()
+            if success:
+                yield frame_count, frame
+        elif not cap.grab():
+            break
+
+        frame_count += 1
+
+def iter_seek(cap: cv2.VideoCapture, frame_interval: int, keyframe_interval: int = 0, start_frame: int = 0,
+              end_frame: Optional[int] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Jumps straight to each target frame instead of walking the stream.
+    Worth it for sparse sampling of long videos, where the distance between
+    targets is much larger than the GOP.
+
+    If `keyframe_interval` (the encoder's GOP length) is given, targets are
+    snapped to the nearest multiple of it. For fixed-GOP streams those are the
+    keyframes, so each seek decodes a single frame instead of decoding forward
+    from the previous keyframe.
+    Only targets in [`start_frame`, `end_frame`) are visited.
+    Yields (frame_index, frame).
+    """
+    total_frames: int = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total_frames <= 0:
+        logger.warning("Frame count unavailable, falling back to sequential grab sampling")
+        yield from iter_grab(cap, frame_interval, start_frame, end_frame)
+        return
+
+    stop: int = total_frames if end_frame is None else min(end_frame, total_frames)
+    first_target: int = -(-start_frame // frame_interval) * frame_interval
+    last_index: int = -1
+    for target in range(first_target, stop, frame_interval):
+        frame_index: int = target
+        if keyframe_interval > 0:
+            frame_index = min(round(target / keyframe_interval) * keyframe_interval, total_frames - 1)
+        if frame_index <= last_index or not start_frame <= frame_index < stop:
+            continue
+
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        success: bool
+        frame: Any
+        success, frame = cap.read()
+        if not success:
+            logger.warning(f"Seek to frame {frame_index} failed, stopping")
+            break
+
+        last_index = frame_index
+        yield frame_index, frame
+
+def scene_thumbnail(frame: Any) -> Any:
+    small: Any = cv2.resize(frame, SCENE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+def scene_difference(a: Any, b: Any) -> float:
+    """Mean absolute difference of two thumbnails, from 0 (identical) to 1."""
+    return float(cv2.absdiff(a, b).mean()) / 255
+
+def iter_adaptive(cap: cv2.VideoCapture, probe_interval: int, max_interval: int, threshold: float,
+                  start_frame: int = 0, end_frame: Optional[int] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Samples on content changes instead of at a fixed rate.
+
+    Every `probe_interval`-th frame is decoded and compared (as a small
+    grayscale thumbnail) with the last sampled frame. It is sampled when the
+    difference reaches `threshold` (a cut, or enough motion since the last
+    sample), or when `max_interval` frames have passed without a sample.
+    Static stretches therefore cost one frame per `max_interval`, while fast
+    action is sampled as often as every `probe_interval` frames.
+    The first probed frame of a range is always sampled, so a segment's
+    samples do not depend on the segments before it.
+    Yields (frame_index, frame).
+    """
+    last_thumbnail: Optional[Any] = None
+    last_index: int = start_frame
+    probed: int = 0
+    sampled: int = 0
+
+    for frame_index, frame in iter_grab(cap, probe_interval, start_frame, end_frame):
+        probed += 1
+        thumbnail: Any = scene_thumbnail(frame)
+        if (
+            last_thumbnail is None
+            or frame_index - last_index >= max_interval
+            or scene_difference(thumbnail, last_thumbnail) >= threshold
+        ):
+            last_thumbnail = thumbnail
+            last_index = frame_index
+            sampled += 1
+            yield frame_index, frame
+
+    logger.info(f"Adaptive sampling kept {sampled} of {probed} probed frames")
+
+def iter_sampled_frames(cap: cv2.VideoCapture, frame_interval: int, mode: str = "grab", keyframe_interval: int = 0,
+                        max_interval: int = 0, scene_threshold: float = 0.12, start_frame: int = 0,
+                        end_frame: Optional[int] = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Dispatches to the sampling strategy named by `mode`, over the whole video or [start_frame, end_frame).
+    For "adaptive", `frame_interval` is the probe interval and `max_interval` the longest gap between samples.
+    """
+    if mode == "grab":
+        return iter_grab(cap, frame_interval, start_frame, end_frame)
+    if mode == "seek":
+        return iter_seek(cap, frame_interval, keyframe_interval, start_frame, end_frame)
+    if mode == "adaptive":
+        return iter_adaptive(cap, frame_interval, max(max_interval, frame_interval), scene_threshold, start_frame, end_frame)
+    raise ValueError(f"Unknown sampling mode: {mode} (expected one of {SAMPLING_MODES})")
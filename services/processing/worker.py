@@ -1,114 +1,454 @@
 import asyncio
+import contextlib
 import logging
+import math
 import signal
 import os
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
 
-from shared.mq import KafkaConsumer, KafkaProducer
-from shared.storage import FileSystemStorage
-from shared.schemas import VideoTask, FrameTask
-from processing import extract_frames
+from shared.database import init_db
+from shared.metrics import EXTRACTED_FRAMES, EXTRACTION_SECONDS, serve_metrics
+from shared.mq import PRIORITIES, KafkaConsumer, KafkaProducer, priority_settings, priority_topic
+from shared.retention import FrameLifecycle
+from shared.registry import Claim, Completion, claim_video, complete_video, fail_video, finish_segment, is_segment_done, register_segments
+from shared.storage import FileSystemStorage, create_storage
+from shared.serialization import parse_message
+from shared.schemas import VideoTask, FrameTask, SamplingOptions, SegmentTask, VideoEvent
+from processing import FrameEncoding, plan_segments, probe_video, sampling_intervals, stream_frames
+from sampling import AdaptiveSampling
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def main() -> None:
-    logger.info("Starting Processing Worker...")
-    
-    # Initialize components
-    storage: FileSystemStorage = FileSystemStorage()
-    # Consumer for video uploads
-    consumer: KafkaConsumer = KafkaConsumer(topic="video-uploads", group_id="processing-group")
-    # Producer for frame tasks
-    producer: KafkaProducer = KafkaProducer(topic="frame-tasks")
-    
-    await consumer.start()
-    await producer.start()
-    
-    shutdown_event: asyncio.Event = asyncio.Event()
+# Frame sampling: one frame every SAMPLE_RATE_SEC, decoded via "grab" (sequential) or "seek",
+# or "adaptive" sampling on scene changes. Jobs can override these in VideoTask.sampling.
+SAMPLE_RATE_SEC: float = float(os.getenv("SAMPLE_RATE_SEC", "1"))
+SAMPLING_MODE: str = os.getenv("SAMPLING_MODE", "grab")
+KEYFRAME_INTERVAL: int = int(os.getenv("KEYFRAME_INTERVAL", "0"))
+# Adaptive sampling: at most one frame per MIN_INTERVAL, at least one per MAX_INTERVAL
+ADAPTIVE_SAMPLING: AdaptiveSampling = AdaptiveSampling(
+    min_interval_sec=float(os.getenv("ADAPTIVE_MIN_INTERVAL_SEC", "0.25")),
+    max_interval_sec=float(os.getenv("ADAPTIVE_MAX_INTERVAL_SEC", "5")),
+    scene_threshold=float(os.getenv("SCENE_CHANGE_THRESHOLD", "0.12"))
+)
+# Frames extracted but not yet published; extraction pauses when this fills up
+FRAME_QUEUE_SIZE: int = int(os.getenv("FRAME_QUEUE_SIZE", "64"))
 
-    def handle_signal() -> None:
-        logger.info("Shutdown signal received")
-        shutdown_event.set()
+# Videos at least SEGMENT_MIN_DURATION_SEC long are split into SEGMENT_LENGTH_SEC segments,
+# published on "video-segments" and extracted in parallel by any processing worker. 0 disables.
+SEGMENT_LENGTH_SEC: float = float(os.getenv("SEGMENT_LENGTH_SEC", "300"))
+SEGMENT_MIN_DURATION_SEC: float = float(os.getenv("SEGMENT_MIN_DURATION_SEC", "600"))
 
-    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        loop.add_signal_handler(sig, handle_signal)
+# Videos and segments extracted at the same time by one worker; extraction overlaps
+# its own decoding (in threads) with storage writes and Kafka publishing
+VIDEO_CONCURRENCY: int = int(os.getenv("VIDEO_CONCURRENCY", "2"))
+SEGMENT_CONCURRENCY: int = int(os.getenv("SEGMENT_CONCURRENCY", "2"))
+# Each priority class is consumed from its own topics with its own slots, so interactive uploads
+# never wait for a slot behind a backlog of bulk ones. Per-class overrides such as
+# "interactive:2,bulk:1"; classes left out use VIDEO_CONCURRENCY / SEGMENT_CONCURRENCY.
+CLASS_VIDEO_CONCURRENCY: Dict[str, float] = priority_settings(
+    os.getenv("PRIORITY_VIDEO_CONCURRENCY", "interactive:1,bulk:1"), VIDEO_CONCURRENCY)
+CLASS_SEGMENT_CONCURRENCY: Dict[str, float] = priority_settings(
+    os.getenv("PRIORITY_SEGMENT_CONCURRENCY", "interactive:1,bulk:1"), SEGMENT_CONCURRENCY)
+# Tries per message before a failing job is given up on
+HANDLER_ATTEMPTS: int = int(os.getenv("HANDLER_ATTEMPTS", "3"))
 
-    logger.info("Worker ready to receive jobs...")
+# Frame storage format. With PREPROCESS_SIZE set (the model input, e.g. 640), frames are
+# letterboxed once here instead of being decoded at full size and resized by the detector;
+# PREPROCESS_FORMAT=raw then stores plain pixels so the detector does not decode at all.
+FRAME_ENCODING: FrameEncoding = FrameEncoding(
+    letterbox_size=int(os.getenv("PREPROCESS_SIZE", "0")),
+    raw=os.getenv("PREPROCESS_FORMAT", "jpeg") == "raw",
+    jpeg_quality=int(os.getenv("FRAME_JPEG_QUALITY", "95"))
+)
 
-    while not shutdown_event.is_set():
-        try:
-            job_info: Optional[Tuple[Any, Dict[str, Any]]] = await consumer.get_next_job()
-            if not job_info:
-                # Small sleep to be nice to the CPU if no messages are coming
-                await asyncio.sleep(0.1)
-                continue
-                
-            kafka_msg, job_data = job_info
-            
-            # Use Pydantic to validate incoming task
-            try:
-                video_task = VideoTask(**job_data)
-            except Exception as e:
-                logger.error(f"Invalid VideoTask received: {e}")
-                await consumer.acknowledge(kafka_msg)
-                continue
-                
-            video_id: str = video_task.video_id
-            video_path: str = video_task.video_path
-            
-            logger.info(f"Processing video {video_id} at {video_path}")
-            
-            if not os.path.exists(video_path):
-                logger.error(f"Video file not found: {video_path}")
-                await consumer.acknowledge(kafka_msg)
-                continue
+# Digest carried in FrameTask.frame_hash: sha256, or blake2b/xxh3_128 when only corruption matters
+FRAME_HASH_ALGORITHM: str = os.getenv("FRAME_HASH_ALGORITHM", "sha256")
+
+YOLO_MODEL: str = os.getenv("YOLO_MODEL", "yolov8n.pt")
+
+class JobSampling(NamedTuple):
+    """Effective sampling settings of one job."""
+    mode: str
+    sample_rate_sec: float
+    adaptive: AdaptiveSampling
 
-            # 1. Compute Video Hash (useful for downstream detection verification)
-            video_hash: str = storage.compute_file_hash(video_path)
-            
-            # 2. Extract Frames
-            frame_data: List[Tuple[str, str]] = extract_frames(video_path, video_id, storage)
-            
-            # 3. Publish Frame Tasks
-            for path, frame_hash in frame_data:
-                filename: str = os.path.basename(path)
+def job_sampling(options: Optional[SamplingOptions]) -> JobSampling:
+    """Applies a job's sampling overrides to the service defaults."""
+    if options is None:
+        return JobSampling(SAMPLING_MODE, SAMPLE_RATE_SEC, ADAPTIVE_SAMPLING)
+    # float(): trusted messages skip validation, and 10 vs 10.0 must not change the config key
+    adaptive = AdaptiveSampling(
+        min_interval_sec=float(options.min_interval_sec or ADAPTIVE_SAMPLING.min_interval_sec),
+        max_interval_sec=float(options.max_interval_sec or ADAPTIVE_SAMPLING.max_interval_sec),
+        scene_threshold=float(options.scene_threshold or ADAPTIVE_SAMPLING.scene_threshold)
+    )
+    return JobSampling(options.mode or SAMPLING_MODE, float(options.sample_rate_sec or SAMPLE_RATE_SEC), adaptive)
+
+def pipeline_config_key(sampling: JobSampling) -> str:
+    """
+    Everything that changes the detections of a given video. Uploads of identical content
+    under the same config share one set of detections (see shared.registry).
+    """
+    if sampling.mode == "adaptive":
+        a = sampling.adaptive
+        key = f"model={YOLO_MODEL};sampling=adaptive;min={a.min_interval_sec};max={a.max_interval_sec};scene={a.scene_threshold}"
+    else:
+        key = f"model={YOLO_MODEL};sampling={sampling.mode};rate={sampling.sample_rate_sec};gop={KEYFRAME_INTERVAL}"
+    if FRAME_ENCODING.letterbox_size > 0:
+        key += f";letterbox={FRAME_ENCODING.letterbox_size}"
+    return key
+
+def sampling_options(sampling: JobSampling) -> SamplingOptions:
+    """The fully resolved settings, as carried by segment tasks."""
+    return SamplingOptions(
+        mode=sampling.mode,
+        sample_rate_sec=sampling.sample_rate_sec,
+        min_interval_sec=sampling.adaptive.min_interval_sec,
+        max_interval_sec=sampling.adaptive.max_interval_sec,
+        scene_threshold=sampling.adaptive.scene_threshold
+    )
+
+def segment_storage_key(video_id: str, segment_index: int) -> str:
+    # Segments of one video are extracted concurrently, so each writes its own frame pack
+    return f"{video_id}-s{segment_index}"
+
+async def process_video(video_id: str, video_path: str, video_hash: str, storage: FileSystemStorage,
+                        producer: KafkaProducer, sampling: JobSampling, start_frame: int = 0,
+                        end_frame: Optional[int] = None, storage_key: Optional[str] = None,
+                        segment_index: int = 0, trace_id: Optional[str] = None,
+                        uploaded_at: Optional[float] = None, priority: str = "normal") -> int:
+    """
+    Extracts the video's frames (or those in [start_frame, end_frame)) and publishes a FrameTask
+    for each one, on the frame topic of its priority class, as it is saved under `storage_key`
+    (default: the video ID).
+    Returns the number of frame tasks published; all of them are delivered when this returns.
+    """
+    storage_key = storage_key or video_id
+    topic: str = priority_topic(producer.topic, priority)
+    # Several videos share the producer, so only this video's sends are checked before it is acknowledged
+    deliveries: List[asyncio.Future] = []
+    published: int = 0
+    started: float = time.monotonic()
+    frames = stream_frames(
+        video_path, storage_key, storage,
+        queue_size=FRAME_QUEUE_SIZE,
+        sample_rate_sec=sampling.sample_rate_sec,
+        mode=sampling.mode,
+        keyframe_interval=KEYFRAME_INTERVAL,
+        hash_algorithm=FRAME_HASH_ALGORITHM,
+        adaptive=sampling.adaptive,
+        start_frame=start_frame,
+        end_frame=end_frame,
+        encoding=FRAME_ENCODING
+    )
+    try:
+        async with contextlib.aclosing(frames):
+            async for frame_idx, path, frame_hash, letterbox in frames:
                 try:
-                    # Extract frame index from filename like "120.jpg"
-                    frame_idx: int = int(os.path.splitext(filename)[0])
-                    
                     frame_task = FrameTask(
                         video_id=video_id,
                         frame_path=path,
                         frame_index=frame_idx,
                         frame_hash=frame_hash,
-                        video_hash=video_hash
+                        video_hash=video_hash,
+                        hash_algorithm=FRAME_HASH_ALGORITHM,
+                        letterbox=letterbox,
+                        segment_index=segment_index,
+                        trace_id=trace_id,
+                        uploaded_at=uploaded_at,
+                        priority=priority
                     )
-                    
-                    await producer.publish(frame_task)
+
+                    # Queued without waiting for the broker; delivery is confirmed by the flush below
+                    deliveries.append(await producer.publish_nowait(frame_task, topic))
+                    published += 1
+                    EXTRACTED_FRAMES.labels(sampling.mode).inc()
                 except Exception as e:
                     logger.error(f"Failed to publish frame task: {e}")
-            
-            logger.info(f"Finished processing video {video_id}. Published {len(frame_data)} frames.")
-            
-            # 4. Acknowledge Video Task
-            await consumer.acknowledge(kafka_msg)
-            
-            # 5. Cleanup video after extraction
+    finally:
+        # Extraction thread has stopped by now; release per-video write handles
+        storage.finish_frames(storage_key)
+
+    # Make sure every frame task reached the broker before the video task is acknowledged
+    await producer.flush(deliveries)
+    elapsed: float = time.monotonic() - started
+    EXTRACTION_SECONDS.observe(elapsed)
+    logger.info(f"Extracted {published} frames of {storage_key} in {elapsed:.1f}s "
+                f"({published / max(elapsed, 1e-6):.1f} fps, trace {trace_id})")
+    return published
+
+async def split_video(video_task: VideoTask, video_hash: str, sampling: JobSampling,
+                      segment_producer: KafkaProducer) -> Optional[int]:
+    """
+    Publishes segment tasks for a long video. Returns the number of segments,
+    or None if the video is short enough to be extracted in one piece.
+    """
+    if SEGMENT_LENGTH_SEC <= 0:
+        return None
+    fps, frame_count = await asyncio.to_thread(probe_video, video_task.video_path)
+    if frame_count <= 0 or frame_count / fps < SEGMENT_MIN_DURATION_SEC:
+        return None
+
+    # Segment boundaries fall on the sampling grid (and on keyframes, when the GOP is known)
+    frame_interval, _ = sampling_intervals(fps, sampling.mode, sampling.sample_rate_sec, sampling.adaptive)
+    align: int = math.lcm(frame_interval, KEYFRAME_INTERVAL) if KEYFRAME_INTERVAL > 0 else frame_interval
+    segments: List[Tuple[int, Optional[int]]] = plan_segments(frame_count, fps, SEGMENT_LENGTH_SEC, align)
+    # A redelivered task publishes only the segments not extracted yet, with their recorded bounds
+    pending: List[Tuple[int, int, Optional[int]]] = await register_segments(video_task.video_id, segments)
+
+    options: SamplingOptions = sampling_options(sampling)
+    topic: str = priority_topic(segment_producer.topic, video_task.priority)
+    deliveries: List[asyncio.Future] = []
+    for i, start, end in pending:
+        deliveries.append(await segment_producer.publish_nowait(SegmentTask(
+            video_id=video_task.video_id,
+            video_path=video_task.video_path,
+            video_hash=video_hash,
+            segment_index=i,
+            segment_count=len(segments),
+            start_frame=start,
+            end_frame=end,
+            sampling=options,
+            trace_id=video_task.trace_id,
+            uploaded_at=video_task.uploaded_at,
+            priority=video_task.priority
+        ), topic))
+    await segment_producer.flush(deliveries)
+    return len(segments)
+
+def delete_source(storage: FileSystemStorage, video_path: str) -> None:
+    try:
+        storage.delete_video(video_path)
+        logger.info(f"Cleaned up source video: {video_path}")
+    except Exception as e:
+        logger.warning(f"Could not delete video {video_path}: {e}")
+
+async def consume(consumer: KafkaConsumer, handle: Callable[[Dict[str, Any]], Awaitable[None]],
+                  shutdown_event: asyncio.Event, concurrency: int = 1,
+                  give_up: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> None:
+    """
+    Runs `handle` on up to `concurrency` messages at a time and acknowledges each one once
+    its handler returns. The consumer commits only past messages whose handlers are done,
+    so work still running when the worker stops is redelivered after a restart.
+    A handler that keeps raising is given up on after HANDLER_ATTEMPTS tries (calling
+    `give_up` with the message), so that the partition's commits can move on.
+    """
+    running: Set["asyncio.Task[None]"] = set()
+
+    async def run(kafka_msg: Any, job_data: Dict[str, Any]) -> None:
+        for attempt in range(1, HANDLER_ATTEMPTS + 1):
             try:
-                storage.delete_video(video_path)
-                logger.info(f"Cleaned up source video: {video_path}")
+                await handle(job_data)
+                break
             except Exception as e:
-                logger.warning(f"Could not delete video {video_path}: {e}")
-            
+                logger.error(f"Error in processing loop (attempt {attempt}/{HANDLER_ATTEMPTS}): {e}")
+                if attempt < HANDLER_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+                elif give_up is not None:
+                    try:
+                        await give_up(job_data)
+                    except Exception as e:
+                        logger.error(f"Error giving up on a message: {e}")
+        await consumer.acknowledge(kafka_msg)
+
+    while not shutdown_event.is_set():
+        try:
+            if len(running) >= concurrency:
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            batch: List[Tuple[Any, Dict[str, Any]]] = await consumer.get_batch(concurrency - len(running), 500)
+            for kafka_msg, job_data in batch:
+                task: "asyncio.Task[None]" = asyncio.create_task(run(kafka_msg, job_data))
+                running.add(task)
+                task.add_done_callback(running.discard)
         except Exception as e:
             logger.error(f"Error in processing loop: {e}")
             await asyncio.sleep(1)
 
-    await consumer.stop()
-    await producer.stop()
+    # Let the jobs already started finish, so their messages are committed
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+
+async def main() -> None:
+    logger.info("Starting Processing Worker...")
+
+    # Auto-initialize DB tables (video registry)
+    await init_db()
+    serve_metrics()
+
+    # Initialize components
+    storage: FileSystemStorage = create_storage()
+    # Consumers for video uploads and for segments of long videos, per priority class
+    # (groups are named like the topics: "processing-group", "processing-group-interactive", ...)
+    consumers: Dict[str, KafkaConsumer] = {
+        priority: KafkaConsumer(topic=priority_topic("video-uploads", priority),
+                                group_id=priority_topic("processing-group", priority))
+        for priority in PRIORITIES
+    }
+    segment_consumers: Dict[str, KafkaConsumer] = {
+        priority: KafkaConsumer(topic=priority_topic("video-segments", priority),
+                                group_id=priority_topic("processing-segments-group", priority))
+        for priority in PRIORITIES
+    }
+    # Producer for frame tasks (on the topic of each task's priority)
+    producer: KafkaProducer = KafkaProducer(topic="frame-tasks")
+    # Segments are not keyed, so they spread over all partitions (and workers)
+    segment_producer: KafkaProducer = KafkaProducer(topic="video-segments", key_field=None)
+    # Completion signal once all frames of a video are published
+    event_producer: KafkaProducer = KafkaProducer(topic="video-events")
+    clients: List[Any] = [*consumers.values(), *segment_consumers.values(), producer, segment_producer, event_producer]
+
+    for client in clients:
+        await client.start()
+
+    shutdown_event: asyncio.Event = asyncio.Event()
+
+    def handle_signal() -> None:
+        logger.info("Shutdown signal received")
+        shutdown_event.set()
+
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, handle_signal)
+
+    async def fail(video_id: str) -> None:
+        # A pending duplicate of the failed video is requeued to take the work over
+        duplicate: Optional[Dict[str, Any]] = await fail_video(video_id)
+        if duplicate is not None:
+            logger.info(f"Video {video_id} failed; requeued its duplicate {duplicate.get('video_id')}")
+            await producer.publish(duplicate, priority_topic("video-uploads", duplicate.get("priority") or "normal"))
+
+    def delete_duplicates(video_id: str, paths: List[str]) -> None:
+        for path in paths:
+            logger.info(f"Duplicate upload {path} linked to the detections of video {video_id}")
+            delete_source(storage, path)
+
+    async def handle_video(job_data: Dict[str, Any]) -> None:
+        # Use Pydantic to validate incoming task
+        try:
+            video_task = parse_message(VideoTask, job_data)
+        except Exception as e:
+            logger.error(f"Invalid VideoTask received: {e}")
+            return
+
+        video_id: str = video_task.video_id
+        video_path: str = video_task.video_path
+
+        logger.info(f"Processing video {video_id} at {video_path} (trace {video_task.trace_id})")
+
+        if not os.path.exists(video_path):
+            logger.error(f"Video file not found: {video_path}")
+            return
+
+        # 1. Video Hash (identifies re-uploads, and useful for downstream detection verification).
+        # Ingestion hashes the upload while writing it; older tasks without a digest are hashed here.
+        if video_task.video_size is not None and os.path.getsize(video_path) != video_task.video_size:
+            logger.error(f"Video {video_id} is {os.path.getsize(video_path)} bytes, expected {video_task.video_size}")
+            return
+        video_hash: str = video_task.video_hash or await asyncio.to_thread(storage.compute_file_hash, video_path)
+
+        # 2. Skip videos whose content was already processed under the same config
+        sampling: JobSampling = job_sampling(video_task.sampling)
+        config_key: str = pipeline_config_key(sampling)
+        claim: Claim = await claim_video(video_hash, config_key, video_id, video_task.model_dump(mode="json"))
+        if claim.pending:
+            # Settled when that video completes (or fails), without holding a slot meanwhile
+            logger.info(f"Video {video_id} duplicates video {claim.canonical_id}, which is still processing; linked as pending")
+            return
+        if claim.canonical_id is not None:
+            if claim.canonical_id == video_id:
+                logger.info(f"Video {video_id} was already processed, skipping")
+            else:
+                logger.info(f"Video {video_id} duplicates video {claim.canonical_id}, linked to its detections")
+            delete_source(storage, video_path)
+            return
+
+        # 3. Long videos: hand segments to the pool; the last one to finish completes the video
+        try:
+            segments: Optional[int] = await split_video(video_task, video_hash, sampling, segment_producer)
+        except Exception:
+            await fail(video_id)
+            raise
+        if segments is not None:
+            logger.info(f"Split video {video_id} into {segments} segments")
+            return
+
+        # 4. Extract Frames and Publish Frame Tasks
+        try:
+            published: int = await process_video(video_id, video_path, video_hash, storage, producer, sampling,
+                                                 trace_id=video_task.trace_id, uploaded_at=video_task.uploaded_at,
+                                                 priority=video_task.priority)
+        except Exception:
+            await fail(video_id)
+            raise
+        duplicates: List[str] = await complete_video(video_id, published)
+        await event_producer.publish(VideoEvent(video_id=video_id, status="completed", frames=published))
+
+        logger.info(f"Finished processing video {video_id}. Published {published} frames.")
+
+        # 5. Cleanup video (and uploads of the same content) after extraction
+        delete_source(storage, video_path)
+        delete_duplicates(video_id, duplicates)
+
+    async def handle_segment(job_data: Dict[str, Any]) -> None:
+        try:
+            segment = parse_message(SegmentTask, job_data)
+        except Exception as e:
+            logger.error(f"Invalid SegmentTask received: {e}")
+            return
+
+        video_id: str = segment.video_id
+        label: str = f"segment {segment.segment_index + 1}/{segment.segment_count} of video {video_id}"
+        if await is_segment_done(video_id, segment.segment_index):
+            logger.info(f"{label} was already extracted, skipping")
+            return
+        if not os.path.exists(segment.video_path):
+            logger.error(f"Video file not found for {label}: {segment.video_path}")
+            return
+
+        logger.info(f"Processing {label} (frames {segment.start_frame}-{segment.end_frame if segment.end_frame is not None else 'end'})")
+        # A failure here is retried by consume; the video only fails once the segment is given up on
+        published: int = await process_video(
+            video_id, segment.video_path, segment.video_hash, storage, producer, job_sampling(segment.sampling),
+            start_frame=segment.start_frame, end_frame=segment.end_frame,
+            storage_key=segment_storage_key(video_id, segment.segment_index),
+            segment_index=segment.segment_index,
+            trace_id=segment.trace_id,
+            uploaded_at=segment.uploaded_at,
+            priority=segment.priority
+        )
+
+        completion: Optional[Completion] = await finish_segment(video_id, segment.segment_index, published)
+        logger.info(f"Finished {label}. Published {published} frames.")
+        if completion is not None:
+            await event_producer.publish(VideoEvent(video_id=video_id, status="completed", frames=completion.frames,
+                                                    segments=segment.segment_count))
+            logger.info(f"All {segment.segment_count} segments of video {video_id} done. Published {completion.frames} frames.")
+            delete_source(storage, segment.video_path)
+            delete_duplicates(video_id, completion.duplicates)
+
+    async def give_up_segment(job_data: Dict[str, Any]) -> None:
+        # A segment that cannot be extracted fails its video, so a re-upload takes the work over
+        segment = parse_message(SegmentTask, job_data)
+        logger.error(f"Giving up on segment {segment.segment_index + 1}/{segment.segment_count} of video {segment.video_id}")
+        await fail(segment.video_id)
+
+    logger.info("Worker ready to receive jobs...")
+
+    await asyncio.gather(
+        *(consume(consumers[p], handle_video, shutdown_event, int(CLASS_VIDEO_CONCURRENCY[p])) for p in PRIORITIES),
+        *(consume(segment_consumers[p], handle_segment, shutdown_event, int(CLASS_SEGMENT_CONCURRENCY[p]), give_up_segment)
+          for p in PRIORITIES),
+        # Compacts and evicts the frames of finished videos, in the background
+        FrameLifecycle(storage).run(shutdown_event)
+    )
+
+    for client in clients:
+        await client.stop()
     logger.info("Processing worker stopped.")
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import case, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from shared.database import AsyncSessionLocal, dialect_insert
+from shared.models import ClassRollup, DetectedObject, DetectionResult
+
+# Width of the class_rollups time buckets. Changing it only affects buckets written afterwards.
+ROLLUP_BUCKET_SEC: int = int(os.getenv("ROLLUP_BUCKET_SEC", "60"))
+
+def bucket_start(ts: datetime, bucket_sec: int = ROLLUP_BUCKET_SEC) -> datetime:
+    epoch: int = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % bucket_sec, tz=timezone.utc)
+
+def object_rows(rows: Sequence[Dict[str, Any]], ids: Sequence[int], timestamp: datetime) -> List[Dict[str, Any]]:
+    """
+    Flattens detection result rows (with their inserted ids) into detected_objects rows.
+    Rows without their own "timestamp" get `timestamp`.
+    """
+    objects: List[Dict[str, Any]] = []
+    for detection_id, row in zip(ids, rows):
+        for d in row.get("detections") or []:
+            x1, y1, x2, y2 = (d.get("bbox") or [None] * 4)[:4]
+            objects.append({
+                "detection_id": detection_id,
+                "video_id": row["video_id"],
+                "frame_index": row.get("frame_index"),
+                "class_name": d.get("class"),
+                "confidence": d.get("conf", 0.0),
+                "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                "timestamp": row.get("timestamp") or timestamp,
+            })
+    return objects
+
+def rollup_rows(objects: Sequence[Dict[str, Any]], bucket_sec: int = ROLLUP_BUCKET_SEC) -> List[Dict[str, Any]]:
+    """
+    Aggregates objects per (video, class, bucket). Sorted by key, so concurrent
+    writers upsert in the same order and cannot deadlock each other.
+    """
+    totals: Dict[Tuple[str, str, datetime], Dict[str, Any]] = {}
+    frames: Dict[Tuple[str, str, datetime], set] = {}
+    for obj in objects:
+        key = (obj["video_id"], obj["class_name"], bucket_start(obj["timestamp"], bucket_sec))
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = {
+                "video_id": key[0], "class_name": key[1], "bucket": key[2],
+                "objects": 0, "frames": 0, "confidence_sum": 0.0, "max_confidence": 0.0,
+            }
+            frames[key] = set()
+        total["objects"] += 1
+        total["confidence_sum"] += obj["confidence"]
+        total["max_confidence"] = max(total["max_confidence"], obj["confidence"])
+        frames[key].add(obj["detection_id"])
+
+    for key, total in totals.items():
+        total["frames"] = len(frames[key])
+    return [totals[key] for key in sorted(totals)]
+
+async def record_detections(session: AsyncSession, rows: Sequence[Dict[str, Any]], ids: Sequence[int]) -> None:
+    """
+    Writes the per-object rows and rollup increments for newly inserted detection
+    results, in the caller's transaction so they commit (or roll back) together.
+    """
+    objects: List[Dict[str, Any]] = object_rows(rows, ids, datetime.now(timezone.utc))
+    if not objects:
+        return
+    await session.execute(insert(DetectedObject), objects)
+
+    stmt = dialect_insert(ClassRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["video_id", "class_name", "bucket"],
+        set_={
+            "objects": ClassRollup.objects + stmt.excluded.objects,
+            "frames": ClassRollup.frames + stmt.excluded.frames,
+            "confidence_sum": ClassRollup.confidence_sum + stmt.excluded.confidence_sum,
+            "max_confidence": case(
+                (stmt.excluded.max_confidence > ClassRollup.max_confidence, stmt.excluded.max_confidence),
+                else_=ClassRollup.max_confidence
+            ),
+        }
+    )
+    await session.execute(stmt, rollup_rows(objects))
+
+def _summary(class_name: str, objects: int, frames: int, confidence_sum: float, max_confidence: float) -> Dict[str, Any]:
+    return {
+        "class": class_name,
+        "objects": objects,
+        "frames": frames,
+        "avg_confidence": confidence_sum / objects if objects else 0.0,
+        "max_confidence": max_confidence,
+    }
+
+async def class_counts(video_id: str) -> List[Dict[str, Any]]:
+    """Object and frame counts per class for one video, most frequent first."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(
+                ClassRollup.class_name,
+                func.sum(ClassRollup.objects),
+                func.sum(ClassRollup.frames),
+                func.sum(ClassRollup.confidence_sum),
+                func.max(ClassRollup.max_confidence),
+            )
+            .where(ClassRollup.video_id == video_id)
+            .group_by(ClassRollup.class_name)
+            .order_by(func.sum(ClassRollup.objects).desc())
+        )
+        return [_summary(*row) for row in result.all()]
+
+async def class_timeline(start: datetime, end: datetime, video_id: Optional[str] = None,
+                         class_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Counts per time bucket and class in [start, end), optionally for one video or class."""
+    query = (
+        select(
+            ClassRollup.bucket,
+            ClassRollup.class_name,
+            func.sum(ClassRollup.objects),
+            func.sum(ClassRollup.frames),
+            func.sum(ClassRollup.confidence_sum),
+            func.max(ClassRollup.max_confidence),
+        )
+        .where(ClassRollup.bucket >= bucket_start(start), ClassRollup.bucket < end)
+        .group_by(ClassRollup.bucket, ClassRollup.class_name)
+        .order_by(ClassRollup.bucket, ClassRollup.class_name)
+    )
+    if video_id is not None:
+        query = query.where(ClassRollup.video_id == video_id)
+    if class_name is not None:
+        query = query.where(ClassRollup.class_name == class_name)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        return [{"bucket": bucket.isoformat(), **_summary(*rest)} for bucket, *rest in result.all()]
+
+async def find_objects(class_name: str, min_confidence: float = 0.0, video_id: Optional[str] = None,
+                       limit: int = 100) -> List[Tuple[DetectedObject, str, Optional[Dict[str, Any]]]]:
+    """Newest objects of a class at or above `min_confidence`, with their frame references and letterbox."""
+    query = (
+        select(DetectedObject, DetectionResult.frame_path, DetectionResult.letterbox)
+        .join(DetectionResult, DetectionResult.id == DetectedObject.detection_id)
+        .where(DetectedObject.class_name == class_name, DetectedObject.confidence >= min_confidence)
+        .order_by(DetectedObject.id.desc())
+        .limit(limit)
+    )
+    if video_id is not None:
+        query = query.where(DetectedObject.video_id == video_id)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        return [(obj, frame_path, letterbox) for obj, frame_path, letterbox in result.all()]
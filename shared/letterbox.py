@@ -0,0 +1,29 @@
+from typing import Any, Optional, Tuple
+
+import cv2
+
+# Padding colour of letterboxed model inputs, as in ultralytics' own letterboxing
+PAD_COLOR: Tuple[int, int, int] = (114, 114, 114)
+
+def letterbox(img: Any, size: int, interpolation: Optional[int] = None) -> Tuple[Any, float, int, int]:
+    """
+    Scales an image to fit a size x size square, keeping its aspect ratio, and pads it centred.
+    Returns (image, scale, pad_x, pad_y). Images that already have that size are returned as they are.
+
+    Both frames letterboxed at extraction (processing) and model inputs (detection backends)
+    go through here, so stored letterbox geometry always matches what the model sees.
+    `interpolation` defaults to INTER_AREA when shrinking and INTER_LINEAR otherwise.
+    """
+    height, width = img.shape[:2]
+    if (height, width) == (size, size):
+        return img, 1.0, 0, 0
+    scale: float = min(size / width, size / height)
+    new_width, new_height = round(width * scale), round(height * scale)
+    if (new_width, new_height) != (width, height):
+        if interpolation is None:
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (new_width, new_height), interpolation=interpolation)
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+    padded: Any = cv2.copyMakeBorder(img, pad_y, size - new_height - pad_y, pad_x, size - new_width - pad_x,
+                                     cv2.BORDER_CONSTANT, value=PAD_COLOR)
+    return padded, scale, pad_x, pad_y
@@ -0,0 +1,93 @@
+import logging
+import os
+import time
+import uuid
+from typing import Any, Optional, Tuple
+
+try:
+    import prometheus_client
+except ImportError: # Optional: without it every metric is a no-op and nothing is exported
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+# Port for the /metrics endpoint of the worker services (ingestion serves it on its API port); 0 disables
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
+
+# Seconds; latencies from sub-millisecond (hash verify) to minutes (end to end)
+FAST_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SLOW_BUCKETS: Tuple[float, ...] = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+class _NullMetric:
+    """Stands in for a metric when prometheus_client is not installed."""
+    def labels(self, *args: Any, **kwargs: Any) -> "_NullMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+def _metric(kind: str, name: str, documentation: str, labelnames: Tuple[str, ...] = (), **kwargs: Any) -> Any:
+    if prometheus_client is None:
+        return _NullMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+# Ingestion
+UPLOAD_BYTES = _metric("Counter", "upload_bytes_total", "Video bytes received and stored")
+UPLOAD_SECONDS = _metric("Histogram", "upload_seconds", "Time to receive and store an upload (or one chunk)", buckets=SLOW_BUCKETS)
+
+# Processing
+EXTRACTED_FRAMES = _metric("Counter", "extracted_frames_total", "Frames extracted, stored and published", ("mode",))
+EXTRACTION_SECONDS = _metric("Histogram", "extraction_seconds", "Time to extract a whole video or segment", buckets=SLOW_BUCKETS)
+
+# Detection
+FRAME_STAGE_SECONDS = _metric("Histogram", "frame_stage_seconds", "Per-frame time spent reading, verifying and decoding",
+                              ("stage",), buckets=FAST_BUCKETS)
+INFERENCE_SECONDS = _metric("Histogram", "inference_seconds", "Model forward pass over one batch", buckets=FAST_BUCKETS + (2.5, 5.0))
+DETECTED_FRAMES = _metric("Counter", "detected_frames_total", "Frames with stored results, by how their boxes were obtained",
+                          ("source",))
+FRAMES_IN_FLIGHT = _metric("Gauge", "frames_in_flight", "Frames consumed whose offsets are not yet committed")
+DB_WRITE_SECONDS = _metric("Histogram", "db_write_seconds", "Time to insert and commit one batch of detection results",
+                           buckets=FAST_BUCKETS + (2.5, 5.0))
+END_TO_END_SECONDS = _metric("Histogram", "end_to_end_seconds", "From the upload being stored to a frame's detections being committed",
+                             ("priority",), buckets=SLOW_BUCKETS)
+SCHEDULED_FRAMES = _metric("Gauge", "scheduled_frames", "Frame tasks fetched and waiting for a turn in an inference batch",
+                           ("priority",))
+
+# Kafka (all services)
+PUBLISH_SECONDS = _metric("Histogram", "kafka_publish_seconds", "From queuing a message to its acknowledgement by the broker",
+                          ("topic",), buckets=FAST_BUCKETS + (2.5, 5.0))
+CONSUMER_LAG = _metric("Gauge", "kafka_consumer_lag", "Messages between the last one fetched and the partition's end",
+                       ("topic", "partition"))
+CONSUMER_IN_FLIGHT = _metric("Gauge", "kafka_consumer_in_flight", "Messages fetched since the partition's commit point",
+                             ("topic", "partition"))
+
+def new_trace_id() -> str:
+    """Correlation ID for one upload, carried by every message derived from it."""
+    return uuid.uuid4().hex
+
+def now() -> float:
+    """Wall-clock time for latencies measured across services (e.g. VideoTask.uploaded_at)."""
+    return time.time()
+
+def serve_metrics(port: Optional[int] = None) -> None:
+    """Exposes this process's metrics over HTTP at :<port>/metrics."""
+    port = METRICS_PORT if port is None else port
+    if prometheus_client is None or port <= 0:
+        return
+    prometheus_client.start_http_server(port)
+    logger.info(f"Serving metrics on port {port}")
+
+def render_metrics() -> Tuple[bytes, str]:
+    """The current metrics in the Prometheus text format, and its content type."""
+    if prometheus_client is None:
+        return b"", "text/plain; charset=utf-8"
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, Float
+from sqlalchemy import BigInteger, Column, Integer, String, JSON, DateTime, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from shared.database import Base
 
@@ -12,4 +12,115 @@ class DetectionResult(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
     # Store list of detections: [{class: "person", conf: 0.9, box: [x1, y1, x2, y2]}, ...]
-    detections = Column(JSON) 
+    detections = Column(JSON)
+
+    # Perceptual hash of the frame (hex), used for near-duplicate detection reuse
+    phash = Column(String, nullable=True)
+    # "<video_id>:<frame_index>" whose detections were copied, if the model was skipped
+    reused_from = Column(String, nullable=True)
+    # "<video_id>:<frame_index>" of the detected frame whose boxes were tracked to this one; null if detected
+    tracked_from = Column(String, nullable=True)
+    # Letterbox applied at extraction (see shared.schemas.Letterbox); null for full-resolution frames
+    letterbox = Column(JSON, nullable=True)
+
+class DetectedObject(Base):
+    """
+    One row per detected object, written alongside its DetectionResult, so
+    frames can be filtered by class and confidence without parsing JSON.
+    """
+    __tablename__ = "detected_objects"
+    __table_args__ = (
+        Index("ix_detected_objects_class_conf", "class_name", "confidence"),
+        Index("ix_detected_objects_video_class", "video_id", "class_name"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    detection_id = Column(Integer, ForeignKey("detections.id", ondelete="CASCADE"), index=True)
+    video_id = Column(String, nullable=False)
+    frame_index = Column(Integer)
+    class_name = Column(String, nullable=False)
+    confidence = Column(Float, nullable=False)
+    # Normalized box corners
+    x1 = Column(Float)
+    y1 = Column(Float)
+    x2 = Column(Float)
+    y2 = Column(Float)
+    timestamp = Column(DateTime(timezone=True), index=True)
+
+class ClassRollup(Base):
+    """
+    Per-video, per-class object counts in fixed time buckets, updated
+    incrementally by the detection writer (see shared.analytics).
+    """
+    __tablename__ = "class_rollups"
+
+    video_id = Column(String, primary_key=True)
+    class_name = Column(String, primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True, index=True) # Start of the bucket
+    objects = Column(Integer, nullable=False, default=0)
+    frames = Column(Integer, nullable=False, default=0) # Frames with at least one object of the class
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+    max_confidence = Column(Float, nullable=False, default=0.0)
+
+class VideoRecord(Base):
+    """
+    Content-addressed registry: one row per distinct (video content, pipeline config).
+    The unique constraint makes concurrent duplicate uploads race for a single claim.
+    """
+    __tablename__ = "videos"
+    __table_args__ = (UniqueConstraint("video_hash", "config_key", name="uq_videos_hash_config"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_hash = Column(String, nullable=False)
+    config_key = Column(String, nullable=False)
+    # The video_id whose detections are shared by every upload of this content
+    video_id = Column(String, unique=True, index=True)
+    status = Column(String, default="processing") # processing | completed | failed
+    # Frame tasks published for the video, set when it completes; null for videos completed before it was recorded
+    frames = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class VideoLink(Base):
+    """
+    Maps a duplicate upload to the video_id that was actually processed. A duplicate of a
+    video still being processed is pending until that video completes or fails.
+    """
+    __tablename__ = "video_links"
+
+    video_id = Column(String, primary_key=True)
+    canonical_video_id = Column(String, index=True)
+    # The duplicate's VideoTask while the link is pending (to delete its upload on completion,
+    # or requeue it if the canonical video fails); null once linked
+    task = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class VideoSegment(Base):
+    """
+    Extraction progress of a long video split into segments (see SegmentTask).
+    The video's claim is completed once every segment is done.
+    """
+    __tablename__ = "video_segments"
+
+    video_id = Column(String, primary_key=True)
+    segment_index = Column(Integer, primary_key=True)
+    start_frame = Column(Integer, nullable=False)
+    end_frame = Column(Integer, nullable=True)
+    status = Column(String, default="pending") # pending | done
+    frames = Column(Integer, default=0) # Frame tasks published by the segment
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class FrameArchive(Base):
+    """
+    Retention state of a finished video's frames (see shared.retention): compacted into a
+    per-video archive pack, then evicted once they expire or the frame store is over quota.
+    """
+    __tablename__ = "frame_archives"
+
+    video_id = Column(String, primary_key=True)
+    status = Column(String, default="compacting") # compacting | compacted | evicted
+    frames = Column(Integer, default=0) # Frames kept in the archive
+    bytes = Column(BigInteger, default=0)
+    # Last time the dashboard served one of the archive's frames; drives TTL and LRU eviction
+    accessed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
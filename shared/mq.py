@@ -1,31 +1,81 @@
 import os
-import json
 import asyncio
 import logging
-from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
-from typing import Optional, Dict, Any, Tuple, Union
+import time
+from collections import deque
+from aiokafka import AIOKafkaProducer, AIOKafkaConsumer, ConsumerRebalanceListener, TopicPartition
+from typing import Optional, Callable, Collection, Deque, Dict, Any, Iterable, List, Sequence, Set, Tuple, Union
 from pydantic import BaseModel
+from shared.metrics import CONSUMER_IN_FLIGHT, CONSUMER_LAG, PUBLISH_SECONDS
+from shared.serialization import MessageSerializer, get_serializer, encode_message, decode_message
 
 logger = logging.getLogger(__name__)
 
+# Priority classes of uploads, most urgent first. Each class has its own topic per task type,
+# so urgent tasks never queue behind a backlog of other classes' tasks in a partition.
+PRIORITIES: Tuple[str, ...] = ("interactive", "normal", "bulk")
+
+def priority_topic(topic: str, priority: str = "normal") -> str:
+    """The topic carrying `priority` tasks of a type: the plain topic for normal ones, `<topic>-<priority>` otherwise."""
+    return topic if priority == "normal" else f"{topic}-{priority}"
+
+def priority_settings(value: str, default: float) -> Dict[str, float]:
+    """
+    Parses a per-class setting such as "interactive:16,normal:4,bulk:1".
+    Classes left out get `default`; unknown classes are ignored.
+    """
+    settings: Dict[str, float] = {priority: default for priority in PRIORITIES}
+    for item in value.split(","):
+        name, _, number = item.partition(":")
+        if name.strip() in settings and number.strip():
+            settings[name.strip()] = float(number)
+    return settings
+
 class KafkaProducer:
     """
     Asynchronous Kafka Producer.
+
+    `publish` waits for each message to be acknowledged by the broker. For bulk
+    traffic use `publish_nowait`/`publish_many`, which keep many sends in flight
+    and let the client batch them (see `linger_ms`, `max_batch_size` and
+    `compression_type`); call `flush` to wait until they are all delivered, or
+    `flush(futures)` to wait for (and check) only the given sends when several
+    jobs share the producer.
+    Messages are keyed by their `key_field` (the video ID by default) so that
+    all messages for one video land on the same partition, in order.
+    Messages go to `topic` unless a publish call names another one.
+    The wire format comes from MQ_WIRE_FORMAT (see shared.serialization).
     """
-    def __init__(self, topic: str, bootstrap_servers: str = "kafka:9092") -> None:
+    def __init__(self, topic: str, bootstrap_servers: str = "kafka:9092", key_field: Optional[str] = "video_id",
+                 serializer: Optional[MessageSerializer] = None) -> None:
         self.bootstrap_servers: str = os.getenv("KAFKA_BOOTSTRAP_SERVERS", bootstrap_servers)
         self.topic: str = topic
+        self.key_field: Optional[str] = key_field
+        self.linger_ms: int = int(os.getenv("KAFKA_LINGER_MS", "5"))
+        self.max_batch_size: int = int(os.getenv("KAFKA_MAX_BATCH_SIZE", "65536"))
+        self.compression_type: Optional[str] = os.getenv("KAFKA_COMPRESSION_TYPE") or None # lz4, zstd, gzip or unset
+        self.serializer: MessageSerializer = serializer or get_serializer()
         self.producer: Optional[AIOKafkaProducer] = None
+        self._pending: Set[asyncio.Future] = set()
+        self._failures: Dict[asyncio.Future, BaseException] = {} # Failed sends not reported by a flush yet
+
+    def _create_client(self) -> AIOKafkaProducer:
+        return AIOKafkaProducer(
+            bootstrap_servers=self.bootstrap_servers,
+            value_serializer=lambda v: encode_message(v, self.serializer),
+            # aiokafka serializes the key even when it is None (unkeyed messages, key_field=None)
+            key_serializer=lambda k: k.encode('utf-8') if k is not None else None,
+            linger_ms=self.linger_ms,
+            max_batch_size=self.max_batch_size,
+            compression_type=self.compression_type
+        )
 
     async def start(self) -> None:
         max_retries = 10
         retry_delay = 5
         for i in range(max_retries):
             try:
-                self.producer = AIOKafkaProducer(
-                    bootstrap_servers=self.bootstrap_servers,
-                    value_serializer=lambda v: json.dumps(v).encode('utf-8')
-                )
+                self.producer = self._create_client()
                 await self.producer.start()
                 logger.info(f"Kafka Producer started, topic: {self.topic}, connected to {self.bootstrap_servers}")
                 return
@@ -39,28 +89,177 @@ class KafkaProducer:
 
     async def stop(self) -> None:
         if self.producer:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to deliver pending messages on shutdown: {e}")
             await self.producer.stop()
 
-    async def publish(self, message: Union[Dict[str, Any], BaseModel]) -> None:
-        if not self.producer:
-            await self.start()
-        
+    def _prepare(self, message: Union[Dict[str, Any], BaseModel]) -> Tuple[Dict[str, Any], Optional[str]]:
         if isinstance(message, BaseModel):
             data = message.model_dump()
         else:
             data = message
-            
-        await self.producer.send_and_wait(self.topic, data)
+
+        key: Optional[str] = None
+        if self.key_field and data.get(self.key_field) is not None:
+            key = str(data[self.key_field])
+        return data, key
+
+    async def publish(self, message: Union[Dict[str, Any], BaseModel], topic: Optional[str] = None) -> None:
+        if not self.producer:
+            await self.start()
+
+        topic = topic or self.topic
+        data, key = self._prepare(message)
+        started: float = time.monotonic()
+        await self.producer.send_and_wait(topic, data, key=key)
+        PUBLISH_SECONDS.labels(topic).observe(time.monotonic() - started)
+
+    async def publish_nowait(self, message: Union[Dict[str, Any], BaseModel], topic: Optional[str] = None) -> asyncio.Future:
+        """
+        Queues a message for sending without waiting for the broker.
+        Returns the delivery future; failures are also reported by the next `flush`.
+        Only waits if the client's send buffer is full.
+        """
+        if not self.producer:
+            await self.start()
+
+        topic = topic or self.topic
+        data, key = self._prepare(message)
+        started: float = time.monotonic()
+        future: asyncio.Future = await self.producer.send(topic, data, key=key)
+        self._pending.add(future)
+        future.add_done_callback(lambda f: self._on_delivery(f, topic, started))
+        return future
+
+    async def publish_many(self, messages: Iterable[Union[Dict[str, Any], BaseModel]], topic: Optional[str] = None) -> None:
+        """
+        Sends all messages concurrently and waits until every one is delivered.
+        """
+        futures: List[asyncio.Future] = [await self.publish_nowait(m, topic) for m in messages]
+        await self.flush(futures)
+
+    async def flush(self, futures: Optional[Iterable[asyncio.Future]] = None) -> None:
+        """
+        Waits for every message queued with `publish_nowait` to be delivered, or only
+        for those whose delivery `futures` are given. Raises if any of them failed;
+        each failure is reported by one flush only.
+        """
+        if not self.producer:
+            return
+
+        if futures is None:
+            await self.producer.flush()
+            waiting: List[asyncio.Future] = list(self._pending)
+        else:
+            waiting = list(futures)
+        if waiting:
+            await asyncio.gather(*waiting, return_exceptions=True)
+
+        scope: Iterable[asyncio.Future] = list(self._failures) if futures is None else waiting
+        failures: List[BaseException] = [self._failures.pop(f) for f in scope if f in self._failures]
+        if failures:
+            raise RuntimeError(f"{len(failures)} Kafka message(s) failed to deliver: {failures[0]}")
+
+    def _on_delivery(self, future: asyncio.Future, topic: str, started: float) -> None:
+        self._pending.discard(future)
+        if future.cancelled():
+            self._failures[future] = asyncio.CancelledError()
+        elif future.exception() is not None:
+            self._failures[future] = future.exception()
+        else:
+            PUBLISH_SECONDS.labels(topic).observe(time.monotonic() - started)
+
+class PartitionWindow:
+    """
+    Offsets of one partition fetched but not yet committable.
+
+    Messages may complete in any order; the commit point only moves past a
+    message once it and every message fetched before it are complete.
+    """
+    def __init__(self) -> None:
+        self.offsets: Deque[int] = deque() # Fetched, in order, from the commit point on
+        self.completed: Set[int] = set() # Completed but behind an unfinished offset
+        self.end: Optional[int] = None # Just past the last offset fetched
+        self.committed: Optional[int] = None # Last offset committed (or handed out to commit)
+        self.released: Set[int] = set() # Given up on unprocessed; they hold the commit point back
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def pending(self) -> int:
+        """Messages still expected to be acknowledged: neither completed nor released."""
+        return len(self.offsets) - len(self.released) - len(self.completed)
+
+    def add(self, offset: int) -> None:
+        if self.committed is None:
+            self.committed = offset # Fetching resumed here, so everything before is committed
+        self.offsets.append(offset)
+        self.end = offset + 1
+
+    def release(self, offset: int) -> None:
+        """Marks a fetched offset as given up on: it is no longer waited for, but still never committed past."""
+        if self.offsets and self.offsets[0] <= offset < self.end and offset not in self.completed:
+            self.released.add(offset)
+
+    def complete(self, offset: int) -> Optional[int]:
+        """Marks an offset done. Returns the new offset to commit, or None if it did not move."""
+        if not self.offsets or offset < self.offsets[0] or offset >= self.end:
+            return None # Not in this window (e.g. fetched before a rebalance)
+        self.released.discard(offset) # Keeps the two sets disjoint, for `pending`
+        self.completed.add(offset)
+        while self.offsets and self.offsets[0] in self.completed:
+            self.completed.discard(self.offsets.popleft())
+        commit_to: int = self.offsets[0] if self.offsets else self.end
+        if commit_to <= self.committed:
+            return None
+        self.committed = commit_to
+        return commit_to
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    def __init__(self, consumer: "KafkaConsumer") -> None:
+        self.consumer: "KafkaConsumer" = consumer
+
+    async def on_partitions_revoked(self, revoked: Set[TopicPartition]) -> None:
+        await self.consumer._on_revoked(revoked)
+
+    async def on_partitions_assigned(self, assigned: Set[TopicPartition]) -> None:
+        self.consumer._on_assigned(assigned)
 
 class KafkaConsumer:
     """
     Asynchronous Kafka Consumer.
+
+    Fetched messages may be processed concurrently and acknowledged in any
+    order. Per partition, the consumer keeps a window of the messages fetched
+    since the last commit and only commits up to the oldest one still being
+    processed, so a commit never covers unfinished work. A partition whose
+    window holds `max_in_flight` messages is paused until acknowledgements
+    shrink it. When partitions are revoked in a rebalance, the consumer waits
+    up to `revoke_timeout_ms` for their messages to be acknowledged, commits
+    what is complete and forgets the rest: those messages are redelivered to
+    the partitions' new owner.
+    `topic` may be a list of topics (e.g. a task type's priority topics);
+    `get_batch` can then be limited to some of them.
     """
-    def __init__(self, topic: str, bootstrap_servers: str = "kafka:9092", group_id: str = "default-group") -> None:
+    def __init__(self, topic: Union[str, Sequence[str]], bootstrap_servers: str = "kafka:9092", group_id: str = "default-group",
+                 max_in_flight: Optional[int] = None) -> None:
         self.bootstrap_servers: str = os.getenv("KAFKA_BOOTSTRAP_SERVERS", bootstrap_servers)
-        self.topic: str = topic
+        self.topics: List[str] = [topic] if isinstance(topic, str) else list(topic)
+        self.topic: str = ",".join(self.topics) # For logging
         self.group_id: str = group_id
+        self.max_in_flight: int = max_in_flight or int(os.getenv("KAFKA_MAX_IN_FLIGHT", "1000"))
+        self.revoke_timeout: float = int(os.getenv("KAFKA_REVOKE_TIMEOUT_MS", "10000")) / 1000
         self.consumer: Optional[AIOKafkaConsumer] = None
+        self._windows: Dict[TopicPartition, PartitionWindow] = {}
+        self._paused: Set[TopicPartition] = set()
+        # Set whenever an acknowledgement shrinks a window; a revocation waits on it
+        self._acknowledged: asyncio.Event = asyncio.Event()
+        # Called with the partitions being revoked, before waiting for their messages in flight,
+        # e.g. to release messages fetched but not started
+        self.revoke_listeners: List[Callable[[Set[TopicPartition]], None]] = []
 
     async def start(self) -> None:
         max_retries = 10
@@ -68,13 +267,13 @@ class KafkaConsumer:
         for i in range(max_retries):
             try:
                 self.consumer = AIOKafkaConsumer(
-                    self.topic,
                     bootstrap_servers=self.bootstrap_servers,
                     group_id=self.group_id,
-                    value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+                    value_deserializer=decode_message, # Accepts every wire format, including legacy JSON
                     auto_offset_reset='earliest',
                     enable_auto_commit=False # Manual commit for reliability
                 )
+                self.consumer.subscribe(self.topics, listener=_RebalanceListener(self))
                 await self.consumer.start()
                 logger.info(f"Kafka Consumer started, topic: {self.topic}, joined group {self.group_id}")
                 return
@@ -90,29 +289,168 @@ class KafkaConsumer:
         if self.consumer:
             await self.consumer.stop()
 
-    async def get_next_job(self) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    async def get_next_job(self, timeout_ms: int = 1000) -> Optional[Tuple[Any, Dict[str, Any]]]:
         """
-        Reads from the consumer group.
+        Reads one message from the consumer group, waiting at most `timeout_ms`.
         Returns: (message_obj, data_dict) or None
         """
+        batch: List[Tuple[Any, Dict[str, Any]]] = await self.get_batch(1, timeout_ms)
+        return batch[0] if batch else None
+
+    async def get_batch(self, max_records: int, timeout_ms: int,
+                        topics: Optional[Collection[str]] = None) -> List[Tuple[Any, Dict[str, Any]]]:
+        """
+        Gathers up to `max_records` messages, waiting at most `timeout_ms` for the batch to fill
+        (with 0, returns what was already fetched). `topics` limits it to some of the subscribed topics.
+        Returns: list of (message_obj, data_dict), possibly empty.
+        """
         if not self.consumer:
             await self.start()
-            
-        try:
-            # Consume one message
-            async for msg in self.consumer:
-                return msg, msg.value
-        except Exception as e:
-            logger.error(f"Kafka Consumer error: {e}")
-            return None
+
+        partitions: List[TopicPartition] = []
+        if topics is not None:
+            partitions = [tp for tp in self.consumer.assignment() if tp.topic in topics]
+            if not partitions:
+                return []
+
+        loop = asyncio.get_running_loop()
+        deadline: float = loop.time() + timeout_ms / 1000
+        batch: List[Tuple[Any, Dict[str, Any]]] = []
+
+        while len(batch) < max_records:
+            remaining_ms: int = max(int((deadline - loop.time()) * 1000), 0)
+            try:
+                records = await self.consumer.getmany(*partitions, timeout_ms=remaining_ms, max_records=max_records - len(batch))
+            except Exception as e:
+                logger.error(f"Kafka Consumer error: {e}")
+                break
+            for messages in records.values():
+                for msg in messages:
+                    self._track(msg)
+                    batch.append((msg, msg.value))
+                if messages:
+                    self._record_lag(messages[-1])
+            if remaining_ms <= 0:
+                break
+
+        return batch
+
+    def _record_lag(self, msg: Any) -> None:
+        highwater: Optional[int] = self.consumer.highwater(TopicPartition(msg.topic, msg.partition))
+        if highwater is not None:
+            CONSUMER_LAG.labels(msg.topic, str(msg.partition)).set(max(highwater - msg.offset - 1, 0))
+
+    def _track(self, msg: Any) -> None:
+        """Adds a fetched message to its partition's window, pausing the partition once the window is full."""
+        tp = TopicPartition(msg.topic, msg.partition)
+        window: PartitionWindow = self._windows.setdefault(tp, PartitionWindow())
+        window.add(msg.offset)
+        CONSUMER_IN_FLIGHT.labels(msg.topic, str(msg.partition)).set(len(window))
+        if len(window) >= self.max_in_flight and tp not in self._paused:
+            self._paused.add(tp)
+            if self.consumer:
+                self.consumer.pause(tp)
+            logger.info(f"Paused {tp.topic}[{tp.partition}]: {len(window)} messages in flight")
+
+    def _complete(self, messages: Iterable[Any]) -> Dict[TopicPartition, int]:
+        """Marks messages done. Returns the offsets to commit for the partitions whose commit point moved."""
+        offsets: Dict[TopicPartition, int] = {}
+        for msg in messages:
+            tp = TopicPartition(msg.topic, msg.partition)
+            window: Optional[PartitionWindow] = self._windows.get(tp)
+            if window is None:
+                continue # Revoked since it was fetched
+            commit_to: Optional[int] = window.complete(msg.offset)
+            if commit_to is not None:
+                offsets[tp] = commit_to
+
+        for tp in offsets:
+            window = self._windows[tp]
+            CONSUMER_IN_FLIGHT.labels(tp.topic, str(tp.partition)).set(len(window))
+            if tp in self._paused and len(window) < self.max_in_flight:
+                self._paused.discard(tp)
+                if self.consumer:
+                    self.consumer.resume(tp)
+                logger.info(f"Resumed {tp.topic}[{tp.partition}]")
+        if offsets:
+            self._acknowledged.set()
+        return offsets
+
+    def release(self, messages: Iterable[Any]) -> None:
+        """
+        Gives up on fetched messages that will not be processed here (e.g. ones still buffered
+        when their partition is revoked). Nothing is committed past them, so they are redelivered.
+        """
+        for msg in messages:
+            window: Optional[PartitionWindow] = self._windows.get(TopicPartition(msg.topic, msg.partition))
+            if window is not None:
+                window.release(msg.offset)
+        self._acknowledged.set()
+
+    def _pending(self, partitions: Iterable[TopicPartition]) -> int:
+        return sum(self._windows[tp].pending for tp in partitions if tp in self._windows)
+
+    async def _on_revoked(self, revoked: Set[TopicPartition]) -> None:
+        """Gives the revoked partitions' messages in flight a chance to finish, then commits them."""
+        for listener in self.revoke_listeners:
+            listener(revoked)
+        loop = asyncio.get_running_loop()
+        deadline: float = loop.time() + self.revoke_timeout
+        while self._pending(revoked):
+            remaining: float = deadline - loop.time()
+            if remaining <= 0:
+                pending: int = self._pending(revoked)
+                logger.warning(f"{pending} messages of revoked partitions are still in flight; they will be redelivered")
+                break
+            self._acknowledged.clear()
+            try:
+                await asyncio.wait_for(self._acknowledged.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        offsets: Dict[TopicPartition, int] = {}
+        for tp in revoked:
+            window: Optional[PartitionWindow] = self._windows.pop(tp, None)
+            self._paused.discard(tp)
+            CONSUMER_IN_FLIGHT.labels(tp.topic, str(tp.partition)).set(0)
+            # Acknowledgements normally commit as they go; this covers commits that failed
+            if window is not None and window.committed is not None:
+                offsets[tp] = window.committed
+        if offsets:
+            try:
+                await self.consumer.commit(offsets)
+            except Exception as e:
+                logger.error(f"Error committing offsets of revoked partitions: {e}")
+        if revoked:
+            logger.info(f"Partitions revoked: {sorted(tp.partition for tp in revoked)}")
+
+    def _on_assigned(self, assigned: Set[TopicPartition]) -> None:
+        # Fetching restarts from the committed offsets with nothing in flight
+        for tp in assigned:
+            self._windows[tp] = PartitionWindow()
+            self._paused.discard(tp)
+        if assigned:
+            logger.info(f"Partitions assigned: {sorted(tp.partition for tp in assigned)}")
 
     async def acknowledge(self, message: Any) -> None:
         """
         Acknowledge message processing. In Kafka, this means committing the offset.
         """
+        await self.acknowledge_many([message])
+
+    async def acknowledge_many(self, messages: Iterable[Any]) -> None:
+        """
+        Marks the given messages as processed and commits, per partition, up to
+        the oldest fetched message that has not been acknowledged yet.
+        Messages can be acknowledged in any order.
+        """
         if not self.consumer:
             return
+
+        offsets: Dict[TopicPartition, int] = self._complete(messages)
+        if not offsets:
+            return
         try:
-            await self.consumer.commit()
+            await self.consumer.commit(offsets)
         except Exception as e:
             logger.error(f"Error committing Kafka offset: {e}")
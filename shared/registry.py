@@ -0,0 +1,226 @@
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from shared.database import AsyncSessionLocal, dialect_insert
+from shared.models import VideoRecord, VideoLink, VideoSegment
+
+logger = logging.getLogger(__name__)
+
+class Claim(NamedTuple):
+    # None if the caller should do the work: it won the claim, took over a failed attempt,
+    # or is redelivering its own unfinished task. Otherwise the video holding the detections.
+    canonical_id: Optional[str]
+    # The canonical video is still being processed: the caller's upload was recorded as a
+    # pending link, resolved when that video completes (or requeued if it fails), so the
+    # caller should just keep the upload and move on
+    pending: bool = False
+
+class Completion(NamedTuple):
+    frames: int # Frame tasks published for the video
+    duplicates: List[str] # Uploads of pending duplicates linked by the completion, to be deleted
+
+async def claim_video(video_hash: str, config_key: str, video_id: str,
+                      task: Optional[Dict[str, Any]] = None) -> Claim:
+    """
+    Registers `video_id` as the one processing this content under this config.
+
+    If another upload of the content completed, links `video_id` to it: the caller should
+    skip extraction and inference. If it is still processing, `video_id` is linked as pending,
+    keeping `task` (the duplicate's VideoTask) so that it is never left without results:
+    complete_video hands its upload back for deletion, and fail_video hands the task back
+    to be requeued, when it takes the work over.
+    """
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            dialect_insert(VideoRecord)
+            .values(video_hash=video_hash, config_key=config_key, video_id=video_id, status="processing")
+            .on_conflict_do_nothing(index_elements=["video_hash", "config_key"])
+        )
+        result = await session.execute(
+            select(VideoRecord.video_id, VideoRecord.status).where(
+                VideoRecord.video_hash == video_hash,
+                VideoRecord.config_key == config_key
+            )
+        )
+        canonical_id, status = result.one()
+
+        if status == "failed" and canonical_id != video_id:
+            # Take over a failed attempt; only one concurrent claimant can win this update
+            taken = await session.execute(
+                update(VideoRecord)
+                .where(VideoRecord.video_id == canonical_id, VideoRecord.status == "failed")
+                .values(video_id=video_id, status="processing")
+            )
+            if taken.rowcount == 1:
+                # Uploads linked to the failed attempt (and the failed upload itself) now follow this one
+                await session.execute(delete(VideoLink).where(VideoLink.video_id == video_id))
+                await session.execute(
+                    update(VideoLink).where(VideoLink.canonical_video_id == canonical_id).values(canonical_video_id=video_id)
+                )
+                await session.execute(
+                    dialect_insert(VideoLink)
+                    .values(video_id=canonical_id, canonical_video_id=video_id)
+                    .on_conflict_do_nothing(index_elements=["video_id"])
+                )
+                canonical_id, status = video_id, "processing"
+
+        if canonical_id == video_id:
+            if status == "completed":
+                return Claim(video_id)
+            if status == "failed":
+                await session.execute(
+                    update(VideoRecord).where(VideoRecord.video_id == video_id).values(status="processing")
+                )
+            await session.commit()
+            return Claim(None)
+
+        if status != "completed":
+            # A redelivered duplicate keeps the link it already has
+            await session.execute(
+                dialect_insert(VideoLink)
+                .values(video_id=video_id, canonical_video_id=canonical_id, task=task or {"video_id": video_id})
+                .on_conflict_do_nothing(index_elements=["video_id"])
+            )
+            await session.commit()
+            return Claim(canonical_id, pending=True)
+
+        statement = dialect_insert(VideoLink).values(video_id=video_id, canonical_video_id=canonical_id)
+        await session.execute(
+            statement.on_conflict_do_update(index_elements=["video_id"],
+                                            set_={"canonical_video_id": canonical_id, "task": None})
+        )
+        await session.commit()
+        return Claim(canonical_id)
+
+async def _link_duplicates(session: AsyncSession, video_id: str) -> List[str]:
+    """Resolves the pending links to a completed video. Returns the duplicates' upload paths."""
+    result = await session.execute(
+        select(VideoLink.task).where(VideoLink.canonical_video_id == video_id, VideoLink.task.is_not(None))
+    )
+    paths: List[str] = [task["video_path"] for task in result.scalars() if task and task.get("video_path")]
+    await session.execute(
+        update(VideoLink)
+        .where(VideoLink.canonical_video_id == video_id, VideoLink.task.is_not(None))
+        .values(task=None)
+    )
+    return paths
+
+async def complete_video(video_id: str, frames: int) -> List[str]:
+    """
+    Marks a claim as completed and links its pending duplicates to it.
+    Returns the uploads of those duplicates, which are no longer needed.
+    """
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(VideoRecord).where(VideoRecord.video_id == video_id).values(status="completed", frames=frames)
+        )
+        duplicates: List[str] = await _link_duplicates(session, video_id)
+        await session.commit()
+        return duplicates
+
+async def fail_video(video_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Marks a claim as failed so the next upload of the same content takes the work over.
+    Returns the task of its oldest pending duplicate, if any, for the caller to requeue:
+    that duplicate then takes the work over, and the others follow it.
+    """
+    async with AsyncSessionLocal() as session:
+        failed = await session.execute(
+            update(VideoRecord)
+            .where(VideoRecord.video_id == video_id, VideoRecord.status != "failed")
+            .values(status="failed")
+        )
+        result = await session.execute(
+            select(VideoLink.task)
+            .where(VideoLink.canonical_video_id == video_id, VideoLink.task.is_not(None))
+            .order_by(VideoLink.created_at, VideoLink.video_id)
+            .limit(1)
+        )
+        task: Optional[Dict[str, Any]] = result.scalar_one_or_none()
+        await session.commit()
+        # Requeued once per failure, not again when a failed claim is failed again
+        return task if failed.rowcount == 1 else None
+
+async def resolve_video_id(video_id: str) -> str:
+    """
+    Returns the video_id that holds the detections for `video_id`.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(VideoLink.canonical_video_id).where(VideoLink.video_id == video_id)
+        )
+        return result.scalar_one_or_none() or video_id
+
+async def register_segments(video_id: str, segments: List[Tuple[int, Optional[int]]]) -> List[Tuple[int, int, Optional[int]]]:
+    """
+    Records the segments a claimed video was split into. Re-planning the same video keeps existing progress.
+    Returns the (segment_index, start_frame, end_frame) of the segments not extracted yet, as recorded.
+    """
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            dialect_insert(VideoSegment)
+            .on_conflict_do_nothing(index_elements=["video_id", "segment_index"]),
+            [
+                {"video_id": video_id, "segment_index": i, "start_frame": start, "end_frame": end, "status": "pending", "frames": 0}
+                for i, (start, end) in enumerate(segments)
+            ]
+        )
+        result = await session.execute(
+            select(VideoSegment.segment_index, VideoSegment.start_frame, VideoSegment.end_frame)
+            .where(VideoSegment.video_id == video_id, VideoSegment.status != "done")
+            .order_by(VideoSegment.segment_index)
+        )
+        pending: List[Tuple[int, int, Optional[int]]] = [tuple(r) for r in result.all()]
+        await session.commit()
+        return pending
+
+async def is_segment_done(video_id: str, segment_index: int) -> bool:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(VideoSegment.status).where(
+                VideoSegment.video_id == video_id,
+                VideoSegment.segment_index == segment_index
+            )
+        )
+        return result.scalar_one_or_none() == "done"
+
+async def finish_segment(video_id: str, segment_index: int, frames: int) -> Optional[Completion]:
+    """
+    Marks a segment as extracted. If it was the last one, completes the video (as complete_video)
+    and returns the total number of frames published for it; otherwise None.
+    Exactly one caller sees the completion, even if segments finish concurrently.
+    """
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(VideoSegment)
+            .where(VideoSegment.video_id == video_id, VideoSegment.segment_index == segment_index)
+            .values(status="done", frames=frames)
+        )
+        await session.commit()
+
+        # Our update is committed first, so of two segments finishing together at least one sees zero left
+        result = await session.execute(
+            select(func.count())
+            .select_from(VideoSegment)
+            .where(VideoSegment.video_id == video_id, VideoSegment.status != "done")
+        )
+        if result.scalar():
+            return None
+
+        total = await session.execute(
+            select(func.sum(VideoSegment.frames)).where(VideoSegment.video_id == video_id)
+        )
+        frames_total: int = total.scalar() or 0
+        completed = await session.execute(
+            update(VideoRecord)
+            .where(VideoRecord.video_id == video_id, VideoRecord.status == "processing")
+            .values(status="completed", frames=frames_total)
+        )
+        if completed.rowcount != 1:
+            return None
+        duplicates: List[str] = await _link_duplicates(session, video_id)
+        await session.commit()
+        return Completion(frames_total, duplicates)
@@ -0,0 +1,442 @@
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, func, or_, update
+from sqlalchemy.future import select
+
+from shared.database import AsyncSessionLocal, dialect_insert
+from shared.models import DetectionResult, FrameArchive, VideoRecord, VideoSegment
+from shared.storage import FileSystemStorage, PackedFrameStorage
+
+logger = logging.getLogger(__name__)
+
+# Frames kept when a finished video is compacted: "all", or "detections" (frames with at
+# least one detection, plus every FRAME_THUMBNAIL_EVERY-th frame so the video can be browsed)
+FRAME_RETENTION: str = os.getenv("FRAME_RETENTION", "all")
+FRAME_THUMBNAIL_EVERY: int = int(os.getenv("FRAME_THUMBNAIL_EVERY", "10"))
+# A completed video is compacted once every published frame has a detection row and
+# no detections have been stored for it for this long
+FRAME_SETTLE_SEC: float = float(os.getenv("FRAME_SETTLE_SEC", "600"))
+# Archives not viewed for this long are deleted; 0 keeps them
+FRAME_TTL_HOURS: float = float(os.getenv("FRAME_TTL_HOURS", "0"))
+# Size limit of the frame store; beyond it the least recently viewed archives are deleted. 0 disables
+FRAME_QUOTA_GB: float = float(os.getenv("FRAME_QUOTA_GB", "0"))
+# Disk bandwidth compaction may use (read + write), so it does not compete with extraction and detection
+FRAME_LIFECYCLE_MBPS: float = float(os.getenv("FRAME_LIFECYCLE_MBPS", "20"))
+# Seconds between lifecycle passes; 0 disables the lifecycle manager
+FRAME_LIFECYCLE_INTERVAL_SEC: float = float(os.getenv("FRAME_LIFECYCLE_INTERVAL_SEC", "300"))
+
+# Storage key of a video's archive pack: frames/<video_id>-archive.pack
+ARCHIVE_SUFFIX: str = "-archive"
+# Videos compacted per pass
+MAX_VIDEOS_PER_PASS: int = 20
+# A "compacting" claim this old was abandoned by a crashed worker and can be taken over
+STALE_CLAIM: timedelta = timedelta(hours=1)
+
+def archive_key(video_id: str) -> str:
+    return f"{video_id}{ARCHIVE_SUFFIX}"
+
+def archived_video_id(storage_key: str) -> Optional[str]:
+    """The video of an archive's storage key, None for any other key."""
+    if storage_key.endswith(ARCHIVE_SUFFIX):
+        return storage_key[:-len(ARCHIVE_SUFFIX)]
+    return None
+
+class ArchivedFrame(NamedTuple):
+    frame_index: int
+    reference: str # Source reference
+    keep: bool
+
+def select_frames(rows: List[Tuple[int, int, Optional[str], Any]], policy: str, thumbnail_every: int) -> List[ArchivedFrame]:
+    """
+    Picks the frames to keep from a video's (id, frame_index, frame_path, detections) rows,
+    one entry per frame even if redelivery stored it twice.
+    """
+    frames: Dict[int, ArchivedFrame] = {}
+    for _, frame_index, frame_path, detections in rows:
+        if frame_path is None:
+            continue
+        existing: Optional[ArchivedFrame] = frames.get(frame_index)
+        keep: bool = policy != "detections" or bool(detections)
+        frames[frame_index] = ArchivedFrame(frame_index, frame_path, keep or (existing is not None and existing.keep))
+
+    ordered: List[ArchivedFrame] = [frames[i] for i in sorted(frames)]
+    if policy == "detections" and thumbnail_every > 0:
+        ordered = [f._replace(keep=True) if n % thumbnail_every == 0 else f for n, f in enumerate(ordered)]
+    return ordered
+
+def _lower_priority() -> None:
+    """Runs the lifecycle thread at the lowest CPU priority (Linux applies nice per thread)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+class AccessLog:
+    """
+    Remembers which archives the dashboard served frames from, and periodically
+    stamps their `accessed_at` so eviction can pick the least recently viewed ones.
+    `record` is cheap and thread-safe; `flush` does one UPDATE per pass.
+    """
+    def __init__(self) -> None:
+        self._accessed: Set[str] = set()
+        self._lock: threading.Lock = threading.Lock()
+
+    def record(self, storage_key: str) -> None:
+        video_id: Optional[str] = archived_video_id(storage_key)
+        if video_id is not None:
+            with self._lock:
+                self._accessed.add(video_id)
+
+    async def flush(self) -> None:
+        with self._lock:
+            accessed, self._accessed = self._accessed, set()
+        if not accessed:
+            return
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(FrameArchive).where(FrameArchive.video_id.in_(accessed)).values(accessed_at=func.now())
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Could not record frame archive accesses: {e}")
+
+    async def run(self, interval_sec: float = 60) -> None:
+        while True:
+            await asyncio.sleep(interval_sec)
+            await self.flush()
+
+class FrameLifecycle:
+    """
+    Keeps the frame store from growing without bound.
+
+    Each pass:
+    1. Compacts every completed video whose detections have settled: the frames
+       chosen by `policy` are copied into one archive pack per video, detection
+       rows are pointed at the archive (or at nothing, for dropped frames), and
+       the per-frame files, packs and segment packs are deleted.
+    2. Deletes archives not viewed for `ttl`.
+    3. While the store is over `quota_bytes`, deletes the least recently viewed archives.
+
+    File I/O runs on one low-priority thread, throttled to `mbps`. Work is claimed
+    through `frame_archives` rows, so several workers can run this side by side.
+    """
+    def __init__(self, storage: FileSystemStorage, policy: str = FRAME_RETENTION, thumbnail_every: int = FRAME_THUMBNAIL_EVERY,
+                 settle_sec: float = FRAME_SETTLE_SEC, ttl_hours: float = FRAME_TTL_HOURS, quota_gb: float = FRAME_QUOTA_GB,
+                 mbps: float = FRAME_LIFECYCLE_MBPS) -> None:
+        if policy not in ("all", "detections"):
+            raise ValueError(f"Unknown frame retention policy '{policy}', expected 'all' or 'detections'")
+        # Archives are packs whatever FRAME_STORE is; reading through a pack store also reads plain files
+        self.packs: PackedFrameStorage = storage if isinstance(storage, PackedFrameStorage) else PackedFrameStorage(storage.base_path)
+        self.policy: str = policy
+        self.thumbnail_every: int = thumbnail_every
+        self.settle: timedelta = timedelta(seconds=settle_sec)
+        self.ttl: Optional[timedelta] = timedelta(hours=ttl_hours) if ttl_hours > 0 else None
+        self.quota_bytes: int = int(quota_gb * 1024 ** 3)
+        self.bytes_per_sec: float = mbps * 1024 ** 2
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-lifecycle",
+                                                                initializer=_lower_priority)
+
+    async def run(self, stop: asyncio.Event, interval_sec: float = FRAME_LIFECYCLE_INTERVAL_SEC) -> None:
+        if interval_sec <= 0:
+            return
+        logger.info(f"Frame lifecycle: keeping {self.policy} frames, ttl {self.ttl or 'none'}, "
+                    f"quota {self.quota_bytes or 'none'} bytes, every {interval_sec}s")
+        while not stop.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Frame lifecycle pass failed: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval_sec)
+            except asyncio.TimeoutError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def run_once(self) -> None:
+        for video_id in await self.settled_videos():
+            await self.compact(video_id)
+        if self.ttl is not None:
+            for video_id in await self.expired_archives():
+                await self.evict(video_id, "expired")
+        if self.quota_bytes > 0:
+            await self.enforce_quota()
+
+    async def _io(self, fn: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def settled_videos(self) -> List[str]:
+        """
+        Completed videos without an archive, every published frame of which has been detected,
+        whose last detection is older than the settle time. Frames still waiting in the
+        detection backlog keep their video from being compacted (and its files from being
+        deleted). Videos whose frame count was not recorded, or with frames detection
+        dropped as unreadable, are never compacted.
+        """
+        cutoff: datetime = datetime.now(timezone.utc) - self.settle
+        last_detection = (
+            select(func.max(DetectionResult.timestamp))
+            .where(DetectionResult.video_id == VideoRecord.video_id)
+            .scalar_subquery()
+        )
+        # Redelivery can store a frame twice, so frames are counted by index
+        detected_frames = (
+            select(func.count(DetectionResult.frame_index.distinct()))
+            .where(DetectionResult.video_id == VideoRecord.video_id)
+            .scalar_subquery()
+        )
+        stale_claim = select(FrameArchive.video_id).where(
+            FrameArchive.status == "compacting", FrameArchive.updated_at < datetime.now(timezone.utc) - STALE_CLAIM
+        )
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(VideoRecord.video_id)
+                .where(
+                    VideoRecord.status == "completed",
+                    VideoRecord.updated_at < cutoff,
+                    VideoRecord.frames.is_not(None),
+                    detected_frames >= VideoRecord.frames,
+                    or_(VideoRecord.frames == 0, last_detection < cutoff),
+                    or_(
+                        VideoRecord.video_id.not_in(select(FrameArchive.video_id)),
+                        VideoRecord.video_id.in_(stale_claim)
+                    )
+                )
+                .order_by(VideoRecord.updated_at)
+                .limit(MAX_VIDEOS_PER_PASS)
+            )
+            return list(result.scalars().all())
+
+    async def _claim(self, video_id: str) -> bool:
+        async with AsyncSessionLocal() as session:
+            inserted = await session.execute(
+                dialect_insert(FrameArchive)
+                .values(video_id=video_id, status="compacting")
+                .on_conflict_do_nothing(index_elements=["video_id"])
+            )
+            if inserted.rowcount != 1:
+                # Take over a claim abandoned by a crashed worker
+                inserted = await session.execute(
+                    update(FrameArchive)
+                    .where(FrameArchive.video_id == video_id, FrameArchive.status == "compacting",
+                           FrameArchive.updated_at < datetime.now(timezone.utc) - STALE_CLAIM)
+                    .values(updated_at=func.now())
+                )
+            await session.commit()
+            return inserted.rowcount == 1
+
+    async def _release(self, video_id: str) -> None:
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(FrameArchive).where(FrameArchive.video_id == video_id, FrameArchive.status == "compacting"))
+            await session.commit()
+
+    async def _source_keys(self, video_id: str) -> List[str]:
+        """Storage keys a video's frames were written under: the video itself and its segments."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(VideoSegment.segment_index).where(VideoSegment.video_id == video_id))
+            return [video_id] + [f"{video_id}-s{i}" for i in result.scalars().all()]
+
+    async def compact(self, video_id: str) -> None:
+        if not await self._claim(video_id):
+            return
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(DetectionResult.id, DetectionResult.frame_index, DetectionResult.frame_path, DetectionResult.detections)
+                    .where(DetectionResult.video_id == video_id)
+                )
+                rows: List[Tuple[int, int, Optional[str], Any]] = [tuple(r) for r in result.all()]
+
+            frames: List[ArchivedFrame] = select_frames(rows, self.policy, self.thumbnail_every)
+            references, size = await self._io(self._write_archive, video_id, [f for f in frames if f.keep])
+
+            key: str = archive_key(video_id)
+            async with AsyncSessionLocal() as session:
+                # Point rows at their archived frames by index, so rows redelivered since the select
+                # above are repointed too; every other row (of a dropped, unreadable or late frame)
+                # loses its path, so none is left pointing at the sources deleted below
+                table = DetectionResult.__table__
+                if references:
+                    await session.execute(
+                        update(table)
+                        .where(table.c.video_id == video_id, table.c.frame_index == bindparam("index"))
+                        .values(frame_path=bindparam("path")),
+                        [{"index": frame_index, "path": path} for frame_index, path in references.items()]
+                    )
+                await session.execute(
+                    update(table)
+                    .where(table.c.video_id == video_id, table.c.frame_path.is_not(None),
+                           table.c.frame_path.not_like(f"{PackedFrameStorage.PREFIX}{key}:%"))
+                    .values(frame_path=None)
+                )
+                await session.execute(
+                    update(FrameArchive).where(FrameArchive.video_id == video_id)
+                    .values(status="compacted", frames=len(references), bytes=size, accessed_at=func.now())
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to compact frames of video {video_id}: {e}")
+            await self._io(self._delete_archive, video_id)
+            await self._release(video_id)
+            return
+
+        # The archive is committed: sources that cannot be deleted now are only wasted space
+        await self._io(self._delete_sources, await self._source_keys(video_id))
+        logger.info(f"Compacted video {video_id}: kept {len(references)} of {len(frames)} frames ({size} bytes)")
+
+    def _throttle(self, started: float, processed: int) -> None:
+        if self.bytes_per_sec > 0:
+            ahead: float = processed / self.bytes_per_sec - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def _write_archive(self, video_id: str, frames: List[ArchivedFrame]) -> Tuple[Dict[int, str], int]:
+        """
+        Copies frames into the video's archive pack and index, written under temporary
+        names and renamed into place once complete. Returns the new reference of each
+        archived frame index, and the archive's size. Unreadable frames are skipped.
+        """
+        key: str = archive_key(video_id)
+        pack_path, index_path = self.packs.pack_path(key), self.packs.index_path(key)
+        references: Dict[int, str] = {}
+        started: float = time.monotonic()
+        processed: int = 0
+        with open(pack_path + ".tmp", "wb") as pack, open(index_path + ".tmp", "wb") as index:
+            for frame in frames:
+                try:
+                    data: bytes = bytes(self.packs.read_frame(frame.reference))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable frame {frame.frame_index} of video {video_id}: {e}")
+                    continue
+                offset: int = pack.tell()
+                pack.write(data)
+                index.write(PackedFrameStorage.INDEX_RECORD.pack(frame.frame_index, offset, len(data)))
+                references[frame.frame_index] = PackedFrameStorage.make_reference(key, frame.frame_index, offset, len(data))
+                processed += 2 * len(data)
+                self._throttle(started, processed)
+            size: int = pack.tell()
+            for f in (pack, index):
+                f.flush()
+                os.fsync(f.fileno())
+        # The index last: readers find frames through it
+        os.replace(pack_path + ".tmp", pack_path)
+        os.replace(index_path + ".tmp", index_path)
+        return references, size
+
+    def _delete_archive(self, video_id: str) -> None:
+        key: str = archive_key(video_id)
+        for path in (self.packs.pack_path(key), self.packs.index_path(key)):
+            for candidate in (path, path + ".tmp"):
+                if os.path.exists(candidate):
+                    os.remove(candidate)
+
+    def _delete_sources(self, keys: List[str]) -> None:
+        for key in keys:
+            directory: str = os.path.join(self.packs.frames_path, key)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory, ignore_errors=True)
+            for path in (self.packs.pack_path(key), self.packs.index_path(key)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not delete frame source {path}: {e}")
+
+    async def expired_archives(self) -> List[str]:
+        cutoff: datetime = datetime.now(timezone.utc) - self.ttl
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(FrameArchive.video_id)
+                .where(FrameArchive.status == "compacted", FrameArchive.accessed_at < cutoff)
+                .order_by(FrameArchive.accessed_at)
+            )
+            return list(result.scalars().all())
+
+    async def evict(self, video_id: str, reason: str) -> int:
+        """Deletes a video's archive and clears its frame references. Returns the bytes freed."""
+        async with AsyncSessionLocal() as session:
+            claimed = await session.execute(
+                update(FrameArchive)
+                .where(FrameArchive.video_id == video_id, FrameArchive.status == "compacted")
+                .values(status="evicted")
+                .returning(FrameArchive.bytes)
+            )
+            freed: Optional[int] = claimed.scalar_one_or_none()
+            if freed is None:
+                await session.rollback()
+                return 0 # Evicted by another worker
+            await session.execute(
+                update(DetectionResult).where(DetectionResult.video_id == video_id).values(frame_path=None)
+            )
+            await session.commit()
+        await self._io(self._delete_archive, video_id)
+        logger.info(f"Evicted frames of video {video_id} ({reason})")
+        return freed or 0
+
+    async def _store_size(self) -> int:
+        """
+        Bytes used by the frame store: the archives, as recorded, plus the packs, indexes and
+        per-frame files of videos not compacted yet (those of evicted videos are gone).
+        """
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(func.sum(FrameArchive.bytes), func.sum(FrameArchive.frames)).where(FrameArchive.status == "compacted")
+            )
+            archived_bytes, archived_frames = result.one()
+            archived: Any = select(FrameArchive.video_id).where(FrameArchive.status != "compacting")
+            result = await session.execute(select(VideoRecord.video_id).where(VideoRecord.video_id.not_in(archived)))
+            keys: List[str] = list(result.scalars().all())
+            result = await session.execute(
+                select(VideoSegment.video_id, VideoSegment.segment_index).where(VideoSegment.video_id.not_in(archived))
+            )
+            keys += [f"{video_id}-s{i}" for video_id, i in result.all()]
+        index_bytes: int = (archived_frames or 0) * PackedFrameStorage.INDEX_RECORD.size
+        return (archived_bytes or 0) + index_bytes + await self._io(self._sources_size, keys)
+
+    def _sources_size(self, keys: List[str]) -> int:
+        total: int = 0
+        for key in keys:
+            for path in (self.packs.pack_path(key), self.packs.index_path(key)):
+                try:
+                    total += os.path.getsize(path)
+                except OSError:
+                    pass # Not a pack store, or deleted meanwhile
+            try:
+                with os.scandir(os.path.join(self.packs.frames_path, key)) as entries:
+                    for entry in entries:
+                        try:
+                            total += entry.stat().st_size
+                        except OSError:
+                            pass
+            except OSError:
+                pass # Not a per-frame file store
+        return total
+
+    async def enforce_quota(self) -> None:
+        used: int = await self._store_size()
+        if used <= self.quota_bytes:
+            return
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(FrameArchive.video_id)
+                .where(FrameArchive.status == "compacted")
+                .order_by(FrameArchive.accessed_at)
+            )
+            candidates: List[str] = list(result.scalars().all())
+
+        for video_id in candidates:
+            if used <= self.quota_bytes:
+                break
+            used -= await self.evict(video_id, "over quota")
+        if used > self.quota_bytes:
+            logger.warning(f"Frame store uses {used} bytes, over its {self.quota_bytes} byte quota, "
+                           "with no archive left to evict")
@@ -1,10 +1,58 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+
+# Scheduling class of an upload and of every task derived from it (see shared.mq.PRIORITIES)
+Priority = Literal["interactive", "normal", "bulk"]
+
+class SamplingOptions(BaseModel):
+    """Per-job frame sampling overrides; unset fields use the processing service's defaults."""
+    mode: Optional[Literal["grab", "seek", "adaptive"]] = None
+    sample_rate_sec: Optional[float] = Field(None, gt=0) # grab/seek: one frame every X seconds
+    min_interval_sec: Optional[float] = Field(None, gt=0) # adaptive: never sample more often than this
+    max_interval_sec: Optional[float] = Field(None, gt=0) # adaptive: always sample at least this often
+    scene_threshold: Optional[float] = Field(None, gt=0, le=1) # adaptive: mean pixel change that counts as a scene change
 
 class VideoTask(BaseModel):
     """Schema for video upload tasks."""
     video_id: str
     video_path: str
+    video_hash: Optional[str] = None # SHA256 computed while the upload was written
+    video_size: Optional[int] = None # Bytes written; lets the worker detect a truncated file
+    sampling: Optional[SamplingOptions] = None
+    trace_id: Optional[str] = None # Correlation ID of the upload, carried by all derived messages
+    uploaded_at: Optional[float] = None # Epoch seconds when the upload was stored, for end-to-end latency
+    priority: Priority = "normal"
+
+class SegmentTask(BaseModel):
+    """Schema for one time segment of a long video, extracted independently of the others."""
+    video_id: str
+    video_path: str
+    video_hash: str
+    segment_index: int
+    segment_count: int
+    start_frame: int
+    end_frame: Optional[int] = None # Exclusive; None runs to the end of the video
+    sampling: SamplingOptions # The parent job's effective settings, so every segment samples alike
+    trace_id: Optional[str] = None
+    uploaded_at: Optional[float] = None
+    priority: Priority = "normal"
+
+class VideoEvent(BaseModel):
+    """Schema for video lifecycle events (published once all frames of a video are extracted)."""
+    video_id: str
+    status: str # completed
+    frames: int # Frame tasks published
+    segments: int = 1
+
+class Letterbox(BaseModel):
+    """How a frame was resized and padded to the model input at extraction time."""
+    size: int # Model input side; the stored frame is size x size
+    scale: float # Original pixels -> stored pixels
+    pad_x: int # Padding left of the image, in stored pixels
+    pad_y: int # Padding above the image, in stored pixels
+    width: int # Original frame width
+    height: int # Original frame height
+    raw: bool = False # Stored as raw BGR uint8 pixels instead of JPEG
 
 class FrameTask(BaseModel):
     """Schema for individual frame extraction tasks."""
@@ -13,6 +61,12 @@ class FrameTask(BaseModel):
     frame_index: int
     frame_hash: str
     video_hash: str
+    hash_algorithm: str = "sha256" # Algorithm of frame_hash, see shared.storage.HASH_ALGORITHMS
+    letterbox: Optional[Letterbox] = None # Set when the frame was preprocessed for the model
+    segment_index: int = 0 # Segment of a split video; frames of one segment are published in order
+    trace_id: Optional[str] = None
+    uploaded_at: Optional[float] = None
+    priority: Priority = "normal"
 
 class DetectionSchema(BaseModel):
     """Schema for a single object detection result."""
@@ -23,6 +77,14 @@ class DetectionSchema(BaseModel):
     class Config:
         populate_by_name = True
 
+class FrameDetections(BaseModel):
+    """Detections for one frame, plus how they were obtained."""
+    detections: List[DetectionSchema] = []
+    phash: Optional[str] = None # 64-bit perceptual hash, hex
+    reused_from: Optional[str] = None # "<video_id>:<frame_index>" when copied from a near-duplicate frame
+    tracked_from: Optional[str] = None # "<video_id>:<frame_index>" of the detected frame the boxes were tracked from
+    error: Optional[str] = None # Set when the frame could not be read or failed verification; no result is stored
+
 class DetectionResultBatch(BaseModel):
     """Schema for a batch of detections for a specific frame."""
     video_id: str
@@ -0,0 +1,173 @@
+import os
+import json
+import struct
+import typing
+from typing import Any, Dict, Optional, Protocol, Tuple, Type, TypeVar
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError: # Only needed by services that speak the binary format
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Wire header: magic byte, schema version, codec id.
+# The magic byte can never start a JSON document, so headerless payloads are
+# recognised as the original JSON format and keep decoding during a rolling upgrade.
+WIRE_MAGIC: int = 0xFA
+SCHEMA_VERSION: int = 1
+HEADER: struct.Struct = struct.Struct("!BBB")
+
+CODEC_JSON: int = 1
+CODEC_MSGPACK: int = 2
+
+# Hex digest fields sent as raw bytes by the binary codec (half the size)
+DIGEST_FIELDS: Tuple[str, ...] = ("frame_hash", "video_hash")
+
+# Skip full Pydantic validation for messages from producers we control
+TRUSTED_PRODUCERS: bool = os.getenv("MQ_TRUSTED_PRODUCERS", "false").lower() in ("1", "true", "yes")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+class MessageSerializer(Protocol):
+    """
+    Encodes message dicts to bytes and back. Payloads exclude the wire header.
+    """
+    codec_id: int
+    framed: bool
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        ...
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        ...
+
+class JsonSerializer:
+    """
+    JSON codec. Uses orjson when it is installed.
+    With `framed=False` it produces the original headerless messages.
+    """
+    codec_id: int = CODEC_JSON
+
+    def __init__(self, framed: bool = True) -> None:
+        self.framed: bool = framed
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(data)
+        return json.dumps(data).encode('utf-8')
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload.decode('utf-8'))
+
+class MsgpackSerializer:
+    """
+    MessagePack codec with digests carried as raw bytes instead of hex strings.
+    """
+    codec_id: int = CODEC_MSGPACK
+    framed: bool = True
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise ImportError("msgpack is required for the msgpack wire format")
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        packed: Dict[str, Any] = dict(data)
+        for field in DIGEST_FIELDS:
+            value: Any = packed.get(field)
+            if isinstance(value, str) and value:
+                try:
+                    packed[field] = bytes.fromhex(value)
+                except ValueError:
+                    pass # Not hex, send as-is
+        return msgpack.packb(packed, use_bin_type=True)
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        data: Dict[str, Any] = msgpack.unpackb(payload, raw=False)
+        for field in DIGEST_FIELDS:
+            value: Any = data.get(field)
+            if isinstance(value, bytes):
+                data[field] = value.hex()
+        return data
+
+def get_serializer(name: Optional[str] = None) -> MessageSerializer:
+    """
+    Returns the serializer for a wire format name ("json", "json-framed" or "msgpack").
+    Defaults to the MQ_WIRE_FORMAT environment variable.
+    """
+    name = name or os.getenv("MQ_WIRE_FORMAT", "json")
+    if name == "json":
+        return JsonSerializer(framed=False)
+    if name == "json-framed":
+        return JsonSerializer()
+    if name == "msgpack":
+        return MsgpackSerializer()
+    raise ValueError(f"Unknown wire format: {name}")
+
+_decoders: Dict[int, MessageSerializer] = {}
+
+def _decoder(codec_id: int) -> MessageSerializer:
+    if codec_id not in _decoders:
+        if codec_id == CODEC_JSON:
+            _decoders[codec_id] = JsonSerializer()
+        elif codec_id == CODEC_MSGPACK:
+            _decoders[codec_id] = MsgpackSerializer()
+        else:
+            raise ValueError(f"Unknown message codec: {codec_id}")
+    return _decoders[codec_id]
+
+def encode_message(data: Dict[str, Any], serializer: MessageSerializer) -> bytes:
+    payload: bytes = serializer.encode(data)
+    if not serializer.framed:
+        return payload
+    return HEADER.pack(WIRE_MAGIC, SCHEMA_VERSION, serializer.codec_id) + payload
+
+def decode_message(raw: bytes) -> Dict[str, Any]:
+    """
+    Decodes a message in any supported format, including headerless JSON.
+    """
+    if not raw or raw[0] != WIRE_MAGIC:
+        return _decoder(CODEC_JSON).decode(raw)
+
+    _, version, codec_id = HEADER.unpack_from(raw)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Unsupported message schema version {version} (max {SCHEMA_VERSION})")
+    return _decoder(codec_id).decode(raw[HEADER.size:])
+
+def _nested_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    # Unwraps Optional[...] to find a nested model type, if any
+    candidates = typing.get_args(annotation) or (annotation,)
+    for candidate in candidates:
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+def construct_trusted(model: Type[ModelT], data: Dict[str, Any]) -> ModelT:
+    """
+    Builds a model without validation, only checking that required fields are present.
+    """
+    missing = [name for name, field in model.model_fields.items() if field.is_required() and name not in data]
+    if missing:
+        raise ValueError(f"{model.__name__} missing required fields: {missing}")
+
+    values: Dict[str, Any] = dict(data)
+    for name, field in model.model_fields.items():
+        nested: Optional[Type[BaseModel]] = _nested_model(field.annotation)
+        if nested is not None and isinstance(values.get(name), dict):
+            values[name] = construct_trusted(nested, values[name])
+    return model.model_construct(**values)
+
+def parse_message(model: Type[ModelT], data: Dict[str, Any], trusted: bool = TRUSTED_PRODUCERS) -> ModelT:
+    """
+    Turns a decoded message into its schema. Messages from trusted producers
+    skip full validation (see MQ_TRUSTED_PRODUCERS).
+    """
+    if trusted:
+        return construct_trusted(model, data)
+    return model(**data)
@@ -1,18 +1,58 @@
 import os
-import shutil
+import mmap
+import struct
+import asyncio
 import hashlib
-from typing import Protocol, Any, runtime_checkable
+import threading
+from collections import OrderedDict
+from typing import Protocol, Any, AsyncIterator, BinaryIO, Callable, Dict, NamedTuple, Optional, Set, Tuple, Union, runtime_checkable
+
+try:
+    import xxhash
+except ImportError: # Optional: only needed for the xxh3_128 frame digest
+    xxhash = None
+
+# Frame digest algorithms. sha256 resists tampering; the others only catch corruption, much faster.
+HASH_ALGORITHMS: Dict[str, Callable[[], Any]] = {
+    "sha256": hashlib.sha256,
+    "blake2b": lambda: hashlib.blake2b(digest_size=32),
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+
+def new_hasher(algorithm: str = "sha256") -> Any:
+    """Returns a hashlib-style hasher for the named algorithm."""
+    try:
+        return HASH_ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}") from None
+
+# Uploads are written to disk in blocks of this size, off the event loop
+UPLOAD_CHUNK_SIZE: int = 1024 * 1024
 
 @runtime_checkable
 class UploadFileProtocol(Protocol):
     file: Any
     filename: str
 
+    async def read(self, size: int = -1) -> bytes:
+        ...
+
+class SavedVideo(NamedTuple):
+    """A video written to storage, with the SHA256 and size computed while writing."""
+    path: str
+    sha256: str
+    size: int
+
+def _write_block(out: BinaryIO, hasher: Any, block: bytes) -> None:
+    out.write(block)
+    hasher.update(block)
+
 class VideoStorage(Protocol):
     """
     Abstract interface for video and frame storage.
     """
-    async def save_video(self, file: UploadFileProtocol, video_id: str) -> str:
+    async def save_video(self, file: UploadFileProtocol, video_id: str) -> SavedVideo:
         """Save an uploaded video file."""
         ...
 
@@ -28,6 +68,14 @@ class VideoStorage(Protocol):
         """Resolves the read path for a frame reference."""
         ...
 
+    def read_frame(self, frame_reference: str) -> Union[bytes, memoryview]:
+        """Returns the encoded bytes of a frame."""
+        ...
+
+    def finish_frames(self, video_id: str) -> None:
+        """Called once no more frames will be saved for a video."""
+        ...
+
 class FileSystemStorage:
     """
     Implementation of VideoStorage using a local filesystem.
@@ -41,19 +89,55 @@ class FileSystemStorage:
         os.makedirs(self.frames_path, exist_ok=True)
         os.makedirs(self.videos_path, exist_ok=True)
 
-    async def save_video(self, file: UploadFileProtocol, video_id: str) -> str:
-        file_path: str = os.path.join(self.videos_path, f"{video_id}.mp4")
-        
-        # Stream the file to disk
+        # Per-video frame directories already created, to avoid a makedirs per frame
+        self._frame_dirs: Set[str] = set()
+
+    def video_path(self, video_id: str) -> str:
+        return os.path.join(self.videos_path, f"{video_id}.mp4")
+
+    async def save_video(self, file: UploadFileProtocol, video_id: str) -> SavedVideo:
+        """
+        Streams the upload to disk without blocking the event loop, hashing it on the way.
+        """
+        file_path: str = self.video_path(video_id)
+        hasher = hashlib.sha256()
+
+        async def chunks() -> AsyncIterator[bytes]:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        return file_path
+            size: int = await self.write_chunks(buffer, chunks(), hasher)
+
+        return SavedVideo(file_path, hasher.hexdigest(), size)
+
+    @staticmethod
+    async def write_chunks(out: BinaryIO, chunks: AsyncIterator[bytes], hasher: Any) -> int:
+        """
+        Appends chunks to `out` and feeds them to `hasher`, in a worker thread.
+        Small chunks are coalesced into UPLOAD_CHUNK_SIZE blocks first.
+        Returns the number of bytes written; on error, everything written was also hashed.
+        """
+        written: int = 0
+        pending: bytearray = bytearray()
+        async for chunk in chunks:
+            pending += chunk
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                block: bytes = bytes(pending)
+                pending.clear()
+                await asyncio.to_thread(_write_block, out, hasher, block)
+                written += len(block)
+        if pending:
+            await asyncio.to_thread(_write_block, out, hasher, bytes(pending))
+            written += len(pending)
+        return written
 
     def save_frame(self, video_id: str, frame_id: int, frame_data: bytes) -> str:
         # Create directory for this video's frames if not exists
         video_frame_dir: str = os.path.join(self.frames_path, video_id)
-        os.makedirs(video_frame_dir, exist_ok=True)
+        if video_frame_dir not in self._frame_dirs:
+            os.makedirs(video_frame_dir, exist_ok=True)
+            self._frame_dirs.add(video_frame_dir)
         
         frame_path: str = os.path.join(video_frame_dir, f"{frame_id}.jpg")
         
@@ -70,16 +154,169 @@ class FileSystemStorage:
         # In FileSystemStorage, the reference IS the path
         return frame_reference
 
+    def read_frame(self, frame_reference: str) -> Union[bytes, memoryview]:
+        with open(self.get_frame_path(frame_reference), "rb") as f:
+            return f.read()
+
+    def finish_frames(self, video_id: str) -> None:
+        self._frame_dirs.discard(os.path.join(self.frames_path, video_id))
+
     @staticmethod
-    def compute_hash(data: bytes) -> str:
-        """Computes SHA256 hash of byte data."""
-        return hashlib.sha256(data).hexdigest()
+    def compute_hash(data: Union[bytes, memoryview], algorithm: str = "sha256") -> str:
+        """Computes the hex digest of byte data (SHA256 by default)."""
+        hasher = new_hasher(algorithm)
+        hasher.update(data)
+        return hasher.hexdigest()
 
     @staticmethod
-    def compute_file_hash(file_path: str) -> str:
-        """Computes SHA256 hash of a file in chunks."""
-        sha256_hash = hashlib.sha256()
+    def compute_file_hash(file_path: str, algorithm: str = "sha256") -> str:
+        """Computes the hex digest of a file in chunks (SHA256 by default)."""
+        hasher = new_hasher(algorithm)
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+            for byte_block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(byte_block)
+        return hasher.hexdigest()
+
+
+class PackedFrameStorage(FileSystemStorage):
+    """
+    VideoStorage that appends all frames of a video to a single segment file,
+    `<frames>/<video_id>.pack`, instead of writing one file per frame.
+
+    Each frame gets a fixed-size record (frame_id, offset, length) in
+    `<video_id>.idx`, and its reference encodes the same location
+    (`pack:<video_id>:<frame_id>:<offset>:<length>`), so readers can slice the
+    frame out of a memory-mapped pack without consulting the index.
+    Plain file paths are still accepted as references, so frames written
+    before switching to packs stay readable.
+    """
+    PREFIX: str = "pack:"
+    INDEX_RECORD: struct.Struct = struct.Struct("<QQI") # frame_id, offset, length
+    MAX_OPEN_MAPS: int = 64
+    MAX_CACHED_INDEXES: int = 64
+
+    def __init__(self, base_path: str = "/data") -> None:
+        super().__init__(base_path)
+        self._writers: Dict[str, Tuple[BinaryIO, BinaryIO]] = {}
+        # Both caches are keyed by path and remember which file (device, inode) they were read
+        # from, so a pack deleted by retention, or replaced, is never served from a stale map
+        self._maps: "OrderedDict[str, Tuple[Tuple[int, int], mmap.mmap]]" = OrderedDict()
+        self._indexes: "OrderedDict[str, Tuple[Tuple[int, int, int], Dict[int, Tuple[int, int]]]]" = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def pack_path(self, video_id: str) -> str:
+        return os.path.join(self.frames_path, f"{video_id}.pack")
+
+    def index_path(self, video_id: str) -> str:
+        return os.path.join(self.frames_path, f"{video_id}.idx")
+
+    @classmethod
+    def make_reference(cls, video_id: str, frame_id: int, offset: int, length: int) -> str:
+        return f"{cls.PREFIX}{video_id}:{frame_id}:{offset}:{length}"
+
+    @classmethod
+    def parse_reference(cls, frame_reference: str) -> Optional[Tuple[str, int, int, int]]:
+        """Returns (video_id, frame_id, offset, length) for pack references, None for file paths."""
+        if not frame_reference.startswith(cls.PREFIX):
+            return None
+        video_id, frame_id, offset, length = frame_reference[len(cls.PREFIX):].rsplit(":", 3)
+        return video_id, int(frame_id), int(offset), int(length)
+
+    def save_frame(self, video_id: str, frame_id: int, frame_data: bytes) -> str:
+        writers = self._writers.get(video_id)
+        if writers is None:
+            writers = (open(self.pack_path(video_id), "ab"), open(self.index_path(video_id), "ab"))
+            self._writers[video_id] = writers
+        pack, index = writers
+
+        offset: int = pack.tell()
+        pack.write(frame_data)
+        # Frames must be visible to readers as soon as their task is published
+        pack.flush()
+        index.write(self.INDEX_RECORD.pack(frame_id, offset, len(frame_data)))
+        index.flush()
+
+        return self.make_reference(video_id, frame_id, offset, len(frame_data))
+
+    def finish_frames(self, video_id: str) -> None:
+        writers = self._writers.pop(video_id, None)
+        if writers is not None:
+            for f in writers:
+                f.close()
+
+    def read_frame(self, frame_reference: str) -> Union[bytes, memoryview]:
+        """
+        Returns a zero-copy view into the memory-mapped pack for pack references.
+        """
+        location = self.parse_reference(frame_reference)
+        if location is None:
+            return super().read_frame(frame_reference)
+
+        video_id, _, offset, length = location
+        view: memoryview = memoryview(self._map(video_id, offset + length))
+        return view[offset:offset + length]
+
+    def _map(self, video_id: str, min_size: int) -> mmap.mmap:
+        path: str = self.pack_path(video_id)
+        with self._lock:
+            try:
+                stat: os.stat_result = os.stat(path)
+            except FileNotFoundError:
+                self._maps.pop(path, None)
+                raise
+            identity: Tuple[int, int] = (stat.st_dev, stat.st_ino)
+            cached = self._maps.get(path)
+            # The pack may have been replaced, or have grown, since it was mapped
+            if cached is None or cached[0] != identity or len(cached[1]) < min_size:
+                with open(path, "rb") as f:
+                    opened: os.stat_result = os.fstat(f.fileno())
+                    identity = (opened.st_dev, opened.st_ino)
+                    mapped: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(mapped) < min_size:
+                    raise ValueError(f"Frame lies beyond the end of pack {path}")
+                cached = self._maps[path] = (identity, mapped)
+            self._maps.move_to_end(path)
+            # Evicted maps are closed by GC once no frame views still reference them
+            while len(self._maps) > self.MAX_OPEN_MAPS:
+                self._maps.popitem(last=False)
+            return cached[1]
+
+    def lookup(self, video_id: str, frame_id: int) -> Optional[str]:
+        """
+        Finds the reference of a frame by its index using the pack's offset index.
+        """
+        path: str = self.index_path(video_id)
+        with self._lock:
+            try:
+                stat: os.stat_result = os.stat(path)
+            except OSError:
+                self._indexes.pop(path, None)
+                return None
+            # An index only grows while its pack is written, so its size tells whether it changed
+            version: Tuple[int, int, int] = (stat.st_dev, stat.st_ino, stat.st_size)
+            cached = self._indexes.get(path)
+            if cached is None or cached[0] != version:
+                with open(path, "rb") as f:
+                    data: bytes = f.read()
+                # Ignore a partially written trailing record
+                data = data[:len(data) - len(data) % self.INDEX_RECORD.size]
+                entries: Dict[int, Tuple[int, int]] = {
+                    fid: (offset, length) for fid, offset, length in self.INDEX_RECORD.iter_unpack(data)
+                }
+                cached = self._indexes[path] = (version, entries)
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.MAX_CACHED_INDEXES:
+                self._indexes.popitem(last=False)
+
+        entry = cached[1].get(frame_id)
+        if entry is None:
+            return None
+        return self.make_reference(video_id, frame_id, *entry)
+
+def create_storage(base_path: str = "/data") -> FileSystemStorage:
+    """
+    Returns the storage backend selected by FRAME_STORE ("files" or "packed").
+    """
+    if os.getenv("FRAME_STORE", "files") == "packed":
+        return PackedFrameStorage(base_path)
+    return FileSystemStorage(base_path)
@@ -0,0 +1,21 @@
+import os
+import tempfile
+from typing import Iterator
+
+import pytest
+
+# The registry and retention modules bind their engine at import time; tests run them on SQLite
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db")
+
+@pytest.fixture(scope="session")
+def video(tmp_path_factory: pytest.TempPathFactory) -> str:
+    """Path of a short synthetic video (see media.py)."""
+    from media import write_video
+    return write_video(str(tmp_path_factory.mktemp("video") / "scenes.avi"))
+
+@pytest.fixture
+def database() -> Iterator[None]:
+    """Empty tables for each test that uses the database."""
+    from dbutil import reset_database, run
+    run(reset_database())
+    yield
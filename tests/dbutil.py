@@ -0,0 +1,25 @@
+import asyncio
+from typing import Any, Awaitable, TypeVar
+
+from shared.database import AsyncSessionLocal, Base, engine, init_db
+
+T = TypeVar("T")
+
+def run(coro: Awaitable[T]) -> T:
+    """Runs a coroutine that uses the database on a fresh event loop."""
+    async def with_engine() -> T:
+        try:
+            return await coro
+        finally:
+            await engine.dispose() # Connections belong to this test's event loop
+    return asyncio.run(with_engine())
+
+async def reset_database() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+
+async def add_rows(*rows: Any) -> None:
+    async with AsyncSessionLocal() as session:
+        session.add_all(rows)
+        await session.commit()
@@ -0,0 +1,17 @@
+import cv2
+import numpy as np
+
+# Synthetic test video: two static scenes, dark then bright, with a thin line moving down every frame
+FPS: int = 10
+FRAMES: int = 100
+CUT: int = 50 # First frame of the second scene
+WIDTH, HEIGHT = 64, 48
+
+def write_video(path: str) -> str:
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (WIDTH, HEIGHT))
+    for i in range(FRAMES):
+        frame = np.full((HEIGHT, WIDTH, 3), 50 if i < CUT else 200, dtype=np.uint8)
+        frame[i % HEIGHT, :] = 255
+        out.write(frame)
+    out.release()
+    return path
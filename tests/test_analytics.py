@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import pytest
+
+from dbutil import add_rows, run
+from shared.analytics import bucket_start, class_counts, find_objects, object_rows, record_detections, rollup_rows
+from shared.database import AsyncSessionLocal
+from shared.models import DetectionResult
+
+T0 = datetime(2026, 1, 1, 12, 0, 30, tzinfo=timezone.utc)
+
+def result_row(video_id: str, frame_index: int, *detections: Dict[str, Any]) -> Dict[str, Any]:
+    return {"video_id": video_id, "frame_index": frame_index, "detections": list(detections)}
+
+def car(conf: float) -> Dict[str, Any]:
+    return {"class": "car", "conf": conf, "bbox": [1, 2, 3, 4]}
+
+def test_bucket_start() -> None:
+    assert bucket_start(T0, 60) == datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+    assert bucket_start(T0, 3600) == datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+def test_object_rows_flatten_detections() -> None:
+    rows = [result_row("v", 0, car(0.5), {"class": "person", "conf": 0.9}), result_row("v", 1)]
+    objects = object_rows(rows, [10, 11], T0)
+    assert [(o["detection_id"], o["class_name"], o["x1"]) for o in objects] == [(10, "car", 1), (10, "person", None)]
+    assert all(o["timestamp"] == T0 for o in objects)
+
+def test_rollup_counts_frames_per_detection_row() -> None:
+    rows = [result_row("v", 0, car(0.5), car(0.7)), result_row("v", 1, car(0.9)), result_row("a", 0, car(0.1))]
+    rollups = rollup_rows(object_rows(rows, [1, 2, 3], T0), bucket_sec=60)
+    assert [(r["video_id"], r["objects"], r["frames"]) for r in rollups] == [("a", 1, 1), ("v", 3, 2)] # Sorted by key
+    assert rollups[1]["confidence_sum"] == pytest.approx(2.1)
+    assert rollups[1]["max_confidence"] == 0.9
+
+@pytest.mark.usefixtures("database")
+def test_rollups_accumulate_across_writes() -> None:
+    async def scenario() -> List[Dict[str, Any]]:
+        for frame_index, conf in ((0, 0.4), (1, 0.8)):
+            row = result_row("v", frame_index, car(conf))
+            result = DetectionResult(frame_path=f"/frames/{frame_index}.jpg", **row)
+            await add_rows(result)
+            async with AsyncSessionLocal() as session:
+                await record_detections(session, [row], [result.id])
+                await session.commit()
+
+        found = await find_objects("car", min_confidence=0.5)
+        assert [(obj.frame_index, frame_path) for obj, frame_path, _ in found] == [(1, "/frames/1.jpg")]
+        return await class_counts("v")
+
+    counts = run(scenario())
+    assert counts == [{"class": "car", "objects": 2, "frames": 2, "avg_confidence": pytest.approx(0.6), "max_confidence": 0.8}]
@@ -0,0 +1,106 @@
+import os
+import sys
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+from backends import ExportedYoloBackend, _names_from_yaml, create_backend, parse_names
+
+def yolo_output(*boxes: List[float], classes: int = 2) -> Any:
+    """Raw YOLOv8 output for one image, (4 + classes, anchors): one anchor per [cx, cy, w, h, *scores]."""
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4 + classes).T
+
+class FixedOutputBackend(ExportedYoloBackend):
+    """Exported model stand-in: returns the same raw output for every image, one image per call."""
+    def __init__(self, output: Any, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.output: Any = output
+        self.calls: List[Any] = []
+
+    def _run(self, batch: Any) -> Any:
+        self.calls.append(batch.shape)
+        return np.stack([self.output] * len(batch))
+
+def test_class_names_from_export_metadata(tmp_path: Path) -> None:
+    assert parse_names("{0: 'person', 1: 'car'}") == {0: "person", 1: "car"}
+    assert parse_names("not a dict") == {} and parse_names(None) == {}
+
+    metadata = tmp_path / "metadata.yaml"
+    metadata.write_text("stride: 32\nnames:\n  0: person\n  1: 'traffic light'\nimgsz:\n- 640\n")
+    assert _names_from_yaml(str(metadata)) == {0: "person", 1: "traffic light"}
+
+def test_preprocess_letterboxes_to_rgb_nchw() -> None:
+    backend = FixedOutputBackend(None, input_size=32)
+    img = np.zeros((48, 64, 3), dtype=np.uint8)
+    img[..., 0] = 255 # Blue in BGR
+    batch, transforms = backend.preprocess([img])
+    assert batch.shape == (1, 3, 32, 32) and batch.dtype == np.float32
+    assert transforms == [(0.5, 0, 4)]
+    assert batch[0, 2, 16, 16] == 1.0 and batch[0, 0, 16, 16] == 0.0 # Blue is the last RGB channel
+
+def test_postprocess_filters_suppresses_and_maps_back() -> None:
+    backend = FixedOutputBackend(None, input_size=32, conf_threshold=0.5, iou_threshold=0.5)
+    output = yolo_output(
+        [16, 16, 8, 8, 0.9, 0.1],
+        [16, 16, 8, 8.5, 0.8, 0.0], # Overlaps the first, same class: suppressed
+        [16, 16, 8, 8, 0.0, 0.7], # Same place, other class: kept
+        [4, 4, 4, 4, 0.3, 0.2], # Below the threshold
+    )
+    result = backend.postprocess(output, (48, 64, 3), (0.5, 0, 4))
+    assert result.classes.tolist() == [0, 1]
+    assert result.scores.tolist() == pytest.approx([0.9, 0.7])
+    # [12, 12, 20, 20] in the 32x32 input is [24, 16, 40, 32] in the 64x48 image
+    assert result.boxes[0].tolist() == [24, 16, 40, 32]
+
+def test_fixed_batch_exports_run_one_image_at_a_time() -> None:
+    backend = FixedOutputBackend(yolo_output([16, 16, 8, 8, 0.9, 0.1]), input_size=32)
+    images = [np.zeros((32, 32, 3), dtype=np.uint8)] * 3
+    assert [len(r.boxes) for r in backend.predict(images)] == [1, 1, 1]
+    assert backend.calls == [(1, 3, 32, 32)] * 3
+    backend.dynamic_batch = True
+    backend.predict(images)
+    assert backend.calls[-1] == (3, 3, 32, 32)
+
+def test_unknown_backend_is_rejected() -> None:
+    with pytest.raises(ValueError, match="Unknown detection backend"):
+        create_backend("tensorrt", "model.engine")
+
+def test_onnx_export_runs_with_dynamic_batch(tmp_path: Path) -> None:
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper
+
+    # Ignores its input and always "detects" one class 1 box at the centre
+    anchors = yolo_output([16, 16, 8, 8, 0.1, 0.9])[np.newaxis]
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceSum", ["images", "axes"], ["total"], keepdims=1),
+            helper.make_node("Reshape", ["total", "shape"], ["flat"]),
+            helper.make_node("Mul", ["flat", "zero"], ["nothing"]),
+            helper.make_node("Add", ["nothing", "anchors"], ["output0"]),
+        ],
+        "fixed",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, 32, 32])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", 6, 1])],
+        [
+            helper.make_tensor("axes", TensorProto.INT64, [3], [1, 2, 3]),
+            helper.make_tensor("shape", TensorProto.INT64, [3], [-1, 1, 1]),
+            helper.make_tensor("zero", TensorProto.FLOAT, [], [0.0]),
+            helper.make_tensor("anchors", TensorProto.FLOAT, anchors.shape, anchors.ravel().tolist()),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+    helper.set_model_props(model, {"names": "{0: 'person', 1: 'car'}"})
+    path = tmp_path / "model.onnx"
+    onnx.save(model, str(path))
+
+    backend = create_backend("onnx", str(path), input_size=640)
+    assert backend.dynamic_batch and backend.input_size == 32 # Taken from the export
+    assert backend.names == {0: "person", 1: "car"}
+    results = backend.predict([np.zeros((64, 64, 3), dtype=np.uint8)] * 2)
+    assert [r.classes.tolist() for r in results] == [[1], [1]]
+    assert results[0].boxes[0].tolist() == [24, 24, 40, 40]
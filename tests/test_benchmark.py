@@ -0,0 +1,31 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "scripts", "benchmark.py")
+
+def load_benchmark():
+    spec = importlib.util.spec_from_file_location("benchmark", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_regressions_beyond_the_tolerance_are_reported(tmp_path: Path) -> None:
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": [{"name": "a", "fps": 100.0}, {"name": "b", "fps": 100.0}]}))
+    results = [{"name": "a", "fps": 85.0}, {"name": "b", "fps": 75.0}, {"name": "new", "fps": 1.0}]
+    assert load_benchmark().compare(results, str(baseline), 0.2) == ["b: 75.0 fps, baseline 100.0 fps"]
+
+def test_benchmark_runs_offline(tmp_path: Path) -> None:
+    output = tmp_path / "benchmark.json"
+    subprocess.run(
+        [sys.executable, SCRIPT, "--video", str(tmp_path / "none.mp4"), "--synthetic-seconds", "1",
+         "--synthetic-size", "64x48", "--modes", "grab", "seek", "--output", str(output), "--timeout", "60"],
+        check=True, capture_output=True, timeout=120, cwd=tmp_path,
+    )
+    results = {r["name"]: r for r in json.loads(output.read_text())["results"]}
+    assert set(results) == {"extract/synthetic-64x48/grab", "extract/synthetic-64x48/seek", "pipeline/synthetic-64x48/grab"}
+    assert results["extract/synthetic-64x48/grab"]["frames"] == results["pipeline/synthetic-64x48/grab"]["frames"] > 0
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+import cache
+from cache import DetectionCache, perceptual_hash
+from shared.schemas import DetectionSchema
+
+PERSON = [DetectionSchema(class_name="person", confidence=0.9, bbox=[0.1, 0.1, 0.5, 0.9])]
+
+def gradient(noise_seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(noise_seed)
+    row = np.linspace(0, 255, 90).astype(np.int16)
+    img = np.repeat(np.repeat(row[None, :, None], 80, axis=0), 3, axis=2) + rng.integers(-2, 3, (80, 90, 3))
+    return img.clip(0, 255).astype(np.uint8)
+
+def test_near_identical_frames_hash_alike() -> None:
+    a, b = perceptual_hash(gradient(0)), perceptual_hash(gradient(1))
+    assert (a ^ b).bit_count() <= 3
+    flipped = perceptual_hash(gradient(0)[:, ::-1].copy())
+    assert (a ^ flipped).bit_count() > 32
+
+def test_lookup_returns_the_closest_entry_within_distance() -> None:
+    detections = DetectionCache(max_distance=2)
+    detections.store(0b0000, PERSON, "v:0")
+    detections.store(0b0111, [], "v:1")
+    assert detections.lookup(0b0001).source == "v:0"
+    assert detections.lookup(0b0110).source == "v:1"
+    assert detections.lookup(0b1111_0000) is None
+    assert (detections.hits, detections.misses) == (2, 1)
+
+def test_entries_expire(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: clock[0])
+    detections = DetectionCache(ttl_sec=10)
+    detections.store(1, PERSON, "v:0")
+    clock[0] += 9
+    assert detections.lookup(1) is not None
+    clock[0] += 2
+    assert detections.lookup(1) is None
+    assert not detections._entries
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    detections = DetectionCache(max_entries=2, max_distance=0)
+    detections.store(1, PERSON, "v:1")
+    detections.store(2, PERSON, "v:2")
+    detections.lookup(1) # Now more recent than 2
+    detections.store(3, PERSON, "v:3")
+    assert detections.lookup(2) is None
+    assert detections.lookup(1) is not None and detections.lookup(3) is not None
+
+def test_zero_entries_disables_the_cache() -> None:
+    assert not DetectionCache(max_entries=0).enabled
@@ -0,0 +1,164 @@
+import errno
+import os
+import sys
+from typing import Any, Dict, List, Tuple, Union
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+import detector
+from backends import BackendResult, InferenceBackend
+from detector import ObjectDetector, from_pixels, to_pixels
+from shared.schemas import FrameTask, Letterbox
+from shared.storage import FileSystemStorage
+
+class FlakyStorage:
+    """Serves one frame, failing the first reads with the given errors."""
+    def __init__(self, data: bytes, *errors: BaseException) -> None:
+        self.data: bytes = data
+        self.errors: List[BaseException] = list(errors)
+        self.reads: int = 0
+
+    def read_frame(self, frame_reference: str) -> Union[bytes, memoryview]:
+        self.reads += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.data
+
+class MemoryStorage:
+    def __init__(self, frames: Dict[str, bytes]) -> None:
+        self.frames: Dict[str, bytes] = frames
+
+    def read_frame(self, frame_reference: str) -> Union[bytes, memoryview]:
+        return self.frames[frame_reference]
+
+class FakeBackend(InferenceBackend):
+    """Finds one "object" covering the left half of each image; records the batches it ran."""
+    def __init__(self) -> None:
+        super().__init__()
+        self.names = {0: "person"}
+        self.batches: List[int] = []
+
+    def predict(self, images: List[Any]) -> List[BackendResult]:
+        self.batches.append(len(images))
+        results: List[BackendResult] = []
+        for img in images:
+            height, width = img.shape[:2]
+            box = np.array([[0, 0, width / 2, height]], dtype=np.float32)
+            results.append(BackendResult(box, np.array([img[0, 0, 0] / 255], dtype=np.float32), np.array([0])))
+        return results
+
+def image_bytes(value: int = 200, size: Tuple[int, int] = (8, 8)) -> bytes:
+    ok, encoded = cv2.imencode(".png", np.full((*size, 3), value, dtype=np.uint8)) # Lossless: pixel values survive
+    assert ok
+    return encoded.tobytes()
+
+def frame_task(data: bytes, frame_hash: str = "") -> FrameTask:
+    return FrameTask(video_id="v", frame_path="pack:v:0:0:1", frame_index=0,
+                     frame_hash=frame_hash or FileSystemStorage.compute_hash(data), video_hash="h")
+
+def make_detector(storage: Any) -> ObjectDetector:
+    return ObjectDetector(storage=storage, backend=object())
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(detector, "READ_RETRY_SEC", 0.0)
+
+def test_frame_is_read_verified_and_decoded() -> None:
+    data = image_bytes()
+    img, error = make_detector(FlakyStorage(data)).load_frame(frame_task(data))
+    assert error is None and img.shape == (8, 8, 3)
+
+def test_missing_frame_is_skipped_without_retrying() -> None:
+    data = image_bytes()
+    storage = FlakyStorage(data, FileNotFoundError(errno.ENOENT, "gone"))
+    assert make_detector(storage).load_frame(frame_task(data)) == (None, "missing")
+    assert storage.reads == 1
+
+def test_transient_read_error_is_retried() -> None:
+    data = image_bytes()
+    storage = FlakyStorage(data, OSError(errno.EIO, "I/O error"), TimeoutError(errno.ETIMEDOUT, "timed out"))
+    img, error = make_detector(storage).load_frame(frame_task(data))
+    assert error is None and img is not None
+    assert storage.reads == 3
+
+def test_persistent_read_error_is_raised_not_skipped() -> None:
+    data = image_bytes()
+    storage = FlakyStorage(data, *(OSError(errno.EIO, "I/O error") for _ in range(detector.READ_ATTEMPTS)))
+    with pytest.raises(OSError):
+        make_detector(storage).load_frame(frame_task(data))
+
+def test_corrupt_and_truncated_frames_are_skipped() -> None:
+    data = image_bytes()
+    assert make_detector(FlakyStorage(data)).load_frame(frame_task(data, frame_hash="0" * 64)) == (None, "corrupt")
+    storage = FlakyStorage(data, ValueError("Frame lies beyond the end of pack"))
+    assert make_detector(storage).load_frame(frame_task(data)) == (None, "unreadable")
+
+def test_batch_runs_one_forward_pass_in_frame_order() -> None:
+    frames = {f"f{i}": image_bytes(value, (8, 16)) for i, value in enumerate((50, 100, 150))}
+    backend = FakeBackend()
+    object_detector = ObjectDetector(storage=MemoryStorage(frames), backend=backend)
+    tasks = [FrameTask(video_id="v", frame_path=path, frame_index=i, frame_hash=FileSystemStorage.compute_hash(data),
+                       video_hash="h") for i, (path, data) in enumerate(frames.items())]
+    tasks.insert(1, tasks[1].model_copy(update={"frame_hash": "0" * 64})) # Corrupt: no slot in the batch
+
+    results = object_detector.process_batch(tasks)
+    assert backend.batches == [3]
+    assert results[1].error == "corrupt" and results[1].detections == []
+    scored = [r for r in results if r.error is None]
+    assert [round(r.detections[0].confidence, 2) for r in scored] == [0.2, 0.39, 0.59]
+    assert scored[0].detections[0].bbox == [0.0, 0.0, 0.5, 1.0] # Normalized to the frame
+
+def test_batch_records_per_frame_stage_timings() -> None:
+    frames = {f"f{i}": image_bytes(100 + i) for i in range(3)}
+    object_detector = ObjectDetector(storage=MemoryStorage(frames), backend=FakeBackend())
+    tasks = [FrameTask(video_id="v", frame_path=path, frame_index=i, frame_hash=FileSystemStorage.compute_hash(data),
+                       video_hash="h") for i, (path, data) in enumerate(frames.items())]
+    object_detector.process_batch(tasks)
+    assert {stage: len(values) for stage, values in object_detector.timings.items()} == \
+        {"read": 3, "verify": 3, "decode": 3, "inference": 1}
+    object_detector.process_batch(tasks[:1])
+    assert len(object_detector.timings["read"]) == 1 # Only the last batch
+
+def test_near_duplicate_frames_reuse_detections() -> None:
+    from cache import DetectionCache
+    frames = {"a": image_bytes(100), "b": image_bytes(100), "c": image_bytes(100)}
+    backend = FakeBackend()
+    object_detector = ObjectDetector(storage=MemoryStorage(frames), backend=backend, cache=DetectionCache())
+    tasks = [FrameTask(video_id="v", frame_path=path, frame_index=i, frame_hash=FileSystemStorage.compute_hash(data),
+                       video_hash="h") for i, (path, data) in enumerate(frames.items())]
+
+    first = object_detector.process_batch(tasks[:2])
+    assert backend.batches == [1] # The second frame waits on the first's detections
+    assert first[1].reused_from == "v:0" and first[1].detections == first[0].detections
+    later = object_detector.process_batch(tasks[2:])
+    assert backend.batches == [1] and later[0].reused_from == "v:0" # Served from the cache
+
+# A 64x48 frame letterboxed to 32x32: scaled by half, 4 rows of padding above and below
+LETTERBOX = Letterbox(size=32, scale=0.5, pad_x=0, pad_y=4, width=64, height=48)
+
+@pytest.mark.parametrize("letterbox, shape", [(None, (48, 64, 3)), (LETTERBOX, (32, 32, 3))])
+def test_pixel_mapping_round_trips(letterbox: Any, shape: Tuple[int, ...]) -> None:
+    bbox = [0.25, 0.5, 0.75, 1.0]
+    pixels = to_pixels(bbox, shape, letterbox)
+    assert pixels == ([8.0, 16.0, 24.0, 28.0] if letterbox else [16.0, 24.0, 48.0, 48.0])
+    assert from_pixels(pixels, shape, letterbox) == pytest.approx(bbox)
+
+def test_boxes_on_the_padding_are_clamped_to_the_frame() -> None:
+    assert from_pixels([0, 0, 32, 32], (32, 32, 3), LETTERBOX) == [0.0, 0.0, 1.0, 1.0]
+
+def test_raw_letterboxed_frame_is_detected_without_decoding() -> None:
+    data = np.full((32, 32, 3), 100, dtype=np.uint8).tobytes()
+    task = FrameTask(video_id="v", frame_path="f", frame_index=0, frame_hash=FileSystemStorage.compute_hash(data),
+                     video_hash="h", letterbox=LETTERBOX.model_copy(update={"raw": True}))
+    [result] = ObjectDetector(storage=MemoryStorage({"f": data}), backend=FakeBackend()).process_batch([task])
+    # The left half of the model input, mapped back to the original frame
+    assert result.error is None and result.detections[0].bbox == [0.0, 0.0, 0.5, 1.0]
+
+def test_raw_frame_of_the_wrong_size_is_undecodable() -> None:
+    data = bytes(10)
+    task = frame_task(data).model_copy(update={"letterbox": LETTERBOX.model_copy(update={"raw": True})})
+    assert make_detector(FlakyStorage(data)).load_frame(task) == (None, "undecodable")
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+import engine
+from engine import InferenceEngine, InferenceError
+from shared.schemas import FrameTask
+
+class RecordingDetector:
+    """Stands in for a worker process's ObjectDetector: labels each frame with the thread that ran it."""
+    def __init__(self) -> None:
+        self.timings: Dict[str, List[float]] = {"inference": [0.01]}
+
+    def process_batch(self, frames: List[FrameTask]) -> List[Tuple[str, int, str]]:
+        if any(f.video_id == "broken" for f in frames):
+            raise RuntimeError("worker died")
+        return [(f.video_id, f.frame_index, threading.current_thread().name) for f in frames]
+
+@pytest.fixture
+def pool(monkeypatch: pytest.MonkeyPatch) -> InferenceEngine:
+    monkeypatch.setattr(engine, "_detector", RecordingDetector())
+    inference = InferenceEngine("model.pt", workers=3)
+    inference.shutdown() # Never started; threads stand in for the worker processes
+    inference.workers = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"worker-{i}") for i in range(3)]
+    return inference
+
+def frame(video_id: str, frame_index: int) -> FrameTask:
+    return FrameTask(video_id=video_id, frame_path="f", frame_index=frame_index, frame_hash="", video_hash="h")
+
+def test_results_come_back_in_input_order(pool: InferenceEngine) -> None:
+    frames = [frame(video, i) for i in range(4) for video in ("a", "b", "c", "d")]
+    results = asyncio.run(pool.process_batch(frames))
+    assert [(video, index) for video, index, _ in results] == [(f.video_id, f.frame_index) for f in frames]
+    pool.shutdown()
+
+def test_frames_of_a_video_stay_on_one_worker(pool: InferenceEngine) -> None:
+    frames = [frame(video, i) for i in range(3) for video in ("a", "b", "c", "d", "e")]
+    results = asyncio.run(pool.process_batch(frames)) + asyncio.run(pool.process_batch(frames))
+    workers: Dict[str, set] = {}
+    for video, _, thread in results:
+        workers.setdefault(video, set()).add(thread.rsplit("_", 1)[0])
+    assert all(len(threads) == 1 for threads in workers.values())
+    assert pool._worker_for("a") == zlib.crc32(b"a") % 3 # Stable across restarts, unlike hash()
+    pool.shutdown()
+
+def test_worker_failure_fails_the_batch(pool: InferenceEngine) -> None:
+    with pytest.raises(InferenceError, match="batch of 2 frames"):
+        asyncio.run(pool.process_batch([frame("a", 0), frame("broken", 0)]))
+    pool.shutdown()
@@ -0,0 +1,69 @@
+import asyncio
+import contextlib
+import os
+import sys
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "processing"))
+
+from media import FPS, FRAMES
+from processing import iter_frames, plan_segments, stream_frames
+from shared.storage import FileSystemStorage
+
+class CountingStorage(FileSystemStorage):
+    def __init__(self, base_path: str) -> None:
+        super().__init__(base_path)
+        self.saved: int = 0
+
+    def save_frame(self, video_id: str, frame_id: int, frame_data: bytes) -> str:
+        self.saved += 1
+        return super().save_frame(video_id, frame_id, frame_data)
+
+async def collect(video: str, storage: FileSystemStorage, **kwargs: Any) -> List[Tuple[int, str, str, Any]]:
+    return [item async for item in stream_frames(video, "v", storage, **kwargs)]
+
+def test_streamed_frames_match_extraction(video: str, tmp_path: Path) -> None:
+    expected = list(iter_frames(video, "v", FileSystemStorage(str(tmp_path / "a")), sample_rate_sec=0.5))
+    storage = FileSystemStorage(str(tmp_path / "b"))
+    streamed = asyncio.run(collect(video, storage, queue_size=2, sample_rate_sec=0.5))
+
+    assert [(i, h) for i, _, h, _ in streamed] == [(i, h) for i, _, h, _ in expected]
+    assert [i for i, *_ in streamed] == list(range(0, FRAMES, 5))
+    for _, path, _, _ in streamed:
+        assert os.path.exists(path) # Saved before it is yielded
+
+def test_closing_the_stream_stops_extraction(video: str, tmp_path: Path) -> None:
+    storage = CountingStorage(str(tmp_path))
+
+    async def first_frames() -> None:
+        async with contextlib.aclosing(stream_frames(video, "v", storage, queue_size=2, sample_rate_sec=0.1)) as frames:
+            async for index, *_ in frames:
+                if index == 2:
+                    break
+
+    asyncio.run(first_frames())
+    # Extraction ran at most a full queue (plus the frame being handed over) ahead of the consumer
+    assert storage.saved <= 3 + 2 + 1 < FRAMES
+
+def test_extraction_errors_reach_the_consumer(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="Could not open video"):
+        asyncio.run(collect(str(tmp_path / "missing.mp4"), FileSystemStorage(str(tmp_path))))
+
+def test_segments_are_aligned_and_the_last_is_open_ended() -> None:
+    assert plan_segments(100, 10, 3.3, align=5) == [(0, 35), (35, 70), (70, None)]
+    assert plan_segments(100, 10, 0.1, align=5) == [(s, s + 5) for s in range(0, 95, 5)] + [(95, None)] # At least one alignment step
+    assert plan_segments(0, 10, 60, align=5) == [(0, None)]
+
+@pytest.mark.parametrize("mode", ["grab", "seek"])
+def test_segments_extract_the_frames_of_the_whole_video(video: str, tmp_path: Path, mode: str) -> None:
+    storage = FileSystemStorage(str(tmp_path))
+    whole = [(i, h) for i, _, h, _ in iter_frames(video, "v", storage, sample_rate_sec=0.7, mode=mode)]
+    parts = [
+        (i, h)
+        for start, end in plan_segments(FRAMES, FPS, 3, align=7)
+        for i, _, h, _ in iter_frames(video, "v", storage, sample_rate_sec=0.7, mode=mode, start_frame=start, end_frame=end)
+    ]
+    assert parts == whole
@@ -0,0 +1,64 @@
+import os
+import sys
+from typing import Any, Dict, List
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+
+from dbutil import add_rows, run
+from feed import ResultFeed
+from shared.database import MAX_NOTIFY_PAYLOAD, format_id_ranges, parse_id_ranges
+from shared.models import DetectionResult
+
+def serialize(d: DetectionResult) -> Dict[str, Any]:
+    return {"id": d.id, "frame_index": d.frame_index}
+
+def test_id_ranges_round_trip() -> None:
+    assert format_id_ranges([7, 3, 4, 5, 9, 10]) == "3-5,7,9-10"
+    assert parse_id_ranges("3-5,7,9-10") == [(3, 5), (7, 7), (9, 10)]
+    assert parse_id_ranges("") == []
+    # Too many ranges for a NOTIFY payload: listeners catch up instead
+    assert format_id_ranges(range(0, 4 * MAX_NOTIFY_PAYLOAD, 2)) == ""
+
+@pytest.mark.usefixtures("database")
+def test_rows_are_pushed_once_to_every_subscriber() -> None:
+    async def scenario() -> List[List[int]]:
+        await add_rows(*(DetectionResult(video_id="v", frame_index=i, detections=[]) for i in range(3)))
+        feed = ResultFeed(serialize)
+        feed._last_id = 3 # As start() finds it, without running the background loop
+        first, second = feed.subscribe(), feed.subscribe()
+        await add_rows(*(DetectionResult(video_id="v", frame_index=i, detections=[]) for i in range(3, 6)))
+
+        feed._on_notify(None, 0, "detection_results", "4-5") # Announced by the writer
+        feed._publish(await feed._fetch())
+        feed._catch_up = True # A periodic catch-up finds row 6 only
+        feed._publish(await feed._fetch())
+        feed.unsubscribe(second)
+        feed._catch_up = True
+        feed._publish(await feed._fetch()) # Nothing new
+
+        batches: List[List[int]] = []
+        while not first.queue.empty():
+            batches.append([row["id"] for row in first.queue.get_nowait()])
+        assert second.queue.qsize() == 2
+        return batches
+
+    assert run(scenario()) == [[4, 5], [6]]
+
+@pytest.mark.usefixtures("database")
+def test_subscriber_that_falls_behind_is_disconnected() -> None:
+    async def scenario() -> None:
+        feed = ResultFeed(serialize, max_pending=1)
+        slow = feed.subscribe()
+        for i in range(2):
+            await add_rows(DetectionResult(video_id="v", frame_index=i, detections=[]))
+            feed._catch_up = True
+            feed._publish(await feed._fetch())
+        assert slow.queue.get_nowait() is None # Told to reconnect, from its last event id
+        assert slow not in feed._subscribers
+
+        assert [row["frame_index"] for row in await feed.backfill(0, limit=1)] == [1]
+        assert [row["frame_index"] for row in await feed.backfill(0)] == [0, 1]
+
+    run(scenario())
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "processing"))
+
+from processing import FrameEncoding, encode_frame
+from shared.letterbox import PAD_COLOR, letterbox
+
+def test_wide_frame_is_scaled_and_padded_vertically() -> None:
+    frame = np.full((48, 64, 3), 200, dtype=np.uint8)
+    boxed, scale, pad_x, pad_y = letterbox(frame, 32)
+    assert boxed.shape == (32, 32, 3)
+    assert (scale, pad_x, pad_y) == (0.5, 0, 4)
+    assert tuple(boxed[0, 0]) == PAD_COLOR and tuple(boxed[31, 31]) == PAD_COLOR
+    assert (boxed[4:28] == 200).all()
+
+def test_tall_frame_is_padded_horizontally() -> None:
+    _, scale, pad_x, pad_y = letterbox(np.zeros((100, 50, 3), dtype=np.uint8), 200)
+    assert (scale, pad_x, pad_y) == (2.0, 50, 0)
+
+def test_frame_of_the_input_size_is_returned_as_is() -> None:
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    boxed, scale, pad_x, pad_y = letterbox(frame, 32)
+    assert boxed is frame and (scale, pad_x, pad_y) == (1.0, 0, 0)
+
+def test_full_resolution_frames_are_stored_as_jpeg() -> None:
+    data, box = encode_frame(np.zeros((48, 64, 3), dtype=np.uint8), FrameEncoding())
+    assert box is None
+    assert cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR).shape == (48, 64, 3)
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_letterboxed_frames_record_their_geometry(raw: bool) -> None:
+    data, box = encode_frame(np.zeros((48, 64, 3), dtype=np.uint8), FrameEncoding(letterbox_size=32, raw=raw))
+    assert (box.size, box.scale, box.pad_x, box.pad_y, box.width, box.height, box.raw) == (32, 0.5, 0, 4, 64, 48, raw)
+    if raw:
+        assert len(data) == 32 * 32 * 3 # Pixels as the model sees them, no decoding needed
+    else:
+        assert cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR).shape == (32, 32, 3)
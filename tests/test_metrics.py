@@ -0,0 +1,34 @@
+from typing import NamedTuple
+
+import pytest
+from prometheus_client import REGISTRY
+
+from shared import metrics
+from shared.mq import KafkaConsumer
+
+class Message(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+
+def test_trace_ids_are_unique() -> None:
+    ids = {metrics.new_trace_id() for _ in range(100)}
+    assert len(ids) == 100 and all(len(i) == 32 for i in ids)
+
+def test_consumer_exports_messages_in_flight() -> None:
+    consumer = KafkaConsumer("metrics-test")
+    for offset in range(3):
+        consumer._track(Message("metrics-test", 0, offset))
+    labels = {"topic": "metrics-test", "partition": "0"}
+    assert REGISTRY.get_sample_value("kafka_consumer_in_flight", labels) == 3
+
+    body, content_type = metrics.render_metrics()
+    assert content_type.startswith("text/plain")
+    assert b'kafka_consumer_in_flight{partition="0",topic="metrics-test"} 3.0' in body
+
+def test_metrics_are_no_ops_without_prometheus_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(metrics, "prometheus_client", None)
+    histogram = metrics._metric("Histogram", "unused_seconds", "Not registered", ("stage",))
+    histogram.labels("read").observe(1.0) # Accepted and ignored
+    assert metrics.render_metrics() == (b"", "text/plain; charset=utf-8")
+    metrics.serve_metrics(9) # Nothing to serve, nothing bound
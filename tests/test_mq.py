@@ -0,0 +1,249 @@
+import asyncio
+import time
+from typing import Any, Dict, List, NamedTuple, Set, Tuple
+
+import pytest
+
+from shared.mq import KafkaConsumer, KafkaProducer, PartitionWindow, TopicPartition
+from shared.schemas import SegmentTask, SamplingOptions
+from shared.serialization import decode_message
+
+class Message(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+    value: Any = None
+
+class FakeClient:
+    """Stands in for AIOKafkaConsumer: records commits, pauses and resumes."""
+    def __init__(self) -> None:
+        self.commits: List[Dict[TopicPartition, int]] = []
+        self.paused: Set[TopicPartition] = set()
+
+    async def commit(self, offsets: Dict[TopicPartition, int]) -> None:
+        self.commits.append(dict(offsets))
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self.paused.update(partitions)
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self.paused.difference_update(partitions)
+
+def fake_consumer(max_in_flight: int = 1000, revoke_timeout: float = 5.0) -> KafkaConsumer:
+    consumer = KafkaConsumer("frame-tasks", max_in_flight=max_in_flight)
+    consumer.consumer = FakeClient()
+    consumer.revoke_timeout = revoke_timeout
+    return consumer
+
+def test_unkeyed_message_serializes() -> None:
+    """Segment tasks are published with key_field=None; the key serializer must accept a None key."""
+    async def serialize() -> tuple:
+        producer = KafkaProducer(topic="video-segments", key_field=None)
+        client = producer._create_client()
+        task = SegmentTask(video_id="v", video_path="/data/v.mp4", video_hash="h", segment_index=0,
+                           segment_count=2, start_frame=0, end_frame=100, sampling=SamplingOptions())
+        data, key = producer._prepare(task)
+        return client._key_serializer(key), client._value_serializer(data)
+
+    key, value = asyncio.run(serialize())
+    assert key is None
+    assert decode_message(value)["video_id"] == "v"
+
+def test_keyed_message_serializes() -> None:
+    async def serialize() -> bytes:
+        producer = KafkaProducer(topic="frame-tasks")
+        _, key = producer._prepare({"video_id": "v"})
+        return producer._create_client()._key_serializer(key)
+
+    assert asyncio.run(serialize()) == b"v"
+
+def test_flush_reports_only_its_own_failures() -> None:
+    """Jobs sharing a producer flush their own sends; another job's failure is left for that job."""
+    async def flush() -> None:
+        producer = KafkaProducer(topic="frame-tasks")
+        producer.producer = object() # Stands in for a started client; flush(futures) does not use it
+        loop = asyncio.get_running_loop()
+        ours, theirs = loop.create_future(), loop.create_future()
+        for future in (ours, theirs):
+            producer._pending.add(future)
+            future.add_done_callback(lambda f: producer._on_delivery(f, "frame-tasks", 0.0))
+        ours.set_result(None)
+        theirs.set_exception(RuntimeError("broker down"))
+        await asyncio.sleep(0)
+
+        await producer.flush([ours])
+        with pytest.raises(RuntimeError, match="broker down"):
+            await producer.flush([theirs])
+        await producer.flush([theirs]) # Reported once only
+
+    asyncio.run(flush())
+
+def test_window_pending_with_completed_and_released_offsets() -> None:
+    """Completed offsets behind a released one are not pending, so a revocation sees the partition drain."""
+    window = PartitionWindow()
+    for offset in (5, 6, 7):
+        window.add(offset)
+    assert window.complete(6) is None
+    window.release(5)
+    assert window.pending == 1
+    assert window.complete(7) is None # Nothing is committed past the released offset
+    assert window.pending == 0
+    assert len(window) == 3
+
+def test_revoke_with_completed_and_released_messages_does_not_wait() -> None:
+    """Mixed order: complete 6, release 5 on revocation (as FairScheduler.drop does), complete 7 before."""
+    async def revoke() -> float:
+        consumer = fake_consumer(revoke_timeout=5.0)
+        tp = TopicPartition("frame-tasks", 0)
+        messages = [Message("frame-tasks", 0, offset) for offset in (5, 6, 7)]
+        for message in messages:
+            consumer._track(message)
+        await consumer.acknowledge(messages[1])
+        await consumer.acknowledge(messages[2])
+        consumer.revoke_listeners.append(lambda partitions: consumer.release([messages[0]]))
+
+        started = time.monotonic()
+        await consumer._on_revoked({tp})
+        assert consumer.consumer.commits[-1] == {tp: 5} # Released message 5 is redelivered, with 6 and 7
+        assert tp not in consumer._windows
+        return time.monotonic() - started
+
+    assert asyncio.run(revoke()) < 1.0
+
+def test_out_of_order_completion_commits_only_the_contiguous_prefix() -> None:
+    async def run() -> List[Dict[TopicPartition, int]]:
+        consumer = fake_consumer()
+        messages = [Message("frame-tasks", 0, offset) for offset in range(10, 15)]
+        for message in messages:
+            consumer._track(message)
+        await consumer.acknowledge_many([messages[2], messages[4]]) # 12, 14: behind the open 10
+        assert consumer.consumer.commits == []
+        await consumer.acknowledge(messages[0]) # 10 done: commit up to the open 11
+        await consumer.acknowledge(messages[1]) # 11 done: 12 was done already, 13 is open
+        await consumer.acknowledge(messages[3]) # 13 done: everything fetched is done
+        return consumer.consumer.commits
+
+    tp = TopicPartition("frame-tasks", 0)
+    assert asyncio.run(run()) == [{tp: 11}, {tp: 13}, {tp: 15}]
+
+def test_partitions_commit_independently() -> None:
+    async def run() -> List[Dict[TopicPartition, int]]:
+        consumer = fake_consumer()
+        a, b = Message("frame-tasks", 0, 0), Message("frame-tasks", 1, 0)
+        consumer._track(a)
+        consumer._track(b)
+        await consumer.acknowledge(b)
+        return consumer.consumer.commits
+
+    assert asyncio.run(run()) == [{TopicPartition("frame-tasks", 1): 1}]
+
+def test_partition_pauses_at_max_in_flight_and_resumes_below() -> None:
+    async def run() -> None:
+        consumer = fake_consumer(max_in_flight=3)
+        tp = TopicPartition("frame-tasks", 0)
+        messages = [Message("frame-tasks", 0, offset) for offset in range(3)]
+        for message in messages[:2]:
+            consumer._track(message)
+        assert tp not in consumer.consumer.paused
+        consumer._track(messages[2])
+        assert tp in consumer.consumer.paused
+
+        await consumer.acknowledge(messages[1]) # Out of order: the window does not shrink
+        assert tp in consumer.consumer.paused
+        await consumer.acknowledge(messages[0]) # Commit point moves past 0 and 1
+        assert tp not in consumer.consumer.paused
+
+    asyncio.run(run())
+
+def test_revoke_commits_completed_work_and_drops_the_rest() -> None:
+    async def run() -> None:
+        consumer = fake_consumer(revoke_timeout=0.05)
+        tp = TopicPartition("frame-tasks", 0)
+        messages = [Message("frame-tasks", 0, offset) for offset in range(4)]
+        for message in messages:
+            consumer._track(message)
+        await consumer.acknowledge_many([messages[0], messages[2]]) # 1 is still in flight
+        await consumer._on_revoked({tp})
+
+        assert consumer.consumer.commits[-1] == {tp: 1} # Never past the unfinished 1
+        assert tp not in consumer._windows
+        await consumer.acknowledge(messages[1]) # Finishing after the revocation commits nothing
+        assert consumer.consumer.commits[-1] == {tp: 1}
+
+    asyncio.run(run())
+
+def test_revoke_waits_for_messages_in_flight() -> None:
+    async def run() -> None:
+        consumer = fake_consumer(revoke_timeout=5.0)
+        tp = TopicPartition("frame-tasks", 0)
+        message = Message("frame-tasks", 0, 7)
+        consumer._track(message)
+
+        async def finish() -> None:
+            await asyncio.sleep(0.05)
+            await consumer.acknowledge(message)
+
+        started = time.monotonic()
+        await asyncio.gather(consumer._on_revoked({tp}), finish())
+        assert time.monotonic() - started < 1.0
+        assert consumer.consumer.commits[-1] == {tp: 8}
+
+    asyncio.run(run())
+
+class FakeProducerClient:
+    """Stands in for AIOKafkaProducer: sends stay in flight until `deliver` resolves them."""
+    def __init__(self) -> None:
+        self.sent: List[Tuple[str, Any, Any, asyncio.Future]] = []
+
+    async def send(self, topic: str, value: Any, key: Any = None) -> asyncio.Future:
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.sent.append((topic, value, key, future))
+        return future
+
+    def deliver(self, fail: Set[int] = frozenset()) -> None:
+        for i, (_, _, _, future) in enumerate(self.sent):
+            if not future.done():
+                if i in fail:
+                    future.set_exception(RuntimeError(f"send {i} failed"))
+                else:
+                    future.set_result(None)
+
+    async def flush(self) -> None:
+        self.deliver()
+
+def fake_producer() -> Tuple[KafkaProducer, FakeProducerClient]:
+    producer = KafkaProducer(topic="frame-tasks")
+    client = FakeProducerClient()
+    producer.producer = client
+    return producer, client
+
+def test_publish_many_keeps_every_send_in_flight_before_waiting() -> None:
+    async def run() -> None:
+        producer, client = fake_producer()
+        messages = [{"video_id": f"v{i % 2}", "frame_index": i} for i in range(4)]
+        publishing = asyncio.ensure_future(producer.publish_many(messages, topic="frame-tasks-bulk"))
+        await asyncio.sleep(0)
+        assert len(client.sent) == 4 and not publishing.done() # All queued, none delivered yet
+        assert [(topic, key) for topic, _, key, _ in client.sent] == [("frame-tasks-bulk", "v0"), ("frame-tasks-bulk", "v1")] * 2
+
+        client.deliver()
+        await publishing
+        assert not producer._pending
+
+    asyncio.run(run())
+
+def test_flush_waits_for_queued_sends_and_reports_failures_once() -> None:
+    async def run() -> None:
+        producer, client = fake_producer()
+        for i in range(3):
+            await producer.publish_nowait({"video_id": "v", "frame_index": i})
+        client.deliver(fail={1})
+        with pytest.raises(RuntimeError, match="1 Kafka message"):
+            await producer.flush()
+        await producer.flush() # Already reported
+
+        await producer.publish_nowait({"video_id": "v", "frame_index": 3})
+        await producer.flush() # Delivered by the client's flush
+        assert all(future.done() for *_, future in client.sent)
+
+    asyncio.run(run())
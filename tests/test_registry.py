@@ -0,0 +1,78 @@
+from typing import Any, Dict
+
+import pytest
+
+from dbutil import run
+from shared.registry import (Claim, Completion, claim_video, complete_video, fail_video, finish_segment,
+                             register_segments, resolve_video_id)
+
+pytestmark = pytest.mark.usefixtures("database")
+
+def task(video_id: str) -> Dict[str, Any]:
+    return {"video_id": video_id, "video_path": f"/data/{video_id}.mp4", "priority": "bulk"}
+
+def test_first_upload_claims_and_redelivery_keeps_the_claim() -> None:
+    assert run(claim_video("h", "cfg", "a", task("a"))) == Claim(None)
+    assert run(claim_video("h", "cfg", "a", task("a"))) == Claim(None)
+    assert run(claim_video("h", "other-cfg", "b", task("b"))) == Claim(None)
+
+def test_duplicate_of_completed_video_is_linked() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    assert run(complete_video("a", 10)) == []
+    assert run(claim_video("h", "cfg", "a", task("a"))) == Claim("a") # Redelivered after completion
+    assert run(claim_video("h", "cfg", "b", task("b"))) == Claim("a")
+    assert run(resolve_video_id("b")) == "a"
+    assert run(resolve_video_id("a")) == "a"
+
+def test_pending_duplicate_is_linked_on_completion() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    assert run(claim_video("h", "cfg", "b", task("b"))) == Claim("a", pending=True)
+    assert run(claim_video("h", "cfg", "b", task("b"))) == Claim("a", pending=True) # Redelivered
+    assert run(resolve_video_id("b")) == "a"
+
+    assert run(complete_video("a", 10)) == ["/data/b.mp4"]
+    assert run(complete_video("a", 10)) == [] # Its upload is handed back once only
+    assert run(claim_video("h", "cfg", "b", task("b"))) == Claim("a")
+
+def test_pending_duplicate_is_linked_when_the_last_segment_finishes() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    run(register_segments("a", [(0, 100), (100, None)]))
+    run(claim_video("h", "cfg", "b", task("b")))
+    assert run(finish_segment("a", 1, 4)) is None
+    assert run(finish_segment("a", 0, 5)) == Completion(9, ["/data/b.mp4"])
+
+def test_failed_video_requeues_its_oldest_pending_duplicate() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    run(claim_video("h", "cfg", "b", task("b")))
+    run(claim_video("h", "cfg", "c", task("c")))
+
+    assert run(fail_video("a")) == task("b")
+    assert run(fail_video("a")) is None # Already failed: nothing requeued twice
+
+    # The requeued duplicate takes the work over; the failed upload and the other duplicate follow it
+    assert run(claim_video("h", "cfg", "b", task("b"))) == Claim(None)
+    assert run(resolve_video_id("b")) == "b"
+    assert run(resolve_video_id("a")) == "b"
+    assert run(resolve_video_id("c")) == "b"
+    assert run(complete_video("b", 3)) == ["/data/c.mp4"]
+    assert run(claim_video("h", "cfg", "a", task("a"))) == Claim("b")
+
+def test_failed_video_is_taken_over_by_a_new_upload() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    assert run(fail_video("a")) is None
+    assert run(claim_video("h", "cfg", "b", task("b"))) == Claim(None)
+    assert run(claim_video("h", "cfg", "c", task("c"))) == Claim("b", pending=True)
+    assert run(resolve_video_id("a")) == "b"
+
+def test_failed_video_retried_by_its_own_task() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    run(fail_video("a"))
+    assert run(claim_video("h", "cfg", "a", task("a"))) == Claim(None)
+    assert run(complete_video("a", 1)) == []
+
+def test_registering_segments_again_returns_only_those_not_done() -> None:
+    run(claim_video("h", "cfg", "a", task("a")))
+    assert run(register_segments("a", [(0, 100), (100, 200), (200, None)])) == [(0, 0, 100), (1, 100, 200), (2, 200, None)]
+    run(finish_segment("a", 1, 4))
+    # A redelivered split task re-plans differently: the recorded bounds win
+    assert run(register_segments("a", [(0, 150), (150, None)])) == [(0, 0, 100), (2, 200, None)]
@@ -0,0 +1,110 @@
+import os
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+import pytest
+from sqlalchemy.future import select
+
+from dbutil import add_rows, run
+from shared.database import AsyncSessionLocal
+from shared.models import DetectionResult, FrameArchive, VideoRecord
+from shared.retention import ArchivedFrame, FrameLifecycle, archive_key, select_frames
+from shared.storage import PackedFrameStorage
+
+pytestmark = pytest.mark.usefixtures("database")
+
+async def frame_paths(video_id: str) -> List[Tuple[int, Optional[str]]]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(DetectionResult.frame_index, DetectionResult.frame_path)
+            .where(DetectionResult.video_id == video_id).order_by(DetectionResult.id)
+        )
+        return [tuple(r) for r in result.all()]
+
+def completed_video(storage: PackedFrameStorage, video_id: str, frames: int) -> List[str]:
+    references = [storage.save_frame(video_id, i, f"frame-{i}".encode()) for i in range(frames)]
+    storage.finish_frames(video_id)
+    run(add_rows(VideoRecord(video_hash=video_id, config_key="cfg", video_id=video_id, status="completed", frames=frames)))
+    return references
+
+def test_select_frames_keeps_detections_and_thumbnails() -> None:
+    rows = [
+        (1, 0, "a", []), (2, 1, "b", [{"class": "person"}]), (3, 2, "c", []),
+        (4, 2, "c", [{"class": "car"}]), # Redelivered: stored twice, detected the second time
+        (5, 3, "d", []), (6, 4, None, []), # Frame already without a file
+    ]
+    assert select_frames(rows, "all", 10) == [ArchivedFrame(i, r, True) for i, r in enumerate("abcd")]
+    assert [f.keep for f in select_frames(rows, "detections", 0)] == [False, True, True, False]
+    assert [f.keep for f in select_frames(rows, "detections", 3)] == [True, True, True, True]
+
+def test_compact_repoints_rows_and_deletes_sources(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    references = completed_video(storage, "v", 3)
+    run(add_rows(*(DetectionResult(video_id="v", frame_index=i, frame_path=r, detections=[i] if i != 1 else [])
+                   for i, r in enumerate(references))))
+
+    lifecycle = FrameLifecycle(storage, policy="detections", thumbnail_every=0, mbps=0)
+    run(lifecycle.compact("v"))
+
+    paths = run(frame_paths("v"))
+    assert [i for i, _ in paths] == [0, 1, 2]
+    assert paths[1][1] is None # Dropped: no detections
+    for _, path in (paths[0], paths[2]):
+        assert path.startswith(f"pack:{archive_key('v')}:")
+    assert bytes(storage.read_frame(paths[2][1])) == b"frame-2"
+    assert not os.path.exists(storage.pack_path("v"))
+    assert run(lifecycle._store_size()) == 14 + 2 * PackedFrameStorage.INDEX_RECORD.size
+
+def test_compact_repoints_rows_stored_while_it_runs(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    references = completed_video(storage, "v", 2)
+    run(add_rows(DetectionResult(video_id="v", frame_index=0, frame_path=references[0], detections=[])))
+    lifecycle = FrameLifecycle(storage, mbps=0)
+    io = lifecycle._io
+
+    async def redelivered_meanwhile(fn: Any, *args: Any) -> Any:
+        if fn == lifecycle._write_archive:
+            # Frame 0 stored again, and frame 1 for the first time, after compaction read the rows
+            await add_rows(DetectionResult(video_id="v", frame_index=0, frame_path=references[0], detections=[]),
+                           DetectionResult(video_id="v", frame_index=1, frame_path=references[1], detections=[]))
+        return await io(fn, *args)
+
+    lifecycle._io = redelivered_meanwhile
+    run(lifecycle.compact("v"))
+
+    paths = run(frame_paths("v"))
+    assert paths[0][1] == paths[1][1] and paths[0][1].startswith(f"pack:{archive_key('v')}:")
+    assert paths[2] == (1, None) # Not archived, and its source is gone
+    assert not os.path.exists(storage.pack_path("v"))
+
+def test_undeletable_sources_do_not_fail_compaction(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    references = completed_video(storage, "v", 1)
+    run(add_rows(DetectionResult(video_id="v", frame_index=0, frame_path=references[0], detections=[])))
+    remove = os.remove
+
+    def read_only(path: str) -> None:
+        if path == storage.pack_path("v"):
+            raise PermissionError(path)
+        remove(path)
+
+    monkeypatch.setattr(os, "remove", read_only)
+    lifecycle = FrameLifecycle(storage, mbps=0)
+    run(lifecycle.compact("v"))
+
+    async def status() -> str:
+        async with AsyncSessionLocal() as session:
+            return (await session.get(FrameArchive, "v")).status
+    assert run(status()) == "compacted"
+    assert not os.path.exists(storage.index_path("v"))
+
+def test_store_size_counts_sources_of_videos_not_compacted(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    completed_video(storage, "v", 2) # Two 7-byte frames, not compacted
+    os.makedirs(os.path.join(storage.frames_path, "w"))
+    with open(os.path.join(storage.frames_path, "w", "0.jpg"), "wb") as f:
+        f.write(b"12345")
+    run(add_rows(VideoRecord(video_hash="w", config_key="cfg", video_id="w", status="processing")))
+
+    lifecycle = FrameLifecycle(storage, mbps=0)
+    assert run(lifecycle._store_size()) == 14 + 2 * PackedFrameStorage.INDEX_RECORD.size + 5
@@ -0,0 +1,68 @@
+import os
+import sys
+from typing import Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "processing"))
+
+from media import CUT, FPS, FRAMES
+from sampling import iter_sampled_frames
+
+def sample(path: str, frame_interval: int, mode: str = "grab", start_frame: int = 0,
+           end_frame: Optional[int] = None, **kwargs: Any) -> List[Tuple[int, Any]]:
+    cap = cv2.VideoCapture(path)
+    try:
+        return list(iter_sampled_frames(cap, frame_interval, mode, start_frame=start_frame, end_frame=end_frame, **kwargs))
+    finally:
+        cap.release()
+
+def decode_all(path: str) -> List[Any]:
+    cap = cv2.VideoCapture(path)
+    frames: List[Any] = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def assert_same_frames(actual: List[Tuple[int, Any]], expected: List[Tuple[int, Any]]) -> None:
+    assert [i for i, _ in actual] == [i for i, _ in expected]
+    for (_, a), (_, b) in zip(actual, expected):
+        assert np.array_equal(a, b)
+
+@pytest.mark.parametrize("frame_interval", [1, 7, 10, 150])
+def test_grab_samples_the_frames_full_decoding_would(video: str, frame_interval: int) -> None:
+    every_frame = decode_all(video)
+    assert len(every_frame) == FRAMES
+    expected = [(i, frame) for i, frame in enumerate(every_frame) if i % frame_interval == 0]
+    assert_same_frames(sample(video, frame_interval), expected)
+
+@pytest.mark.parametrize("frame_interval", [7, 10])
+def test_seek_samples_the_frames_grab_does(video: str, frame_interval: int) -> None:
+    assert_same_frames(sample(video, frame_interval, "seek"), sample(video, frame_interval, "grab"))
+
+def test_seek_snaps_targets_to_keyframes(video: str) -> None:
+    indices = [i for i, _ in sample(video, 7, "seek", keyframe_interval=5)]
+    # Targets 0, 7, 14, ... rounded to multiples of 5, each visited once
+    assert indices == sorted(set(min(round(t / 5) * 5, FRAMES - 1) for t in range(0, FRAMES, 7)))
+
+def test_unknown_mode_is_rejected(video: str) -> None:
+    with pytest.raises(ValueError, match="Unknown sampling mode"):
+        sample(video, 10, "every")
+
+def test_adaptive_samples_cuts_and_bounds_static_stretches(video: str) -> None:
+    indices = [i for i, _ in sample(video, 5, "adaptive", max_interval=30)]
+    # The first probe, then one frame per max_interval, except that the cut is sampled as soon as it is probed
+    assert indices == [0, 30, CUT, CUT + 30]
+
+def test_adaptive_samples_every_probe_when_everything_changes(video: str) -> None:
+    assert [i for i, _ in sample(video, 5, "adaptive", max_interval=30, scene_threshold=0.0)] == list(range(0, FRAMES, 5))
+
+def test_adaptive_segment_starts_with_a_sample(video: str) -> None:
+    indices = [i for i, _ in sample(video, 5, "adaptive", max_interval=30, start_frame=10, end_frame=CUT)]
+    assert indices == [10, 40] # Independent of frames before the segment
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+from scheduler import FairScheduler
+from shared.mq import TopicPartition
+
+TOPICS: Dict[str, str] = {"interactive": "frame-tasks-interactive", "normal": "frame-tasks", "bulk": "frame-tasks-bulk"}
+
+class Message(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+
+class FakeConsumer:
+    """Serves queued messages per topic like KafkaConsumer.get_batch, and records releases."""
+    def __init__(self) -> None:
+        self.revoke_listeners: List[Any] = []
+        self.queued: Dict[str, List[Tuple[Message, Dict[str, Any]]]] = {topic: [] for topic in TOPICS.values()}
+        self.released: List[Message] = []
+        self.requests: List[Tuple[int, Optional[Tuple[str, ...]]]] = []
+
+    def queue(self, priority: str, video_id: str, count: int, partition: int = 0) -> None:
+        topic: str = TOPICS[priority]
+        for _ in range(count):
+            offset: int = len(self.queued[topic])
+            self.queued[topic].append((Message(topic, partition, offset), {"video_id": video_id, "frame_index": offset}))
+
+    async def get_batch(self, max_records: int, timeout_ms: int,
+                        topics: Optional[Iterable[str]] = None) -> List[Tuple[Message, Dict[str, Any]]]:
+        self.requests.append((max_records, tuple(topics) if topics is not None else None))
+        batch: List[Tuple[Message, Dict[str, Any]]] = []
+        for topic in topics or TOPICS.values():
+            taken = self.queued[topic][:max_records - len(batch)]
+            del self.queued[topic][:len(taken)]
+            batch += taken
+        return batch
+
+    def release(self, messages: List[Message]) -> None:
+        self.released += messages
+
+def scheduler(consumer: FakeConsumer, max_buffered: int = 256,
+              weights: Optional[Dict[str, float]] = None) -> FairScheduler:
+    return FairScheduler(consumer, TOPICS, weights or {"interactive": 16, "normal": 4, "bulk": 1}, max_buffered)
+
+def test_classes_share_frames_by_weight() -> None:
+    consumer = FakeConsumer()
+    for priority in TOPICS:
+        consumer.queue(priority, priority, 200)
+    fair = scheduler(consumer)
+    asyncio.run(fair.fill(0, 0))
+
+    counts = Counter(message.topic for message, _ in fair.take(105))
+    assert counts == {TOPICS["interactive"]: 80, TOPICS["normal"]: 20, TOPICS["bulk"]: 5}
+
+def test_idle_class_takes_everything_and_earns_no_credit() -> None:
+    consumer = FakeConsumer()
+    consumer.queue("bulk", "b", 10)
+    fair = scheduler(consumer)
+    asyncio.run(fair.fill(0, 0))
+    assert len(fair.take(8)) == 8 # Bulk alone gets the whole batch
+
+    # Interactive work arriving now gets its 16:1 share from here on (plus the tie at the bulk
+    # class's next turn), not a burst of credit for the time it was idle
+    consumer.queue("interactive", "i", 40)
+    consumer.queue("bulk", "b", 40)
+    asyncio.run(fair.fill(0, 0))
+    counts = Counter(message.topic for message, _ in fair.take(18))
+    assert counts == {TOPICS["interactive"]: 17, TOPICS["bulk"]: 1}
+
+def test_videos_of_a_class_take_turns_and_keep_their_order() -> None:
+    consumer = FakeConsumer()
+    consumer.queue("normal", "a", 3)
+    consumer.queue("normal", "b", 1)
+    consumer.queue("normal", "c", 2)
+    fair = scheduler(consumer)
+    asyncio.run(fair.fill(0, 0))
+
+    batch = fair.take(10)
+    assert [data["video_id"] for _, data in batch] == ["a", "b", "c", "a", "c", "a"]
+    assert [data["frame_index"] for _, data in batch if data["video_id"] == "a"] == [0, 1, 2]
+    assert len(fair) == 0
+
+def test_fill_tops_each_class_up_to_the_buffer() -> None:
+    consumer = FakeConsumer()
+    for priority in TOPICS:
+        consumer.queue(priority, priority, 50)
+    fair = scheduler(consumer, max_buffered=8)
+    asyncio.run(fair.fill(4, 100))
+
+    assert fair._buffered == {"interactive": 8, "normal": 8, "bulk": 8}
+    # The first fetch waits for the wanted frames from any topic; top-ups ask each topic for its room only
+    assert consumer.requests[0] == (4, None)
+    assert all(max_records <= 8 and topics is not None for max_records, topics in consumer.requests[1:])
+
+    fair.take(5)
+    asyncio.run(fair.fill(0, 0))
+    assert fair._buffered == {"interactive": 8, "normal": 8, "bulk": 8}
+    assert sum(len(queued) for queued in consumer.queued.values()) == 3 * 50 - 8 * 3 - 5
+
+def test_drop_releases_buffered_frames_of_revoked_partitions() -> None:
+    consumer = FakeConsumer()
+    consumer.queue("normal", "a", 2, partition=0)
+    consumer.queue("normal", "b", 2, partition=1)
+    fair = scheduler(consumer)
+    asyncio.run(fair.fill(0, 0))
+    assert consumer.revoke_listeners == [fair.drop]
+
+    fair.drop({TopicPartition(TOPICS["normal"], 1)})
+    assert sorted(m.offset for m in consumer.released) == [2, 3]
+    assert all(m.partition == 1 for m in consumer.released)
+    assert len(fair) == 2
+    assert [data["video_id"] for _, data in fair.take(10)] == ["a", "a"]
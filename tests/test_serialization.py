@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from shared.schemas import FrameTask, Letterbox
+from shared.serialization import (HEADER, SCHEMA_VERSION, WIRE_MAGIC, decode_message, encode_message, get_serializer,
+                                  parse_message)
+
+TASK = FrameTask(video_id="v", frame_path="pack:v:3:0:10", frame_index=3, frame_hash="ab" * 32, video_hash="cd" * 32,
+                 letterbox=Letterbox(size=640, scale=0.5, pad_x=0, pad_y=140, width=1280, height=720),
+                 uploaded_at=1700000000.5).model_dump()
+
+@pytest.mark.parametrize("name", ["json", "json-framed", "msgpack"])
+def test_every_wire_format_round_trips(name: str) -> None:
+    assert decode_message(encode_message(TASK, get_serializer(name))) == TASK
+
+def test_plain_json_stays_headerless() -> None:
+    raw = encode_message(TASK, get_serializer("json"))
+    assert json.loads(raw) == TASK
+    assert encode_message(TASK, get_serializer("json-framed"))[:HEADER.size] == HEADER.pack(WIRE_MAGIC, SCHEMA_VERSION, 1)
+
+def test_msgpack_sends_digests_as_bytes() -> None:
+    packed = encode_message(TASK, get_serializer("msgpack"))
+    assert bytes.fromhex(TASK["frame_hash"]) in packed
+    assert len(packed) < len(encode_message(TASK, get_serializer("json"))) - 64
+
+def test_non_hex_digest_is_sent_as_is() -> None:
+    message = dict(TASK, frame_hash="not-hex")
+    assert decode_message(encode_message(message, get_serializer("msgpack")))["frame_hash"] == "not-hex"
+
+def test_newer_schema_and_unknown_codec_are_rejected() -> None:
+    payload = encode_message(TASK, get_serializer("json-framed"))[HEADER.size:]
+    with pytest.raises(ValueError, match="schema version"):
+        decode_message(HEADER.pack(WIRE_MAGIC, SCHEMA_VERSION + 1, 1) + payload)
+    with pytest.raises(ValueError, match="codec"):
+        decode_message(HEADER.pack(WIRE_MAGIC, SCHEMA_VERSION, 99) + payload)
+    with pytest.raises(ValueError, match="wire format"):
+        get_serializer("xml")
+
+def test_trusted_messages_skip_validation_but_need_required_fields() -> None:
+    task = parse_message(FrameTask, TASK, trusted=True)
+    assert isinstance(task.letterbox, Letterbox) and task.letterbox.pad_y == 140
+    assert parse_message(FrameTask, TASK, trusted=False) == task
+
+    incomplete = {k: v for k, v in TASK.items() if k != "frame_hash"}
+    with pytest.raises(ValueError, match="frame_hash"):
+        parse_message(FrameTask, incomplete, trusted=True)
+    with pytest.raises(ValueError):
+        parse_message(FrameTask, incomplete, trusted=False)
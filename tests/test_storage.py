@@ -0,0 +1,82 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+
+from shared.storage import HASH_ALGORITHMS, FileSystemStorage, PackedFrameStorage
+
+def test_packed_frames_round_trip(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    first = storage.save_frame("v", 0, b"frame-0")
+    second = storage.save_frame("v", 5, b"frame-five")
+    storage.finish_frames("v")
+
+    assert first == "pack:v:0:0:7"
+    assert bytes(storage.read_frame(first)) == b"frame-0"
+    assert bytes(storage.read_frame(second)) == b"frame-five"
+    assert storage.lookup("v", 5) == second
+    assert storage.lookup("v", 1) is None
+    assert storage.lookup("missing", 0) is None
+
+def test_pack_is_remapped_as_it_grows(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    first = storage.save_frame("v", 0, b"a" * 10)
+    assert bytes(storage.read_frame(first)) == b"a" * 10
+    later = storage.save_frame("v", 1, b"b" * 10) # Past the end of the existing map
+    assert bytes(storage.read_frame(later)) == b"b" * 10
+    assert storage.lookup("v", 1) == later
+
+def test_deleted_pack_is_not_served_from_the_cache(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    reference = storage.save_frame("v", 0, b"frame")
+    storage.finish_frames("v")
+    storage.read_frame(reference)
+    storage.lookup("v", 0)
+
+    os.remove(storage.pack_path("v"))
+    os.remove(storage.index_path("v"))
+    with pytest.raises(FileNotFoundError):
+        storage.read_frame(reference)
+    assert storage.lookup("v", 0) is None
+    assert not storage._maps and not storage._indexes
+
+def test_replaced_pack_is_remapped(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    reference = storage.save_frame("v", 0, b"old")
+    storage.finish_frames("v")
+    assert bytes(storage.read_frame(reference)) == b"old"
+
+    # Written aside and renamed over the pack, as a rewrite would be
+    replacement = storage.pack_path("v") + ".new"
+    with open(replacement, "wb") as f:
+        f.write(b"new")
+    os.replace(replacement, storage.pack_path("v"))
+    assert bytes(storage.read_frame(reference)) == b"new"
+
+def test_caches_are_bounded(tmp_path: Path) -> None:
+    storage = PackedFrameStorage(str(tmp_path))
+    storage.MAX_OPEN_MAPS = storage.MAX_CACHED_INDEXES = 2
+    references = []
+    for video in ("a", "b", "c"):
+        references.append(storage.save_frame(video, 0, video.encode()))
+        storage.finish_frames(video)
+    for video, reference in zip(("a", "b", "c"), references):
+        assert bytes(storage.read_frame(reference)) == video.encode()
+        assert storage.lookup(video, 0) == reference
+
+    assert list(storage._maps) == [storage.pack_path("b"), storage.pack_path("c")]
+    assert list(storage._indexes) == [storage.index_path("b"), storage.index_path("c")]
+
+def test_file_paths_stay_readable(tmp_path: Path) -> None:
+    path = FileSystemStorage(str(tmp_path)).save_frame("v", 3, b"plain")
+    assert bytes(PackedFrameStorage(str(tmp_path)).read_frame(path)) == b"plain"
+
+def test_frame_digests_match_their_algorithm() -> None:
+    data = memoryview(b"frame bytes") # Frames are hashed straight from the mapped pack
+    assert FileSystemStorage.compute_hash(data) == hashlib.sha256(b"frame bytes").hexdigest()
+    assert FileSystemStorage.compute_hash(data, "blake2b") == hashlib.blake2b(b"frame bytes", digest_size=32).hexdigest()
+    for algorithm in HASH_ALGORITHMS:
+        assert FileSystemStorage.compute_hash(data, algorithm) != FileSystemStorage.compute_hash(b"frame bytez", algorithm)
+    with pytest.raises(ValueError, match="Unsupported hash algorithm"):
+        FileSystemStorage.compute_hash(data, "md5")
@@ -0,0 +1,75 @@
+import os
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+
+from thumbnails import CLASS_COLORS, ThumbnailCache, class_color, decode_frame, pick_width, render_etag, render_frame
+
+# A 64x48 frame letterboxed to 32x32 at extraction
+LETTERBOX = {"size": 32, "scale": 0.5, "pad_x": 0, "pad_y": 4, "width": 64, "height": 48}
+
+def jpeg(img) -> bytes:
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+def decode(data: bytes):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def test_width_is_rounded_up_to_an_allowed_one() -> None:
+    widths = (160, 320, 640)
+    assert [pick_width(w, widths) for w in (None, 1, 160, 200, 5000)] == [160, 160, 160, 320, 640]
+
+def test_class_colors_match_the_dashboard() -> None:
+    # getColor("person") in templates/index.html: hash -991716523, index 3
+    assert class_color("person") == CLASS_COLORS[3] == (0xa0, 0xd6, 0x06)
+    assert class_color(None) == CLASS_COLORS[0]
+
+def test_etag_changes_with_anything_the_image_depends_on() -> None:
+    detections = [{"class": "car", "conf": 0.9, "bbox": [0, 0, 1, 1]}]
+    tag = render_etag("pack:v:0:0:10", None, 320, 80, detections)
+    assert tag == render_etag("pack:v:0:0:10", None, 320, 80, [dict(d) for d in detections])
+    assert len({tag, render_etag("pack:v:0:10:10", None, 320, 80, detections), render_etag("pack:v:0:0:10", None, 160, 80, detections),
+                render_etag("pack:v:0:0:10", None, 320, 80, None), render_etag("pack:v:0:0:10", LETTERBOX, 320, 80, detections)}) == 5
+
+def test_letterbox_padding_is_cropped_off() -> None:
+    boxed = np.full((32, 32, 3), 114, dtype=np.uint8)
+    boxed[4:28] = 200
+    assert decode_frame(boxed.tobytes(), {**LETTERBOX, "raw": True}).shape == (24, 32, 3)
+    assert decode_frame(bytes(10), {**LETTERBOX, "raw": True}) is None
+    cropped = decode_frame(jpeg(boxed), LETTERBOX)
+    assert cropped.shape == (24, 32, 3) and abs(int(cropped.mean()) - 200) <= 2
+
+def test_frames_are_downscaled_never_upscaled() -> None:
+    frame = jpeg(np.full((48, 64, 3), 50, dtype=np.uint8))
+    assert decode(render_frame(frame, None, 32, 80)).shape == (24, 32, 3)
+    assert decode(render_frame(frame, None, 640, 80)).shape == (48, 64, 3)
+    assert render_frame(b"not an image", None, 32, 80) is None
+
+def test_boxes_are_drawn_in_the_class_color() -> None:
+    frame = jpeg(np.zeros((400, 400, 3), dtype=np.uint8))
+    detections = [{"class": "person", "conf": 0.9, "bbox": [0.5, 0.5, 0.9, 0.9]}]
+    img = decode(render_frame(frame, None, 400, 100, detections))
+    assert np.abs(img[300, 200].astype(int) - class_color("person")).max() <= 50 # On the left edge
+    assert img[300, 300].max() <= 20 # Inside the box
+    assert img[20, 20].max() <= 20 # Away from it
+
+def test_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = ThumbnailCache(str(tmp_path), max_bytes=25)
+    for key in ("aa1", "bb2"):
+        cache.put(key, b"x" * 10)
+    assert cache.get("aa1") == b"x" * 10 # Now the most recent
+    cache.put("cc3", b"y" * 10)
+    assert cache.get("bb2") is None and not (tmp_path / "bb" / "bb2.jpg").exists()
+    assert cache.get("aa1") and cache.get("cc3")
+
+def test_cache_is_rebuilt_after_a_restart(tmp_path: Path) -> None:
+    cache = ThumbnailCache(str(tmp_path), max_bytes=100)
+    cache.put("aa1", b"x" * 10)
+    os.utime(tmp_path / "aa" / "aa1.jpg", (1, 1)) # Least recently used
+    cache.put("bb2", b"x" * 10)
+
+    restarted = ThumbnailCache(str(tmp_path), max_bytes=15)
+    assert restarted.get("aa1") is None and restarted.get("bb2") == b"x" * 10
@@ -0,0 +1,94 @@
+import os
+import sys
+from typing import Any, Dict, List, Union
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+from backends import BackendResult, InferenceBackend
+from detector import ObjectDetector
+from shared.schemas import FrameTask
+from shared.storage import FileSystemStorage
+from tracker import FrameTracker, track_boxes, tracking_image
+
+def scene(dx: int = 0, dy: int = 0) -> Any:
+    """Smooth random texture, shifted by (dx, dy) pixels."""
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur(rng.integers(0, 255, (160, 200), dtype=np.uint8), (0, 0), 2)
+    shifted = np.roll(texture, (dy, dx), axis=(0, 1))
+    return cv2.cvtColor(cv2.normalize(shifted, None, 0, 255, cv2.NORM_MINMAX), cv2.COLOR_GRAY2BGR)
+
+def test_every_nth_frame_of_a_segment_is_a_keyframe() -> None:
+    tracker = FrameTracker(detect_every=3)
+    assert [tracker.due("v", 0, i) for i in range(5)] == [True, False, False, True, False]
+    assert tracker.due("v", 1, 100) # Segments are tracked separately
+    assert tracker.due("v", 0, 2) # Out of order (a redelivery): starts over
+
+def test_tracking_is_disabled_when_every_frame_is_detected() -> None:
+    assert not FrameTracker(detect_every=1).enabled
+    assert ObjectDetector(backend=object(), tracker=FrameTracker(detect_every=1)).tracker is None
+
+def test_boxes_follow_the_motion() -> None:
+    prev, _ = tracking_image(scene())
+    curr, _ = tracking_image(scene(dx=4, dy=-3))
+    boxes, quality = track_boxes(prev, curr, np.array([[50, 40, 110, 100]], dtype=np.float32))
+    assert boxes[0] == pytest.approx([54, 37, 114, 97], abs=0.5)
+    assert quality[0] > 0.5
+
+def test_advance_needs_a_detected_frame() -> None:
+    tracker = FrameTracker(detect_every=2)
+    assert tracker.advance("v", 0, scene()) is None
+    tracker.reset("v", 0, scene(), [[50, 40, 110, 100]], [("car", 0.9)], "v:0")
+    boxes, labels, confidence, keyframe = tracker.advance("v", 0, scene(dx=2))
+    assert boxes[0] == pytest.approx([52, 40, 112, 100], abs=0.5)
+    assert (labels, keyframe) == ([("car", 0.9)], "v:0")
+    assert confidence > 0.5
+
+def test_boxes_leaving_the_frame_are_dropped() -> None:
+    tracker = FrameTracker(detect_every=2)
+    tracker.reset("v", 0, scene(), [[50, 40, 110, 100], [175, 40, 200, 100]], ["kept", "gone"], "v:0")
+    boxes, labels, _, _ = tracker.advance("v", 0, scene(dx=15))
+    assert labels == ["kept"] and len(boxes) == 1
+
+class MemoryStorage:
+    def __init__(self, frames: Dict[str, bytes]) -> None:
+        self.frames: Dict[str, bytes] = frames
+
+    def read_frame(self, frame_reference: str) -> Union[bytes, memoryview]:
+        return self.frames[frame_reference]
+
+class FixedBoxBackend(InferenceBackend):
+    """Finds one "car" at the same place in every image; records the batches it ran."""
+    def __init__(self) -> None:
+        super().__init__()
+        self.names = {0: "car"}
+        self.batches: List[int] = []
+
+    def predict(self, images: List[Any]) -> List[BackendResult]:
+        self.batches.append(len(images))
+        return [BackendResult(np.array([[50, 40, 110, 100]], dtype=np.float32), np.array([0.9], dtype=np.float32),
+                              np.array([0])) for _ in images]
+
+def detect(images: List[Any], tracker: FrameTracker) -> Any:
+    frames = {f"f{i}": cv2.imencode(".png", img)[1].tobytes() for i, img in enumerate(images)}
+    tasks = [FrameTask(video_id="v", frame_path=path, frame_index=i, frame_hash=FileSystemStorage.compute_hash(data),
+                       video_hash="h") for i, (path, data) in enumerate(frames.items())]
+    backend = FixedBoxBackend()
+    return ObjectDetector(storage=MemoryStorage(frames), backend=backend, tracker=tracker).process_batch(tasks), backend
+
+def test_frames_between_keyframes_are_tracked_not_detected() -> None:
+    results, backend = detect([scene(), scene(dx=4), scene(dx=8)], FrameTracker(detect_every=3))
+    assert backend.batches == [1]
+    assert [r.tracked_from for r in results] == [None, "v:0", "v:0"]
+    # Normalized boxes moved right by 4 and 8 pixels of a 200 pixel wide frame
+    assert [r.detections[0].bbox[0] for r in results] == pytest.approx([0.25, 0.27, 0.29], abs=0.005)
+    assert all(r.detections[0].class_name == "car" for r in results)
+
+def test_frame_is_detected_when_the_tracker_loses_confidence() -> None:
+    noise = np.random.default_rng(1).integers(0, 255, (160, 200, 3), dtype=np.uint8)
+    results, backend = detect([scene(), noise], FrameTracker(detect_every=3, min_confidence=0.5))
+    assert backend.batches == [1, 1] # The keyframe, then the lost frame on its own
+    assert results[1].tracked_from is None and results[1].detections
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import io
+import os
+import sys
+from pathlib import Path
+from typing import AsyncIterator, List
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+
+import shared.storage
+from shared.storage import FileSystemStorage
+from uploads import ResumableUploads, UploadOffsetError
+
+DATA: bytes = bytes(range(256)) * 40
+
+class FakeUpload:
+    """Stands in for FastAPI's UploadFile."""
+    def __init__(self, data: bytes) -> None:
+        self.file = io.BytesIO(data)
+        self.filename: str = "clip.mp4"
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+async def body(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(shared.storage, "UPLOAD_CHUNK_SIZE", 1000)
+
+def test_upload_is_hashed_while_written(tmp_path: Path) -> None:
+    saved = asyncio.run(FileSystemStorage(str(tmp_path)).save_video(FakeUpload(DATA), "v"))
+    assert saved.sha256 == hashlib.sha256(DATA).hexdigest()
+    assert saved.size == len(DATA)
+    assert Path(saved.path).read_bytes() == DATA
+
+def test_small_chunks_are_written_in_blocks(tmp_path: Path) -> None:
+    writes: List[int] = []
+
+    class Recording(io.BytesIO):
+        def write(self, block: bytes) -> int:
+            writes.append(len(block))
+            return super().write(block)
+
+    out = Recording()
+    hasher = hashlib.sha256()
+    written = asyncio.run(FileSystemStorage.write_chunks(out, body(*(DATA[i:i + 300] for i in range(0, len(DATA), 300))), hasher))
+    assert written == len(DATA) and out.getvalue() == DATA
+    assert hasher.hexdigest() == hashlib.sha256(DATA).hexdigest()
+    assert all(size >= 1000 for size in writes[:-1]) and len(writes) < len(DATA) // 300
+
+def test_resumable_upload_in_chunks(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        uploads = ResumableUploads(FileSystemStorage(str(tmp_path)))
+        session = uploads.create()
+        assert await uploads.append(session, 0, body(DATA[:4000])) == 4000
+        with pytest.raises(UploadOffsetError) as rejected:
+            await uploads.append(session, 3000, body(DATA[3000:])) # A retried chunk
+        assert rejected.value.expected == 4000
+        assert await uploads.append(session, 4000, body(DATA[4000:])) == len(DATA)
+
+        saved = await uploads.complete(session)
+        assert saved.sha256 == hashlib.sha256(DATA).hexdigest() and saved.size == len(DATA)
+        assert Path(saved.path).read_bytes() == DATA
+        with pytest.raises(LookupError):
+            await uploads.append(session, len(DATA), body(b"late"))
+
+    asyncio.run(scenario())
+
+def test_upload_resumes_after_a_restart(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        storage = FileSystemStorage(str(tmp_path))
+        before = ResumableUploads(storage) # Its sessions are lost with the process
+        session = before.create()
+        await before.append(session, 0, body(DATA[:5000]))
+
+        restarted = ResumableUploads(storage)
+        assert await restarted.get("not-a-uuid") is None
+        resumed = await restarted.get(session.upload_id)
+        assert resumed.offset == 5000
+        await restarted.append(resumed, 5000, body(DATA[5000:]))
+        assert (await restarted.complete(resumed)).sha256 == hashlib.sha256(DATA).hexdigest()
+
+    asyncio.run(scenario())
+
+def test_aborted_and_abandoned_uploads_are_removed(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        uploads = ResumableUploads(FileSystemStorage(str(tmp_path)), ttl_sec=60)
+        session = uploads.create()
+        await uploads.abort(session)
+        assert not os.path.exists(session.path)
+        assert await uploads.get(session.upload_id) is None
+
+        abandoned = ResumableUploads(uploads.storage).create() # Its process went away
+        os.utime(abandoned.path, (0, 0))
+        uploads.create()
+        assert not os.path.exists(abandoned.path)
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "detection"))
+
+import writer
+from dbutil import run
+from shared.database import AsyncSessionLocal
+from shared.models import ClassRollup, DetectedObject, DetectionResult
+from writer import ResultWriter
+
+pytestmark = pytest.mark.usefixtures("database")
+
+class FakeConsumer:
+    def __init__(self) -> None:
+        self.acknowledged: List[List[Any]] = []
+
+    async def acknowledge_many(self, messages: List[Any]) -> None:
+        self.acknowledged.append(list(messages))
+
+def row(frame_index: int, detections: int = 1) -> Dict[str, Any]:
+    return {"video_id": "v", "frame_path": f"f{frame_index}", "frame_index": frame_index,
+            "detections": [{"class": "person", "conf": 0.5, "bbox": [0, 0, 1, 1]}] * detections}
+
+async def count(model: Any) -> int:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar()
+
+def test_rows_are_flushed_together_then_acknowledged() -> None:
+    async def scenario() -> None:
+        consumer = FakeConsumer()
+        results = ResultWriter(consumer, max_rows=3, max_interval_ms=60_000)
+        await results.add("m0", row(0))
+        await results.add("m1") # Dropped task: acknowledged with the next flush, no row
+        await results.add("m2", row(2, detections=2))
+        assert consumer.acknowledged == [] and await count(DetectionResult) == 0
+
+        await results.add("m3", row(3, detections=0))
+        assert consumer.acknowledged == [["m0", "m1", "m2", "m3"]]
+        assert len(results) == 0
+        assert await count(DetectionResult) == 3
+        assert await count(DetectedObject) == 3
+        async with AsyncSessionLocal() as session:
+            rollup = (await session.execute(select(ClassRollup))).scalar_one()
+        assert (rollup.objects, rollup.frames) == (3, 2)
+
+    run(scenario())
+
+def test_flush_is_due_after_the_interval() -> None:
+    async def scenario() -> None:
+        consumer = FakeConsumer()
+        results = ResultWriter(consumer, max_rows=100, max_interval_ms=20)
+        await results.add("m0", row(0))
+        await results.flush_if_due()
+        assert consumer.acknowledged == []
+        await asyncio.sleep(0.03)
+        await results.flush_if_due()
+        assert consumer.acknowledged == [["m0"]]
+
+    run(scenario())
+
+def test_failed_flush_keeps_the_buffer_unacknowledged(monkeypatch: pytest.MonkeyPatch) -> None:
+    class Unavailable:
+        async def __aenter__(self) -> None:
+            raise ConnectionError("database down")
+
+        async def __aexit__(self, *args: Any) -> None:
+            pass
+
+    async def scenario() -> None:
+        consumer = FakeConsumer()
+        results = ResultWriter(consumer, max_rows=100, max_interval_ms=60_000)
+        await results.add("m0", row(0))
+        with monkeypatch.context() as patch:
+            patch.setattr(writer, "AsyncSessionLocal", Unavailable)
+            await results.flush()
+        assert consumer.acknowledged == [] and len(results) == 1
+
+        await results.add("m1", row(1))
+        await results.flush()
+        assert consumer.acknowledged == [["m0", "m1"]]
+        assert await count(DetectionResult) == 2
+
+    run(scenario())